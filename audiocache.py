@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+import loudness
+
+# ==================== AUDIO CACHE ====================
+# Local Opus copies of the tracks a deployment plays most. A track is fetched
+# once in the background after `threshold` plays from its remote stream; later
+# plays read the file, with no stream URL to resolve and no remote connection to
+# stall. YouTube's usual audio is already Opus, so that is a remux (-c:a copy);
+# anything else is encoded with libopus. Files are written under a temporary
+# name and renamed into place, so a half-written file is never played. The cache
+# is bounded by total bytes and evicts the least recently played file first.
+# With on_loudness set, the same ffmpeg also measures the track's loudness.
+
+TRANSCODE_BEFORE_OPTIONS = ('-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5')
+PLAY_COUNT_LIMIT = 50000
+
+def cache_key(webpage_url):
+    return hashlib.sha1(webpage_url.encode()).hexdigest()[:24]
+
+class AudioCache:
+    def __init__(self, directory, max_bytes, threshold, max_duration, workers=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.max_duration = max_duration
+        self.files = OrderedDict()  # key -> size in bytes, least recently played first
+        self.bytes = 0
+        self.plays = OrderedDict()  # key -> remote plays so far, for tracks not cached yet
+        self.pending = {}           # key -> transcode task
+        self.on_loudness = None     # async callback(webpage_url, measurement)
+        self.semaphore = asyncio.Semaphore(workers)
+        self.hits = 0
+        self.misses = 0
+        self.transcodes = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.opus")
+
+    async def load(self):
+        # Index what earlier runs left behind, oldest first by last play
+        found = await asyncio.get_running_loop().run_in_executor(None, self._scan)
+        for key, size in found:
+            self.files[key] = size
+            self.bytes += size
+        self._evict()
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.part'):
+                os.unlink(entry.path)
+            elif entry.name.endswith('.opus'):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-len('.opus')], stat.st_size))
+        return [(key, size) for _, key, size in sorted(found)]
+
+    def contains(self, song):
+        return cache_key(song['webpage_url']) in self.files
+
+    def path(self, song):
+        # Local file for this track, or None; call right before spawning ffmpeg
+        key = cache_key(song['webpage_url'])
+        if key not in self.files:
+            return None
+        self.files.move_to_end(key)
+        return self._path(key)
+
+    def played(self, song, local, opus=False):
+        # Called once per track start; schedules a copy when a remote track gets popular.
+        # `opus` says the remote stream is already Opus and only needs remuxing.
+        if local:
+            self.hits += 1
+            try:
+                # mtime doubles as the recency order after a restart
+                os.utime(self._path(cache_key(song['webpage_url'])))
+            except OSError:
+                pass
+            return
+        self.misses += 1
+        duration = song.get('duration')
+        if not duration or duration > self.max_duration or not song.get('url'):
+            return
+        key = cache_key(song['webpage_url'])
+        if key in self.pending:
+            return
+        plays = self.plays.pop(key, 0) + 1
+        if plays < self.threshold:
+            self.plays[key] = plays
+            while len(self.plays) > PLAY_COUNT_LIMIT:
+                self.plays.popitem(last=False)
+            return
+        task = self.pending[key] = asyncio.ensure_future(self._transcode(key, song['webpage_url'], song['url'], duration, opus))
+        task.add_done_callback(lambda _: self.pending.pop(key, None))
+
+    async def _transcode(self, key, webpage_url, url, duration, opus):
+        async with self.semaphore:
+            final = self._path(key)
+            partial = f"{final}.part"
+            codec = ('-c:a', 'copy') if opus else ('-c:a', 'libopus', '-b:a', '128k')
+            # The loudness summary is logged at info level
+            logging = ('-hide_banner', '-nostats') if self.on_loudness else ('-loglevel', 'error')
+            analysis = loudness.ANALYSIS_OUTPUT if self.on_loudness else ()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', *logging, '-y', *TRANSCODE_BEFORE_OPTIONS, '-i', url,
+                    '-vn', '-map', '0:a:0', *codec, '-f', 'ogg', partial, *analysis,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+            except OSError as e:
+                self.failures += 1
+                print(f"Audio cache transcode failed: {e}")
+                return
+            try:
+                # Generous, but a stalled download must not hold a worker forever
+                _, error = await asyncio.wait_for(process.communicate(), timeout=duration * 2 + 60)
+            except BaseException:
+                process.kill()
+                await process.wait()
+                self._discard(partial)
+                raise
+            size = os.path.getsize(partial) if process.returncode == 0 and os.path.exists(partial) else 0
+            if not size:
+                self.failures += 1
+                print(f"Audio cache transcode failed: {error.decode(errors='replace').strip()[-200:]}")
+                self._discard(partial)
+                return
+            os.replace(partial, final)
+            self.transcodes += 1
+            if key in self.files:
+                self.bytes -= self.files.pop(key)
+            self.files[key] = size
+            self.bytes += size
+            self._evict()
+            measurement = loudness.parse_summary(error.decode(errors='replace')) if analysis else None
+            if measurement:
+                await self.on_loudness(webpage_url, measurement)
+
+    def _discard(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        # A file still being played stays readable until its ffmpeg closes it
+        while self.bytes > self.max_bytes and self.files:
+            key, size = self.files.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            self._discard(self._path(key))
+
+    def close(self):
+        for task in self.pending.values():
+            task.cancel()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'files': len(self.files),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+            'transcodes': self.transcodes,
+            'pending': len(self.pending),
+            'failures': self.failures,
+            'evictions': self.evictions,
+        }
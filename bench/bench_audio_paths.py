@@ -0,0 +1,76 @@
+# CPU per concurrent stream: PCM path (ffmpeg decode -> PCMVolumeTransformer ->
+# libopus encode in the bot) vs Opus passthrough (ffmpeg copies Opus packets), and
+# for reference an ffmpeg libopus re-encode, which is what passthrough would cost
+# at any volume other than 100%.
+# Streams are read as fast as possible from a local Opus/WebM file, so the
+# numbers are CPU seconds per minute of audio, split into bot and ffmpeg time.
+# OPUS_LIBRARY names libopus when discord.py cannot find it on its own.
+#
+#   python bench/bench_audio_paths.py [streams] [seconds]
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Thread
+
+import discord
+
+def make_sample(path, seconds):
+    subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+         '-ac', '2', '-ar', '48000', '-c:a', 'libopus', '-b:a', '128k', path],
+        check=True,
+    )
+
+def pcm_stream(path):
+    source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(path), volume=0.5)
+    encoder = discord.opus.Encoder()
+    while True:
+        frame = source.read()
+        if not frame:
+            break
+        encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+    source.cleanup()
+
+def opus_stream(path):
+    source = discord.FFmpegOpusAudio(path, codec='opus')
+    while source.read():
+        pass
+    source.cleanup()
+
+def opus_reencode_stream(path):
+    source = discord.FFmpegOpusAudio(path, options='-vn -af volume=0.500')
+    while source.read():
+        pass
+    source.cleanup()
+
+def measure(stream, path, streams):
+    cpu_start = time.process_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    threads = [Thread(target=stream, args=(path,)) for _ in range(streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    bot_cpu = time.process_time() - cpu_start
+    ffmpeg_cpu = (children.ru_utime + children.ru_stime) - (children_start.ru_utime + children_start.ru_stime)
+    return bot_cpu, ffmpeg_cpu
+
+if __name__ == "__main__":
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    if os.getenv("OPUS_LIBRARY"):
+        discord.opus.load_opus(os.environ["OPUS_LIBRARY"])
+    else:
+        discord.opus._load_default()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sample.webm")
+        make_sample(path, seconds)
+        minutes = streams * seconds / 60
+        for name, stream in (("pcm", pcm_stream), ("opus passthrough", opus_stream), ("opus re-encode", opus_reencode_stream)):
+            bot_cpu, ffmpeg_cpu = measure(stream, path, streams)
+            print(f"{name:<17} bot {bot_cpu / minutes:6.3f} cpu-s/min   ffmpeg {ffmpeg_cpu / minutes:6.3f} cpu-s/min"
+                  f"   ({streams} streams x {seconds}s)")
@@ -0,0 +1,36 @@
+# Per-message cost of the on_message pre-filter on a busy server, where almost
+# every message is chatter. Messages are plain objects; no gateway is involved.
+#
+#   python bench/bench_ingest.py [messages] [command ratio]
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+CHATTER = ["lol", "anyone up for ranked?", "<@123> look at this", "!!!", "gg", "https://example.com/cat.png"]
+
+def make_messages(count, command_ratio, guilds=1000):
+    messages = []
+    for _ in range(count):
+        guild = SimpleNamespace(id=random.randrange(guilds))
+        prefix = main.db.prefixes.get(guild.id, "!")
+        content = f"{prefix}play something" if random.random() < command_ratio else random.choice(CHATTER)
+        messages.append(SimpleNamespace(content=content, guild=guild))
+    return messages
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    for guild_id in range(0, 1000, 7):
+        main.db.prefixes[guild_id] = "?"
+    main.bot.mention_prefixes = ("<@42> ", "<@!42> ")
+    messages = make_messages(count, ratio)
+    start = time.process_time_ns()
+    passed = sum(1 for message in messages if main.bot.might_be_command(message))
+    elapsed = time.process_time_ns() - start
+    print(f"{count} messages, {passed} passed the pre-filter, {elapsed / count:.0f} ns CPU per message")
@@ -0,0 +1,481 @@
+# Offline load test: N guilds issue play/skip/playlist-load traffic against the
+# real command handlers, with yt-dlp, voice and the gateway replaced by fakes.
+# Nothing touches the network or Discord.
+#
+#   StubYoutubeDL    configurable extraction latency and failure rate
+#   FakeVoiceClient  reads one 20 ms frame per tick on its own thread, like discord's AudioPlayer
+#   FakeGateway      guilds, channels and members; commands are called directly
+#
+# Reports command latency percentiles, time to first audio, CPU and RSS per
+# active stream and event-loop lag, and writes them to a JSON file that a later
+# run can be compared against.
+#
+#   python bench/bench_load.py --guilds 50 --seconds 120
+#   python bench/bench_load.py --guilds 50 --compare bench/results/load-1700000000.json
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stubs only reach the bot through this process, so keep extraction in threads
+os.environ["EXTRACT_BACKEND"] = "thread"
+os.environ["DB_BACKEND"] = "memory"
+
+import discord
+import yt_dlp
+import main
+import metrics
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+FRAME = b"\x01\x00" * 1920  # 20 ms of 48 kHz stereo s16le
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 4)
+    return {'count': len(ordered), 'p50': at(0.5), 'p95': at(0.95), 'p99': at(0.99), 'max': round(ordered[-1], 4)}
+
+def video_id(query):
+    return f"{zlib.crc32(query.encode()):011d}"
+
+# ==================== STUB YOUTUBEDL ====================
+class StubYoutubeDL:
+    latency = 1.0
+    jitter = 0.5
+    failure_rate = 0.05
+    playlist_length = 1000
+    page_size = 100  # entries per continuation request, as on YouTube
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self.params.setdefault('http_headers', {'User-Agent': 'stub'})
+        self.cookiejar = SimpleNamespace(clear=lambda: None)
+
+    def extract_info(self, query, download=False, process=True, ie_key=None):
+        if "list=" in query:
+            return self._playlist(query.rsplit("list=", 1)[-1])
+        # A full search extracts every entry; a flat listing skips the per-video work
+        flat = bool(self.params.get('extract_flat'))
+        ids = None
+        if query.startswith("ytsearch"):
+            count, term = query[len("ytsearch"):].split(":", 1)
+            ids = [video_id(term)] + [video_id(f"{term} {i}") for i in range(1, int(count or 1))]
+        cost = 0.3 if flat else len(ids) if ids else 1
+        time.sleep(max(0.01, random.lognormvariate(0, self.jitter) * self.latency * cost))
+        if random.random() < self.failure_rate:
+            raise yt_dlp.utils.DownloadError("stub: HTTP Error 403: Forbidden")
+        if ids is None:
+            return self._info(query.rsplit("v=", 1)[-1])
+        if flat:
+            return {'entries': [self._flat(vid) for vid in ids]}
+        return {'entries': [self._info(vid) for vid in ids]}
+
+    def _playlist(self, list_id):
+        # Entries come out of a generator one continuation page at a time
+        def entries():
+            for page in range(0, self.playlist_length, self.page_size):
+                time.sleep(self.latency * 0.3)
+                for i in range(page, min(page + self.page_size, self.playlist_length)):
+                    yield self._flat(video_id(f"{list_id} {i}"))
+        return {'_type': 'playlist', 'title': f"Stub playlist {list_id}", 'entries': entries()}
+
+    def _flat(self, vid):
+        info = self._info(vid)
+        return {'id': vid, 'url': info['webpage_url'], 'title': info['title'], 'duration': info['duration']}
+
+    def _info(self, vid):
+        return {
+            'url': f"https://stub.invalid/videoplayback?expire={int(time.time()) + 21600}&itag=251&id={vid}",
+            'title': f"Stub track {vid}",
+            'duration': random.Random(vid).randint(15, 45),
+            'webpage_url': f"https://www.youtube.com/watch?v={vid}",
+        }
+
+# ==================== FAKE AUDIO ====================
+class FakeAudio(discord.AudioSource):
+    # Stands in for the ffmpeg pipe: a startup delay, then silence for the track length
+    spawn_delay = 0.2
+
+    def __init__(self, seconds):
+        self.frames = int(max(seconds, 1) / main.FRAME_SECONDS)
+        self.started = False
+
+    def read(self):
+        if not self.started:
+            self.started = True
+            time.sleep(self.spawn_delay)
+        if self.frames <= 0:
+            return b""
+        self.frames -= 1
+        return FRAME
+
+    def is_opus(self):
+        return False
+
+def fake_build_source(song, player, start=0.0):
+    return main.PlayerSource(FakeAudio((song['duration'] or 30) - start), start, audio_filter=player.filter)
+
+# ==================== FAKE VOICE ====================
+class FakeVoiceClient:
+    def __init__(self, gateway, guild, channel):
+        self.gateway = gateway
+        self.guild = guild
+        self.channel = channel
+        self.source = None
+        self.thread = None
+        self.stopping = None
+        self.resumed = threading.Event()
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    def is_playing(self):
+        return self.thread is not None and self.resumed.is_set()
+
+    def is_paused(self):
+        return self.thread is not None and not self.resumed.is_set()
+
+    def play(self, source, after=None):
+        if self.thread is not None:
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self.stopping = threading.Event()
+        self.resumed.set()
+        self.thread = threading.Thread(target=self._run, args=(source, after, self.stopping), daemon=True)
+        self.thread.start()
+
+    def _run(self, source, after, stopping):
+        first = True
+        next_tick = time.perf_counter()
+        while not stopping.is_set():
+            if not self.resumed.is_set():
+                self.resumed.wait(0.1)
+                next_tick = time.perf_counter()
+                continue
+            frame = source.read()
+            if not frame:
+                break
+            if first:
+                first = False
+                self.gateway.first_audio(self.guild.id)
+            next_tick += main.FRAME_SECONDS
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        source.cleanup()
+        if self.thread is threading.current_thread():
+            self.thread = None
+            self.source = None
+        if after:
+            after(None)
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    def stop(self):
+        if self.stopping:
+            self.stopping.set()
+        self.thread = None
+        self.source = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, force=False):
+        thread = self.thread
+        self.stop()
+        if thread:
+            await asyncio.to_thread(thread.join, 1)
+        self.connected = False
+        self.guild.voice_client = None
+
+# ==================== FAKE GATEWAY ====================
+class FakeMessage:
+    ids = itertools.count(1)
+
+    def __init__(self, channel, content=None):
+        self.id = next(self.ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        await asyncio.sleep(self.channel.gateway.api_latency)
+        self.content = content
+
+    async def delete(self):
+        pass
+
+class FakeTextChannel:
+    def __init__(self, gateway, guild):
+        self.gateway = gateway
+        self.guild = guild
+        self.id = guild.id * 10 + 1
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(self.gateway.api_latency)
+        self.sent += 1
+        return FakeMessage(self, content)
+
+class FakeVoiceChannel:
+    def __init__(self, gateway, guild):
+        self.gateway = gateway
+        self.guild = guild
+        self.id = guild.id * 10 + 2
+        self.name = f"voice-{guild.id}"
+
+    async def connect(self):
+        await asyncio.sleep(self.gateway.voice_connect)
+        self.guild.voice_client = FakeVoiceClient(self.gateway, self.guild, self)
+        return self.guild.voice_client
+
+class FakeGuild:
+    def __init__(self, gateway, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+        self.text = FakeTextChannel(gateway, self)
+        self.voice = FakeVoiceChannel(gateway, self)
+        self.member = SimpleNamespace(id=guild_id + 10**6, name=f"user{guild_id}", voice=SimpleNamespace(channel=self.voice))
+
+    def get_channel(self, channel_id):
+        return {self.text.id: self.text, self.voice.id: self.voice}.get(channel_id)
+
+class FakeContext:
+    def __init__(self, guild):
+        self.guild = guild
+        self.channel = guild.text
+        self.author = guild.member
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+class FakeGateway:
+    def __init__(self, guilds, api_latency, voice_connect):
+        self.api_latency = api_latency
+        self.voice_connect = voice_connect
+        self.guilds = {guild_id: FakeGuild(self, guild_id) for guild_id in range(1, guilds + 1)}
+        self.latencies = {}
+        self.waiting = {}  # guild id -> (kind, perf_counter when audio was requested)
+        self.first_audio_samples = {'play': [], 'skip': []}
+        self.lock = threading.Lock()
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def expect_audio(self, guild_id, kind):
+        with self.lock:
+            self.waiting.setdefault(guild_id, (kind, time.perf_counter()))
+
+    def first_audio(self, guild_id):
+        # Called from the voice thread
+        with self.lock:
+            waiting = self.waiting.pop(guild_id, None)
+            if waiting:
+                self.first_audio_samples[waiting[0]].append(time.perf_counter() - waiting[1])
+
+    async def dispatch(self, command, guild, **kwargs):
+        start = time.perf_counter()
+        try:
+            await command.callback(FakeContext(guild), **kwargs)
+        except Exception as e:
+            print(f"{command.qualified_name} failed in guild {guild.id}: {e!r}")
+        self.latencies.setdefault(command.qualified_name, []).append(time.perf_counter() - start)
+
+# ==================== LOAD ====================
+class LagSamples:
+    def __init__(self):
+        self.samples = []
+
+    def observe(self, value):
+        self.samples.append(value)
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def active_streams():
+    return sum(1 for player in main.players.values() if player.vc and player.vc.is_playing())
+
+async def guild_traffic(gateway, guild, queries, weights, args, deadline):
+    await asyncio.sleep(random.uniform(0, args.think))
+    while time.monotonic() < deadline:
+        roll = random.random()
+        if roll < args.skip_ratio:
+            player = main.players.get(guild.id)
+            if player and player.vc and player.vc.is_playing() and player.queue:
+                gateway.expect_audio(guild.id, 'skip')
+            await gateway.dispatch(main.skip, guild)
+        elif roll < args.skip_ratio + args.playlist_ratio:
+            if guild.voice_client is None or not guild.voice_client.is_playing():
+                gateway.expect_audio(guild.id, 'play')
+            await gateway.dispatch(main.pl_load, guild, name="bench")
+        else:
+            if guild.voice_client is None or not guild.voice_client.is_playing():
+                gateway.expect_audio(guild.id, 'play')
+            query = random.choices(queries, weights)[0]
+            await gateway.dispatch(main.play, guild, query=query)
+        await asyncio.sleep(random.expovariate(1 / args.think))
+
+async def sample_resources(samples, interval=1.0):
+    while True:
+        samples.append((time.perf_counter(), active_streams(), rss_bytes()))
+        await asyncio.sleep(interval)
+
+def install(gateway, extract_latency, failure_rate, spawn_delay):
+    # Swap the outside world for the stubs; call from inside the running loop
+    main.bot.loop = asyncio.get_running_loop()
+    StubYoutubeDL.latency = extract_latency
+    StubYoutubeDL.failure_rate = failure_rate
+    FakeAudio.spawn_delay = spawn_delay
+    yt_dlp.YoutubeDL = StubYoutubeDL
+    main.build_source = fake_build_source
+    main.bot.get_guild = gateway.get_guild
+
+async def run(args):
+    gateway = FakeGateway(args.guilds, args.api_latency, args.voice_connect)
+    install(gateway, args.extract_latency, args.failure_rate, args.spawn_delay)
+
+    # A popularity curve over the catalogue so the resolution cache sees realistic reuse
+    queries = [f"bench song {i}" for i in range(args.catalogue)]
+    weights = [1 / (i + 1) for i in range(args.catalogue)]
+    for guild in gateway.guilds.values():
+        main.db.playlists[guild.member.id] = {
+            "bench": [f"https://www.youtube.com/watch?v={video_id(q)}" for q in random.sample(queries, args.playlist_size)]
+        }
+        main.db.loaded_users.add(guild.member.id)
+
+    main.extraction.start()
+    lag = LagSamples()
+    lag_monitor = metrics.LoopLagMonitor(lag, interval=0.1)
+    lag_monitor.start()
+    resources = []
+    sampler = asyncio.ensure_future(sample_resources(resources))
+    baseline_rss = rss_bytes()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    deadline = time.monotonic() + args.seconds
+    await asyncio.gather(*(
+        guild_traffic(gateway, guild, queries, weights, args, deadline) for guild in gateway.guilds.values()
+    ))
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    sampler.cancel()
+    lag_monitor.close()
+
+    stream_seconds = sum(earlier[1] * (later[0] - earlier[0]) for earlier, later in zip(resources, resources[1:]))
+    peak_streams = max((streams for _, streams, _ in resources), default=0)
+    peak_rss = max((rss for _, _, rss in resources), default=baseline_rss)
+
+    for guild in gateway.guilds.values():
+        if guild.voice_client:
+            await guild.voice_client.disconnect()
+    for guild_id in list(main.players):
+        main.remove_player(guild_id)
+    main.extraction.close()
+
+    return {
+        'args': vars(args),
+        'time': time.time(),
+        'wall_seconds': round(wall, 2),
+        'commands': {name: percentiles(samples) for name, samples in sorted(gateway.latencies.items())},
+        'first_audio': {kind: percentiles(samples) for kind, samples in gateway.first_audio_samples.items()},
+        'cpu_seconds': round(cpu, 2),
+        'cpu_per_stream': round(cpu / stream_seconds, 4) if stream_seconds else None,
+        'peak_streams': peak_streams,
+        'rss_mb': round(peak_rss / 2**20, 1),
+        'rss_per_stream_kb': round((peak_rss - baseline_rss) / peak_streams / 1024, 1) if peak_streams else None,
+        'loop_lag': percentiles(lag.samples),
+        'cache': main.resolver.stats(),
+        'outbox': main.outbox.stats(),
+        'strategies': main.strategy_tracker.snapshot(),
+    }
+
+# ==================== REPORT ====================
+def flatten(results):
+    rows = {}
+    for name, stat in results['commands'].items():
+        if stat:
+            rows[f"{name} p50 (s)"] = stat['p50']
+            rows[f"{name} p99 (s)"] = stat['p99']
+    for kind, stat in results['first_audio'].items():
+        if stat:
+            rows[f"first audio after {kind} p50 (s)"] = stat['p50']
+            rows[f"first audio after {kind} p99 (s)"] = stat['p99']
+    rows["CPU per active stream (cores)"] = results['cpu_per_stream']
+    rows["RSS (MB)"] = results['rss_mb']
+    rows["RSS per stream (KB)"] = results['rss_per_stream_kb']
+    if results['loop_lag']:
+        rows["loop lag p99 (s)"] = results['loop_lag']['p99']
+        rows["loop lag max (s)"] = results['loop_lag']['max']
+    cache = results['cache']
+    lookups = cache['hits'] + cache['misses']
+    rows["cache hit ratio"] = round(cache['hits'] / lookups, 3) if lookups else None
+    return rows
+
+def report(results, previous=None):
+    rows = flatten(results)
+    before = flatten(previous) if previous else {}
+    width = max(len(name) for name in rows)
+    for name, value in rows.items():
+        line = f"{name:<{width}}  {value!s:>10}"
+        old = before.get(name)
+        if old is not None and value is not None:
+            change = f"{(value - old) / old * 100:+.1f}%" if old else ""
+            line += f"  (was {old}, {change})"
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--think", type=float, default=5, help="mean seconds between commands per guild")
+    parser.add_argument("--skip-ratio", type=float, default=0.25)
+    parser.add_argument("--playlist-ratio", type=float, default=0.1)
+    parser.add_argument("--playlist-size", type=int, default=15)
+    parser.add_argument("--catalogue", type=int, default=500)
+    parser.add_argument("--extract-latency", type=float, default=1.0, help="median seconds per stub extraction")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--spawn-delay", type=float, default=0.2, help="seconds before the fake ffmpeg yields audio")
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--voice-connect", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="results file (default bench/results/load-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    results = asyncio.run(run(args))
+    out = args.out or os.path.join(RESULTS_DIR, f"load-{int(results['time'])}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print(f"{args.guilds} guilds for {results['wall_seconds']}s, peak {results['peak_streams']} streams")
+    report(results, previous)
+    print(f"Saved to {out}")
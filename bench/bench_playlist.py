@@ -0,0 +1,43 @@
+# Time and memory to queue a long playlist URL with !play, using the stubs from
+# bench_load.py. Reports when the first track starts, when the last entry is
+# queued, and the memory held by the queued tracks.
+#
+#   python bench/bench_playlist.py [tracks] [seconds per extraction]
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_load
+import main
+
+async def queue_playlist(tracks, latency):
+    gateway = bench_load.FakeGateway(1, 0.05, 0.3)
+    bench_load.install(gateway, latency, 0.0, 0.2)
+    bench_load.StubYoutubeDL.playlist_length = tracks
+    guild = gateway.guilds[1]
+    main.extraction.start()
+    tracemalloc.start()
+    start = time.perf_counter()
+    gateway.expect_audio(guild.id, 'play')
+    await main.play.callback(bench_load.FakeContext(guild), query="https://www.youtube.com/playlist?list=PLbench")
+    queued = time.perf_counter() - start
+    await asyncio.sleep(latency * 2 + 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    first_audio = gateway.first_audio_samples['play']
+    player = main.players[guild.id]
+    print(f"{len(player.queue) + 1} of {tracks} tracks queued in {queued:.2f}s")
+    print(f"first audio after {first_audio[0]:.2f}s" if first_audio else "no audio yet")
+    print(f"peak traced memory {peak / 2**20:.1f} MB ({peak / tracks:.0f} bytes per track)")
+    await guild.voice_client.disconnect()
+    main.remove_player(guild.id)
+    main.extraction.close()
+
+if __name__ == "__main__":
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    asyncio.run(queue_playlist(tracks, latency))
@@ -0,0 +1,83 @@
+# Queue operations on a long 24/7 queue: the old deque/list rebuilds vs
+# TrackQueue (native deque indexing, a running total and a lazy shuffle).
+# Times are microseconds per operation; each operation runs on a fresh queue
+# that is built outside the timing.
+#
+#   python bench/bench_queue.py [tracks] [operations]
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trackqueue import TrackQueue
+
+def old_remove(queue, position):
+    queue_list = list(queue)
+    removed = queue_list.pop(position)
+    return deque(queue_list), removed
+
+def old_move(queue, source, target):
+    queue_list = list(queue)
+    queue_list.insert(target, queue_list.pop(source))
+    return deque(queue_list)
+
+def old_shuffle(queue):
+    queue_list = list(queue)
+    random.shuffle(queue_list)
+    return deque(queue_list)[0]
+
+def old_skipto(queue, position):
+    for _ in range(position - 1):
+        queue.popleft()
+
+def old_page(queue, start):
+    return list(queue)[start:start + 10]
+
+def old_total(queue):
+    return sum(song['duration'] for song in queue)
+
+def old_shuffle_pop_tail(queue):
+    queue_list = list(queue)
+    random.shuffle(queue_list)
+    return deque(queue_list).pop()
+
+def new_shuffle(queue):
+    queue.shuffle()
+    return queue[0]
+
+def new_shuffle_pop_tail(queue):
+    queue.shuffle()
+    return queue.pop()
+
+def measure(build, operation, size, operations):
+    total = 0.0
+    for _ in range(operations):
+        queue = build()
+        args = [random.randrange(size) for _ in range(2)]
+        start = time.perf_counter()
+        operation(queue, *args)
+        total += time.perf_counter() - start
+    return total / operations * 1e6
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    tracks = [{'title': f"track {i}", 'duration': 180 + i % 120} for i in range(size)]
+    old = lambda: deque(tracks)
+    new = lambda: TrackQueue(tracks)
+    rows = [
+        ("remove", lambda q, i, j: old_remove(q, i), lambda q, i, j: q.pop(i)),
+        ("move", old_move, lambda q, i, j: q.move(i, j)),
+        ("skipto", lambda q, i, j: old_skipto(q, i + 1), lambda q, i, j: q.drop(i)),
+        ("shuffle + head", lambda q, i, j: old_shuffle(q), lambda q, i, j: new_shuffle(q)),
+        ("shuffle + pop", lambda q, i, j: old_shuffle_pop_tail(q), lambda q, i, j: new_shuffle_pop_tail(q)),
+        ("page of 10", lambda q, i, j: old_page(q, i), lambda q, i, j: q.page(i, 10)),
+        ("total duration", lambda q, i, j: old_total(q), lambda q, i, j: q.total_duration),
+    ]
+    print(f"{size} tracks, {operations} operations each (us/op)")
+    for name, before, after in rows:
+        print(f"{name:<16} deque {measure(old, before, size, operations):>10.1f}   "
+              f"TrackQueue {measure(new, after, size, operations):>8.1f}")
@@ -0,0 +1,79 @@
+# Spotify playlists end to end against bench/fake_spotify.py and the yt-dlp stub
+# from bench_load.py, with a SQLite match cache in a temporary directory.
+#
+# The first pass queues a playlist and resolves every track, as if the whole
+# queue played: each track costs one YouTube search. The second pass starts over
+# with empty in-memory caches on the same database, as a restart or another
+# cluster would, and should queue every track already matched with no searches.
+#
+#   python bench/bench_spotify.py [tracks] [seconds per extraction]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_load
+import fake_spotify
+import main
+import spotify
+import storage
+
+PLAYLIST_URL = "https://open.spotify.com/playlist/" + fake_spotify.spotify_id("bench")
+
+async def queue_and_play(gateway, guild, api, label):
+    before = dict(main.spotify_stats, searches=main.searches.misses, calls=main.spotify_client.calls)
+    start = time.perf_counter()
+    await main.play.callback(bench_load.FakeContext(guild), query=PLAYLIST_URL)
+    queued = time.perf_counter() - start
+    player = main.players[guild.id]
+    songs = ([player.current] if player.current else []) + list(player.queue)
+    matched = sum('youtube.com' in song['webpage_url'] for song in songs)
+    # Resolve the rest as playback would reach them
+    semaphore = asyncio.Semaphore(8)
+    async def resolve(song):
+        async with semaphore:
+            return await main.resolve_stream(song)
+    start = time.perf_counter()
+    resolved = await asyncio.gather(*(resolve(song) for song in songs))
+    played = time.perf_counter() - start
+    await main.db.flush()
+    print(f"{label}: {len(songs)} tracks queued in {queued:.2f}s with "
+          f"{main.spotify_client.calls - before['calls']} API calls ({dict(api.requests)}), "
+          f"{matched} already matched")
+    print(f"{' ' * len(label)}  all resolved in {played:.2f}s: {sum(map(bool, resolved))} playable, "
+          f"{main.searches.misses - before['searches']} searches, "
+          f"{main.spotify_stats['cached'] - before['cached']} matches reused")
+    api.requests.clear()
+    await guild.voice_client.disconnect()
+    main.remove_player(guild.id)
+
+async def run(tracks, latency):
+    api = fake_spotify.FakeSpotify()
+    api.playlist_length = tracks
+    base = await api.start()
+    gateway = bench_load.FakeGateway(1, 0.05, 0.3)
+    bench_load.install(gateway, latency, 0.0, 0.2)
+    guild = gateway.guilds[1]
+    main.extraction.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        for label in ("cold", "warm"):
+            # Fresh process state each pass; only the database carries over
+            main.db = main.Database(storage.SQLiteBackend(path))
+            await main.db.connect()
+            main.spotify_client = spotify.SpotifyClient("bench", "bench", base)
+            main.resolver = main.ResolutionCache(main.config.RESOLVE_CACHE_SIZE)
+            main.searches = main.SearchCache(main.config.SEARCH_CACHE_SIZE, main.config.SEARCH_CACHE_TTL)
+            await queue_and_play(gateway, guild, api, label)
+            main.spotify_client.close()
+            await main.db.close()
+    main.extraction.close()
+    await api.close()
+
+if __name__ == "__main__":
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    asyncio.run(run(tracks, latency))
@@ -0,0 +1,41 @@
+# Per-lookup setup overhead of a fresh YoutubeDL vs a warm pooled instance.
+# No network is touched: both paths stop after resolving the YouTube extractor,
+# which is the work every real lookup pays before its first HTTP request.
+#
+#   python bench/bench_ytdl_pool.py [iterations]
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+import extractor
+
+def cold_lookup(strategy):
+    opts = extractor.BASE_YTDL_OPTS.copy()
+    opts.update(extractor.STRATEGIES[strategy])
+    ydl = yt_dlp.YoutubeDL(opts)
+    ydl.get_info_extractor('Youtube')
+
+def warm_lookup(strategy):
+    with extractor.pools[strategy].acquire() as ydl:
+        ydl.get_info_extractor('Youtube')
+
+def measure(func, iterations):
+    samples = []
+    for i in range(iterations):
+        strategy = list(extractor.STRATEGIES)[i % len(extractor.STRATEGIES)]
+        start = time.perf_counter()
+        func(strategy)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    extractor.warm_pools()
+    for name, func in (("fresh YoutubeDL", cold_lookup), ("pooled YoutubeDL", warm_lookup)):
+        mean, p50, p99 = measure(func, iterations)
+        print(f"{name:<18} mean {mean:7.3f} ms   p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
@@ -0,0 +1,145 @@
+# A local stand-in for the Spotify Web API: client-credentials tokens, /tracks,
+# albums and playlists, with the real page-size limits. Every id is valid and its
+# metadata is derived from the id, so any URL built on the fly resolves. Point
+# the bot at it with SPOTIFY_API_URL=http://127.0.0.1:<port>.
+#
+#   python bench/fake_spotify.py [port]
+import asyncio
+import hashlib
+import string
+import sys
+from collections import Counter
+from aiohttp import web
+
+ALPHABET = string.ascii_letters + string.digits
+MAX_IDS = 50
+MAX_PLAYLIST_PAGE = 100
+MAX_ALBUM_PAGE = 50
+
+def spotify_id(seed):
+    digest = hashlib.sha256(seed.encode()).digest()
+    return "".join(ALPHABET[byte % len(ALPHABET)] for byte in digest[:22])
+
+def track_object(track_id):
+    number = int(hashlib.sha256(track_id.encode()).hexdigest()[:8], 16)
+    return {
+        'id': track_id,
+        'name': f"Fake song {number % 100000}",
+        'artists': [{'name': f"Fake artist {number % 997}"}],
+        'duration_ms': (15 + number % 31) * 1000,
+        'external_ids': {'isrc': f"QZFAK{number % 10**7:07d}"},
+        'is_local': False,
+    }
+
+def simplified(track):
+    return {key: track[key] for key in ('id', 'name', 'artists', 'duration_ms')}
+
+class FakeSpotify:
+    playlist_length = 1000
+    album_length = 120
+    local_every = 97  # every Nth playlist item is a local file with no id
+    latency = 0.05
+
+    def __init__(self):
+        self.requests = Counter()
+        self.base = None
+        self.runner = None
+        self.app = web.Application()
+        self.app.router.add_post('/api/token', self.token)
+        self.app.router.add_get('/v1/tracks', self.tracks)
+        self.app.router.add_get('/v1/tracks/', self.tracks)
+        self.app.router.add_get('/v1/albums/{id}', self.album)
+        self.app.router.add_get('/v1/albums/{id}/tracks', self.album_tracks)
+        self.app.router.add_get('/v1/playlists/{id}', self.playlist)
+        # Newer spotipy reads /items, older releases /tracks
+        self.app.router.add_get('/v1/playlists/{id}/items', self.playlist_items)
+        self.app.router.add_get('/v1/playlists/{id}/tracks', self.playlist_items)
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        port = self.runner.addresses[0][1]
+        self.base = f"http://{host}:{port}"
+        return self.base
+
+    async def close(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def _served(self, endpoint):
+        self.requests[endpoint] += 1
+        await asyncio.sleep(self.latency)
+
+    def _page(self, request, path, items, total, limit):
+        offset = int(request.query.get('offset', 0))
+        limit = min(int(request.query.get('limit', limit)), limit)
+        following = offset + limit
+        return {
+            'items': items(offset, min(following, total)),
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'next': f"{self.base}{path}?offset={following}&limit={limit}" if following < total else None,
+        }
+
+    async def token(self, request):
+        await self._served('token')
+        return web.json_response({'access_token': 'fake', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    async def tracks(self, request):
+        await self._served('tracks')
+        ids = [track_id for track_id in request.query.get('ids', '').split(',') if track_id]
+        if len(ids) > MAX_IDS:
+            return web.json_response({'error': {'status': 400, 'message': 'Too many ids requested'}}, status=400)
+        return web.json_response({'tracks': [track_object(track_id) for track_id in ids]})
+
+    def _album_items(self, album_id):
+        def items(start, stop):
+            return [simplified(track_object(spotify_id(f"{album_id} {i}"))) for i in range(start, stop)]
+        return items
+
+    async def album(self, request):
+        await self._served('album')
+        album_id = request.match_info['id']
+        path = f"/v1/albums/{album_id}/tracks"
+        return web.json_response({
+            'id': album_id,
+            'name': f"Fake album {album_id[:6]}",
+            'tracks': self._page(request, path, self._album_items(album_id), self.album_length, MAX_ALBUM_PAGE),
+        })
+
+    async def album_tracks(self, request):
+        await self._served('album_tracks')
+        album_id = request.match_info['id']
+        path = f"/v1/albums/{album_id}/tracks"
+        return web.json_response(
+            self._page(request, path, self._album_items(album_id), self.album_length, MAX_ALBUM_PAGE)
+        )
+
+    async def playlist(self, request):
+        await self._served('playlist')
+        playlist_id = request.match_info['id']
+        return web.json_response({'id': playlist_id, 'name': f"Fake playlist {playlist_id[:6]}"})
+
+    async def playlist_items(self, request):
+        await self._served('playlist_items')
+        playlist_id = request.match_info['id']
+        def items(start, stop):
+            return [
+                {'track': {'id': None, 'name': f"local {i}.mp3", 'is_local': True, 'artists': []}}
+                if i % self.local_every == self.local_every - 1
+                else {'track': track_object(spotify_id(f"{playlist_id} {i}"))}
+                for i in range(start, stop)
+            ]
+        path = request.path
+        return web.json_response(self._page(request, path, items, self.playlist_length, MAX_PLAYLIST_PAGE))
+
+async def serve(port):
+    server = FakeSpotify()
+    print(f"Fake Spotify API on {await server.start(port=port)}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8899))
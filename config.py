@@ -2,3 +2,117 @@ import os
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 PREFIX = "!"
+
+# Resolution cache
+RESOLVE_CACHE_SIZE = int(os.getenv("RESOLVE_CACHE_SIZE", "2048"))
+STREAM_DEFAULT_TTL = int(os.getenv("STREAM_DEFAULT_TTL", "1800"))
+STREAM_EXPIRY_MARGIN = int(os.getenv("STREAM_EXPIRY_MARGIN", "120"))
+
+# Playlist loading
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "4"))
+PLAYLIST_PROGRESS_INTERVAL = float(os.getenv("PLAYLIST_PROGRESS_INTERVAL", "2"))
+
+# Extraction backend: "thread" for small deployments, "process" to keep yt-dlp off the bot's GIL
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "thread")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "45"))
+EXTRACT_MAX_JOBS = int(os.getenv("EXTRACT_MAX_JOBS", "50"))
+YDL_POOL_SIZE = int(os.getenv("YDL_POOL_SIZE", "2"))
+
+# Strategy ordering and hedged extraction
+STRATEGY_WINDOW = int(os.getenv("STRATEGY_WINDOW", "50"))
+HEDGE_EXTRACTION = os.getenv("HEDGE_EXTRACTION", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+
+# Start resolving the next track this many seconds before the current one ends
+PREFETCH_LEAD = int(os.getenv("PREFETCH_LEAD", "30"))
+
+# Gapless playback: spawn the next track's ffmpeg GAPLESS_LEAD seconds before the end
+# of the current one and read GAPLESS_BUFFER seconds of audio ahead
+GAPLESS = os.getenv("GAPLESS", "false").lower() in ("1", "true", "yes")
+GAPLESS_LEAD = int(os.getenv("GAPLESS_LEAD", "10"))
+GAPLESS_BUFFER = float(os.getenv("GAPLESS_BUFFER", "3"))
+
+# Send YouTube Opus streams to Discord without a PCM decode/re-encode in the bot.
+# Packets are only copied at 100% volume with no filter, so players start at 100% here;
+# any other volume or filter plays through the PCM path until the next track.
+OPUS_PASSTHROUGH = os.getenv("OPUS_PASSTHROUGH", "false").lower() in ("1", "true", "yes")
+
+# Coalesce now-playing panel edits that happen within this many seconds
+PANEL_DEBOUNCE = float(os.getenv("PANEL_DEBOUNCE", "1.5"))
+
+# Outbound message coalescing; Discord allows roughly 5 messages per 5 seconds per channel
+OUTBOX_WINDOW = float(os.getenv("OUTBOX_WINDOW", "0.75"))
+OUTBOX_BURST = int(os.getenv("OUTBOX_BURST", "5"))
+OUTBOX_PER = float(os.getenv("OUTBOX_PER", "5"))
+OUTBOX_MAX_PENDING = int(os.getenv("OUTBOX_MAX_PENDING", "20"))
+# A transient status message is only edited into the next reply within this many seconds
+OUTBOX_STATUS_TTL = float(os.getenv("OUTBOX_STATUS_TTL", str(OUTBOX_WINDOW * 4)))
+
+# Persistent storage: "memory" (nothing survives a restart), "sqlite" or "mongo"
+DB_BACKEND = os.getenv("DB_BACKEND", "memory")
+DB_PATH = os.getenv("DB_PATH", "musicbot.db")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.getenv("MONGO_DB", "musicbot")
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "5"))
+
+# Sharding and clustering. launcher.py sets CLUSTER_ID/CLUSTER_SHARDS/SHARD_COUNT
+# for each cluster process; AUTO_SHARD runs a single AutoShardedBot process.
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", str(os.cpu_count() or 1)))
+CLUSTER_ID = int(os.getenv("CLUSTER_ID")) if os.getenv("CLUSTER_ID") else None
+CLUSTER_SHARDS = [int(shard) for shard in os.getenv("CLUSTER_SHARDS", "").split(",") if shard]
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+AUTO_SHARD = os.getenv("AUTO_SHARD", "false").lower() in ("1", "true", "yes")
+IPC_HOST = os.getenv("IPC_HOST", "127.0.0.1")
+IPC_PORT = int(os.getenv("IPC_PORT", "8765"))
+IPC_TOKEN = os.getenv("IPC_TOKEN", "")
+IPC_TIMEOUT = float(os.getenv("IPC_TIMEOUT", "5"))
+
+# Player snapshots: saved every SNAPSHOT_INTERVAL seconds and on shutdown, restored
+# on startup with at most RESTORE_CONCURRENCY guilds reconnecting at once
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "players.snapshot")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "30"))
+RESTORE_CONCURRENCY = int(os.getenv("RESTORE_CONCURRENCY", "5"))
+
+# Health and metrics HTTP server (/healthz, /metrics); cluster N listens on WEB_PORT + N
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
+
+# Span tracing for !play and track changes; TRACE_EXPORT appends every trace as a JSON line
+TRACING = os.getenv("TRACING", "false").lower() in ("1", "true", "yes")
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "20"))
+TRACE_EXPORT = os.getenv("TRACE_EXPORT") or None
+
+# Two-phase search: a flat ytsearch for candidates, then a full extraction of the pick only
+FLAT_SEARCH = os.getenv("FLAT_SEARCH", "true").lower() in ("1", "true", "yes")
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "5"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "21600"))
+
+# Playlist and mix URLs passed to !play: listed flat in pages, capped, resolved just before playing
+PLAYLIST_PAGE_SIZE = int(os.getenv("PLAYLIST_PAGE_SIZE", "50"))
+PLAYLIST_MAX_TRACKS = int(os.getenv("PLAYLIST_MAX_TRACKS", "1000"))
+
+# Spotify links: metadata through the Web API (client credentials), audio from a matched
+# YouTube video. SPOTIFY_API_URL points the client at another server, e.g. a local fake.
+SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL") or None
+SPOTIFY_MATCH_TOLERANCE = int(os.getenv("SPOTIFY_MATCH_TOLERANCE", "15"))
+
+# On-disk Opus cache: a track is copied in the background after AUDIO_CACHE_THRESHOLD plays
+# from its remote stream and later plays read the file. Bounded by AUDIO_CACHE_MAX_MB,
+# least recently played first out. Clusters each use their own subdirectory.
+AUDIO_CACHE = os.getenv("AUDIO_CACHE", "false").lower() in ("1", "true", "yes")
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+AUDIO_CACHE_THRESHOLD = int(os.getenv("AUDIO_CACHE_THRESHOLD", "3"))
+AUDIO_CACHE_MAX_DURATION = int(os.getenv("AUDIO_CACHE_MAX_DURATION", "900"))
+AUDIO_CACHE_WORKERS = int(os.getenv("AUDIO_CACHE_WORKERS", "1"))
+
+# Normalizer: tracks are measured once (EBU R128) and played at a fixed gain towards
+# LOUDNESS_TARGET LUFS, boosting quiet tracks by at most LOUDNESS_MAX_BOOST dB
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-14"))
+LOUDNESS_MAX_BOOST = float(os.getenv("LOUDNESS_MAX_BOOST", "6"))
+LOUDNESS_WORKERS = int(os.getenv("LOUDNESS_WORKERS", "1"))
@@ -0,0 +1,262 @@
+import copy
+import itertools
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+import yt_dlp
+import config
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+]
+
+BASE_YTDL_OPTS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'no_warnings': True,
+    'ignoreerrors': True,
+    'nocheckcertificate': True,
+    'extract_flat': False,
+    'source_address': '0.0.0.0',
+    'extractor_args': {
+        'youtube': {
+            'skip': ['dash', 'hls', 'webpage'],
+        }
+    }
+}
+
+STRATEGIES = {
+    'random_ua': {},
+    'android': {'extractor_args': {'youtube': {'player_client': ['android']}}},
+    'm4a': {'format': 'bestaudio[ext=m4a]'},
+    'generic': {'force_generic_extractor': True},
+}
+
+# ==================== YOUTUBEDL POOL ====================
+# Building a YoutubeDL registers every extractor and sets up the HTTP stack,
+# so each strategy keeps a few warm instances. An instance is checked out by
+# one lookup at a time and its cookies/headers are reset before reuse.
+class YDLPool:
+    def __init__(self, opts, size):
+        self.opts = opts
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.headers = None
+        self.created = 0
+
+    def _build(self):
+        self.created += 1
+        ydl = yt_dlp.YoutubeDL(copy.deepcopy(self.opts))
+        if self.headers is None:
+            self.headers = copy.deepcopy(ydl.params['http_headers'])
+        return ydl
+
+    def warm(self):
+        with self.lock:
+            missing = self.size - len(self.idle)
+        for _ in range(missing):
+            self.release(self._build())
+
+    @contextmanager
+    def acquire(self):
+        with self.lock:
+            ydl = self.idle.pop() if self.idle else None
+        if ydl is None:
+            ydl = self._build()
+        yield ydl
+        # Only reached on success; an instance that raised mid-lookup is dropped
+        self.release(ydl)
+
+    def release(self, ydl):
+        ydl.cookiejar.clear()
+        if ydl.params['http_headers'] != self.headers:
+            set_headers(ydl, copy.deepcopy(self.headers))
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(ydl)
+
+def set_headers(ydl, headers):
+    # The request director copies http_headers once, when the first request builds it;
+    # drop it (as YoutubeDL.close does) so the next request goes out with these headers
+    ydl.params['http_headers'] = headers
+    if '_request_director' in ydl.__dict__:
+        ydl._request_director.close()
+        del ydl._request_director
+
+def _strategy_opts(name):
+    opts = BASE_YTDL_OPTS.copy()
+    opts.update(STRATEGIES[name])
+    return opts
+
+pools = {name: YDLPool(_strategy_opts(name), config.YDL_POOL_SIZE) for name in STRATEGIES}
+# Flat extraction lists entries (id, title, duration) without touching any video page
+flat_pool = YDLPool(dict(BASE_YTDL_OPTS, extract_flat='in_playlist'), config.YDL_POOL_SIZE)
+
+def warm_pools():
+    for pool in pools.values():
+        pool.warm()
+    flat_pool.warm()
+
+# ==================== STRATEGY STATS ====================
+class StrategyTracker:
+    def __init__(self, names, window):
+        self.names = list(names)
+        self.samples = {name: deque(maxlen=window) for name in self.names}
+
+    def record(self, name, ok, latency):
+        self.samples[name].append((ok, latency))
+
+    def success_rate(self, name):
+        samples = self.samples[name]
+        # Laplace prior so an untried strategy is neither trusted nor written off
+        return (sum(1 for ok, _ in samples if ok) + 1) / (len(samples) + 2)
+
+    def latency(self, name, percentile):
+        latencies = sorted(latency for ok, latency in self.samples[name] if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile))]
+
+    def ranked(self):
+        # Strategies that have worked come first, by expected time to a usable result:
+        # the mean time of an attempt, failures included, over the chance it succeeds.
+        # Untried and only-failing ones follow; ties keep the original strategy order.
+        def cost(name):
+            samples = self.samples[name]
+            proven = any(ok for ok, _ in samples)
+            attempt = sum(latency for _, latency in samples) / len(samples) if samples else 1.0
+            return (not proven, attempt / self.success_rate(name))
+        return sorted(self.names, key=cost)
+
+    def deadline(self, name, percentile, min_samples):
+        if sum(1 for ok, _ in self.samples[name] if ok) < min_samples:
+            return None
+        return self.latency(name, percentile)
+
+    def snapshot(self):
+        stats = {}
+        for name in self.names:
+            samples = self.samples[name]
+            stats[name] = {
+                'attempts': len(samples),
+                'success_rate': sum(1 for ok, _ in samples if ok) / len(samples) if samples else None,
+                'p50': self.latency(name, 0.5),
+                'p90': self.latency(name, 0.9),
+            }
+        return stats
+
+def extract_with_strategy(query, name):
+    try:
+        return _extract_with_opts(query, name)
+    except Exception as e:
+        print(f"Strategy {name} failed: {e}")
+        return None, None, None, None, None
+
+def search_flat(query, limit):
+    # Phase one of a search: candidates only, no formats. The chosen one is extracted by URL.
+    with flat_pool.acquire() as ydl:
+        info = ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
+    if not info:
+        return []
+    return [_flat_entry(entry) for entry in info.get('entries') or [] if entry and entry.get('id')]
+
+def expand_playlist(url, start, stop):
+    # Flat entries start..stop of a playlist or mix, plus how many raw entries were
+    # walked (unavailable and id-less ones included), which is where the next call
+    # starts. process=False keeps yt-dlp's entry generator lazy, so only the
+    # continuation pages up to `stop` are fetched.
+    with flat_pool.acquire() as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Mix and watch?v=...&list= URLs first redirect to the playlist extractor
+        for _ in range(3):
+            if not info or info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        if not info:
+            return None, [], 0
+        title = info.get('title') or 'Playlist'
+        flat = []
+        walked = 0
+        try:
+            for entry in itertools.islice(info.get('entries') or [], start, stop):
+                walked += 1
+                if entry and entry.get('id'):
+                    flat.append(_flat_entry(entry))
+        except yt_dlp.utils.YoutubeDLError as e:
+            # The walk runs outside extract_info, so ignoreerrors does not cover a failed
+            # continuation page; keep what the earlier pages gave
+            print(f"Playlist listing stopped after {start + walked} entries: {e}")
+        return title, flat, walked
+
+def _flat_entry(entry):
+    url = entry.get('url') or ''
+    if not url.startswith(('http://', 'https://')):
+        url = f"https://www.youtube.com/watch?v={entry['id']}"
+    return {
+        'webpage_url': url,
+        'title': entry.get('title') or 'Unknown',
+        'duration': int(entry.get('duration') or 0),
+        'channel': entry.get('channel') or entry.get('uploader') or '',
+        'source': _source_name(url),
+    }
+
+def _extract_with_opts(query, strategy):
+    with pools[strategy].acquire() as ydl:
+        if strategy == 'random_ua':
+            headers = copy.deepcopy(ydl.params['http_headers'])
+            headers['User-Agent'] = random.choice(USER_AGENTS)
+            set_headers(ydl, headers)
+        if not query.startswith(('http://', 'https://')):
+            search_query = f"ytsearch3:{query}"
+            info = ydl.extract_info(search_query, download=False)
+            if info and 'entries' in info:
+                for entry in info['entries']:
+                    if entry:
+                        url, title, dur, src, page = _extract_from_info(entry)
+                        if url:
+                            return url, title, dur, src, page
+            return None, None, None, None, None
+        else:
+            info = ydl.extract_info(query, download=False)
+            if info and info.get('entries') is not None:
+                # A playlist URL that reached here: play its first playable entry
+                for entry in info['entries']:
+                    result = _extract_from_info(entry)
+                    if result[0]:
+                        return result
+                return None, None, None, None, None
+            return _extract_from_info(info)
+
+def _extract_from_info(info):
+    if not info:
+        return None, None, None, None, None
+    audio_url = info.get('url')
+    if not audio_url and 'formats' in info:
+        for f in info['formats']:
+            if f.get('vcodec') == 'none' and f.get('acodec') != 'none':
+                audio_url = f.get('url')
+                break
+    title = info.get('title', 'Unknown')
+    duration = info.get('duration', 0)
+    webpage_url = info.get('webpage_url', '')
+    return audio_url, title, duration, _source_name(webpage_url), webpage_url
+
+def _source_name(webpage_url):
+    if 'spotify.com' in webpage_url:
+        return "Spotify"
+    elif 'soundcloud.com' in webpage_url:
+        return "SoundCloud"
+    elif 'deezer.com' in webpage_url:
+        return "Deezer"
+    elif 'twitch.tv' in webpage_url:
+        return "Twitch"
+    elif 'apple.com' in webpage_url:
+        return "Apple Music"
+    elif 'bandcamp.com' in webpage_url:
+        return "Bandcamp"
+    return "YouTube"
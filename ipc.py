@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import json
+
+# ==================== CLUSTER IPC ====================
+# The launcher runs an IPCHub; every cluster process connects an IPCClient.
+# A broadcast from one cluster is fanned out to all of them by the hub, and the
+# answers that arrive within the timeout come back as one list. Messages are
+# JSON lines over a local TCP socket.
+
+async def _send(writer, message):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+class IPCHub:
+    def __init__(self, token, timeout):
+        self.token = token
+        self.timeout = timeout
+        self.clusters = {}
+        self.pending = {}
+        self.ids = itertools.count()
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader, writer):
+        try:
+            hello = json.loads(await reader.readline())
+        except ValueError:
+            writer.close()
+            return
+        if hello.get('op') != 'hello' or hello.get('token') != self.token:
+            writer.close()
+            return
+        cluster_id = hello['cluster']
+        self.clusters[cluster_id] = writer
+        print(f"🔗 Cluster {cluster_id} connected")
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message['op'] == 'request':
+                    asyncio.ensure_future(self._fan_out(writer, message))
+                elif message['op'] == 'result':
+                    call = self.pending.get(message['id'])
+                    if call:
+                        call['results'].append(message['data'])
+                        call['waiting'].discard(cluster_id)
+                        if not call['waiting'] and not call['done'].done():
+                            call['done'].set_result(None)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            if self.clusters.get(cluster_id) is writer:
+                del self.clusters[cluster_id]
+            print(f"🔌 Cluster {cluster_id} disconnected")
+
+    async def _fan_out(self, origin, request):
+        call_id = next(self.ids)
+        targets = dict(self.clusters)
+        call = {'results': [], 'waiting': set(targets), 'done': asyncio.get_running_loop().create_future()}
+        self.pending[call_id] = call
+        for writer in targets.values():
+            try:
+                await _send(writer, {'op': 'call', 'id': call_id, 'action': request['action'], 'args': request['args']})
+            except ConnectionError:
+                pass
+        try:
+            await asyncio.wait_for(call['done'], self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.pending.pop(call_id, None)
+        try:
+            await _send(origin, {'op': 'response', 'id': request['id'], 'results': call['results']})
+        except ConnectionError:
+            pass
+
+    def close(self):
+        if self.server:
+            self.server.close()
+
+class IPCClient:
+    def __init__(self, cluster_id, token, timeout):
+        self.cluster_id = cluster_id
+        self.token = token
+        self.timeout = timeout
+        self.handlers = {}
+        self.writer = None
+        self.waiting = {}
+        self.ids = itertools.count()
+
+    def handler(self, name):
+        def register(func):
+            self.handlers[name] = func
+            return func
+        return register
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def run(self, host, port):
+        # Stay connected to the hub for the life of the process
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                await _send(writer, {'op': 'hello', 'cluster': self.cluster_id, 'token': self.token})
+                self.writer = writer
+                async for line in reader:
+                    await self._dispatch(json.loads(line))
+            except (ConnectionError, OSError, ValueError) as e:
+                print(f"IPC connection lost: {e}")
+            finally:
+                self.writer = None
+                for future in self.waiting.values():
+                    if not future.done():
+                        future.set_result(None)
+            await asyncio.sleep(5)
+
+    async def _dispatch(self, message):
+        if message['op'] == 'call':
+            asyncio.ensure_future(self._answer(message))
+        elif message['op'] == 'response':
+            future = self.waiting.get(message['id'])
+            if future and not future.done():
+                future.set_result(message['results'])
+
+    async def _answer(self, message):
+        try:
+            data = await self._local(message['action'], message['args'])
+        except Exception as e:
+            print(f"IPC handler {message['action']} failed: {e}")
+            data = None
+        if self.writer:
+            await _send(self.writer, {'op': 'result', 'id': message['id'], 'data': data})
+
+    async def _local(self, action, args):
+        handler = self.handlers.get(action)
+        if handler is None:
+            return None
+        return await handler(**args)
+
+    async def broadcast(self, action, **args):
+        # Without a hub (single process) the local handler is the whole cluster
+        if not self.connected:
+            return [await self._local(action, args)]
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        try:
+            await _send(self.writer, {'op': 'request', 'id': request_id, 'action': action, 'args': args})
+            results = await asyncio.wait_for(future, self.timeout + 1)
+        except (asyncio.TimeoutError, ConnectionError):
+            results = None
+        finally:
+            self.waiting.pop(request_id, None)
+        if results is None:
+            return [await self._local(action, args)]
+        return results
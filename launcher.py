@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import urllib.request
+import config
+import ipc
+
+# ==================== CLUSTER LAUNCHER ====================
+# Starts CLUSTER_COUNT bot processes, each an AutoShardedBot owning a contiguous
+# range of shards, and hosts the IPC hub they use for cluster-wide commands.
+#
+#   CLUSTER_COUNT=4 python launcher.py
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+def recommended_shards(token):
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (launcher, 1.0)"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+def plan_clusters(shard_count, cluster_count):
+    cluster_count = max(1, min(cluster_count, shard_count))
+    per_cluster, extra = divmod(shard_count, cluster_count)
+    clusters, start = [], 0
+    for cluster_id in range(cluster_count):
+        size = per_cluster + (1 if cluster_id < extra else 0)
+        clusters.append(list(range(start, start + size)))
+        start += size
+    return clusters
+
+async def supervise(cluster_id, shard_ids, shard_count, processes):
+    env = dict(
+        os.environ,
+        CLUSTER_ID=str(cluster_id),
+        CLUSTER_SHARDS=",".join(map(str, shard_ids)),
+        SHARD_COUNT=str(shard_count),
+    )
+    while True:
+        process = await asyncio.create_subprocess_exec(sys.executable, MAIN, env=env)
+        processes[cluster_id] = process
+        print(f"🚀 Cluster {cluster_id} started (shards {shard_ids[0]}-{shard_ids[-1]}, pid {process.pid})")
+        code = await process.wait()
+        print(f"⚠️ Cluster {cluster_id} exited with {code}; restarting in 5s")
+        await asyncio.sleep(5)
+
+async def main():
+    shard_count = config.SHARD_COUNT or recommended_shards(config.BOT_TOKEN)
+    clusters = plan_clusters(shard_count, config.CLUSTER_COUNT)
+    hub = ipc.IPCHub(config.IPC_TOKEN, config.IPC_TIMEOUT)
+    await hub.start(config.IPC_HOST, config.IPC_PORT)
+    print(f"✅ {shard_count} shards across {len(clusters)} clusters")
+    processes = {}
+    supervisors = [
+        asyncio.ensure_future(supervise(cluster_id, shard_ids, shard_count, processes))
+        for cluster_id, shard_ids in enumerate(clusters)
+    ]
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    for task in supervisors:
+        task.cancel()
+    for process in processes.values():
+        if process.returncode is None:
+            process.terminate()
+    await asyncio.gather(*(process.wait() for process in processes.values()))
+    hub.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import asyncio
+import re
+
+# ==================== LOUDNESS ====================
+# EBU R128 integrated loudness and true peak are measured once per track with
+# ffmpeg's ebur128 filter, either by a background decode or as a second output
+# of the audio cache copy. The normalizer then plays the track at a fixed gain,
+# folded into the volume, so normalized playback costs the same as unfiltered
+# playback instead of running dynaudnorm's realtime analysis in every stream.
+#
+# measurement: (integrated loudness in LUFS, true peak in dBTP or None)
+
+ANALYSIS_FILTER = 'ebur128=peak=true:framelog=quiet'
+# Appended to an ffmpeg command to measure its first audio stream alongside other outputs
+ANALYSIS_OUTPUT = ('-map', '0:a:0', '-af', ANALYSIS_FILTER, '-f', 'null', '-')
+INTEGRATED_RE = re.compile(r'I:\s+(-?[\d.]+) LUFS')
+PEAK_RE = re.compile(r'Peak:\s+(-?[\d.]+|-inf) dBFS')
+SILENCE_LUFS = -70.0
+HEADROOM = -1.0  # dBTP the gain may raise the true peak to
+MAX_CUT = -20.0
+UNKNOWN_DURATION = 600  # seconds assumed for the analysis timeout when a track has no duration
+
+def parse_summary(stderr):
+    # The summary comes last; earlier matches would be per-frame lines
+    integrated = INTEGRATED_RE.findall(stderr)
+    if not integrated:
+        return None
+    lufs = float(integrated[-1])
+    peaks = PEAK_RE.findall(stderr)
+    peak = float(peaks[-1]) if peaks and peaks[-1] != '-inf' else None
+    return lufs, peak
+
+def gain(measurement, target, max_boost):
+    # Linear gain that brings the track to `target` LUFS without pushing peaks past the headroom
+    if not measurement:
+        return None
+    lufs, peak = measurement
+    if lufs <= SILENCE_LUFS:
+        return 1.0
+    change = target - lufs
+    if peak is not None:
+        change = min(change, HEADROOM - peak)
+    change = max(MAX_CUT, min(change, max_boost))
+    return round(10 ** (change / 20), 4)
+
+class LoudnessAnalyzer:
+    def __init__(self, workers=1):
+        self.semaphore = asyncio.Semaphore(workers)
+        self.pending = {}  # webpage_url -> measure task
+        self.measured = 0
+        self.failures = 0
+
+    def analyse(self, webpage_url, source, remote, duration, done):
+        # Measure `source` (a stream URL or a local file) once in the background;
+        # await done(webpage_url, measurement) is called with the result
+        if webpage_url in self.pending:
+            return
+        task = self.pending[webpage_url] = asyncio.ensure_future(
+            self._measure(webpage_url, source, remote, duration, done)
+        )
+        task.add_done_callback(lambda _: self.pending.pop(webpage_url, None))
+
+    async def _measure(self, webpage_url, source, remote, duration, done):
+        async with self.semaphore:
+            before = ('-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5') if remote else ()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-nostdin', '-hide_banner', '-nostats', *before, '-i', source, '-vn', *ANALYSIS_OUTPUT,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+            except OSError as e:
+                self.failures += 1
+                print(f"Loudness analysis failed: {e}")
+                return
+            try:
+                # Decoding runs far faster than realtime, but a stalled stream must not hold a worker forever
+                _, error = await asyncio.wait_for(process.communicate(), timeout=(duration or UNKNOWN_DURATION) * 2 + 60)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                self.failures += 1
+                print(f"Loudness analysis timed out for {webpage_url}")
+                return
+            except BaseException:
+                process.kill()
+                await process.wait()
+                raise
+            measurement = parse_summary(error.decode(errors='replace')) if process.returncode == 0 else None
+            if measurement is None:
+                self.failures += 1
+                print(f"Loudness analysis failed for {webpage_url}: {error.decode(errors='replace').strip()[-200:]}")
+                return
+            self.measured += 1
+            await done(webpage_url, measurement)
+
+    def close(self):
+        for task in self.pending.values():
+            task.cancel()
@@ -2,64 +2,203 @@ import discord
 from discord.ext import commands
 import os
 import asyncio
-import yt_dlp
-from flask import Flask
-from threading import Thread
-import random
-from collections import deque
+from threading import Thread, Lock
+import re
+import signal
+import time
+from collections import deque, OrderedDict
+from urllib.parse import urlparse, parse_qs
+import audiocache
+import config
+import ipc
+import loudness
+import metrics
+import snapshots
+import spotify
+import storage
+import tracing
+from trackqueue import TrackQueue
+import workers
+from web import WebServer
+from extractor import STRATEGIES, StrategyTracker, expand_playlist, extract_with_strategy, search_flat, warm_pools
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
-# Flask web server
-app = Flask('')
-@app.route('/')
-def home():
-    return "Bot is alive!"
-def run():
-    app.run(host='0.0.0.0', port=8080)
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
-
-# ==================== SIMPLE DATABASE (in‑memory) ====================
+# ==================== DATABASE ====================
+# Reads come from the in-memory dicts (get_prefix runs on every message). With a
+# storage backend configured, guild configs are bulk-loaded at startup, playlists
+# are read through per user, and writes are flushed in batches (write-behind).
 class Database:
-    def __init__(self):
+    def __init__(self, storage=None):
+        self.storage = storage
         self.prefixes = {}
         self.languages = {}
         self.premium = {}
         self.playlists = {}
+        self.loaded_guilds = set()
+        self.loaded_users = set()
+        self.dirty_guilds = set()
+        self.dirty_playlists = set()
+        self.matches = {}  # Spotify match key -> YouTube video id, None when storage has none
+        self.dirty_matches = set()
+        self.loudness = {}  # webpage_url -> (LUFS, true peak), None when storage has none
+        self.dirty_loudness = set()
+        self.flush_task = None
+    async def connect(self):
+        if self.storage:
+            await self.storage.connect()
+            self.flush_task = asyncio.ensure_future(self._flush_loop())
+    async def load_guilds(self, guild_ids):
+        if not self.storage:
+            return
+        guild_ids = [guild_id for guild_id in guild_ids if guild_id not in self.loaded_guilds]
+        rows = await self.storage.load_guilds(guild_ids)
+        for guild_id in guild_ids:
+            self._apply_guild(guild_id, rows.get(guild_id))
+    def _apply_guild(self, guild_id, row):
+        self.loaded_guilds.add(guild_id)
+        # Never clobber a value written since the load started
+        if row and guild_id not in self.dirty_guilds:
+            if row['prefix']:
+                self.prefixes[guild_id] = row['prefix']
+            if row['lang']:
+                self.languages[guild_id] = row['lang']
+            if row['premium']:
+                self.premium[guild_id] = True
+    async def _ensure_guild(self, guild_id):
+        if self.storage and guild_id not in self.loaded_guilds:
+            await self.load_guilds([guild_id])
+    async def _ensure_user(self, user_id):
+        if self.storage and user_id not in self.loaded_users:
+            loaded = await self.storage.load_playlists(user_id)
+            if user_id not in self.loaded_users:
+                self.loaded_users.add(user_id)
+                self.playlists.setdefault(user_id, {})
+                for name, songs in loaded.items():
+                    self.playlists[user_id].setdefault(name, songs)
+    def _touch_guild(self, guild_id):
+        self.loaded_guilds.add(guild_id)
+        self.dirty_guilds.add(guild_id)
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(config.DB_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Database flush failed: {e}")
+    async def flush(self):
+        if not self.storage or not (self.dirty_guilds or self.dirty_playlists or self.dirty_matches or self.dirty_loudness):
+            return
+        dirty_guilds, self.dirty_guilds = self.dirty_guilds, set()
+        dirty_playlists, self.dirty_playlists = self.dirty_playlists, set()
+        dirty_matches, self.dirty_matches = self.dirty_matches, set()
+        dirty_loudness, self.dirty_loudness = self.dirty_loudness, set()
+        guilds = {
+            guild_id: {
+                'prefix': self.prefixes.get(guild_id),
+                'lang': self.languages.get(guild_id),
+                'premium': self.premium.get(guild_id, False),
+            }
+            for guild_id in dirty_guilds
+        }
+        playlists = {
+            (user_id, name): list(self.playlists[user_id][name])
+            if name in self.playlists.get(user_id, {}) else None
+            for user_id, name in dirty_playlists
+        }
+        matches = {key: self.matches[key] for key in dirty_matches}
+        loudness = {url: self.loudness[url] for url in dirty_loudness}
+        try:
+            await self.storage.write(guilds, playlists, matches, loudness)
+        except BaseException:
+            # Keep the batch for the next attempt, also when the flush loop is cancelled mid-write
+            self.dirty_guilds |= dirty_guilds
+            self.dirty_playlists |= dirty_playlists
+            self.dirty_matches |= dirty_matches
+            self.dirty_loudness |= dirty_loudness
+            raise
+    async def close(self):
+        if self.flush_task:
+            flush_task, self.flush_task = self.flush_task, None
+            flush_task.cancel()
+            # A write cut short puts its batch back, so wait for that before the final flush
+            await asyncio.gather(flush_task, return_exceptions=True)
+        if self.storage:
+            await self.flush()
+            await self.storage.close()
+    def cached_prefix(self, guild_id):
+        # None means the guild's config has not been loaded from storage yet
+        if self.storage and guild_id not in self.loaded_guilds:
+            return None
+        return self.prefixes.get(guild_id, "!")
     async def get_prefix(self, guild_id):
+        if guild_id not in self.loaded_guilds:
+            await self._ensure_guild(guild_id)
         return self.prefixes.get(guild_id, "!")
     async def set_prefix(self, guild_id, prefix):
         self.prefixes[guild_id] = prefix
+        self._touch_guild(guild_id)
     async def get_lang(self, guild_id):
+        await self._ensure_guild(guild_id)
         return self.languages.get(guild_id, "en")
     async def set_lang(self, guild_id, lang):
         self.languages[guild_id] = lang
+        self._touch_guild(guild_id)
     async def is_premium(self, guild_id):
+        await self._ensure_guild(guild_id)
         return self.premium.get(guild_id, False)
     async def set_premium(self, guild_id, status):
+        await self._ensure_guild(guild_id)
         self.premium[guild_id] = status
+        self._touch_guild(guild_id)
     async def create_playlist(self, user_id, name):
+        await self._ensure_user(user_id)
         if user_id not in self.playlists:
             self.playlists[user_id] = {}
         self.playlists[user_id][name] = []
+        self.dirty_playlists.add((user_id, name))
     async def add_to_playlist(self, user_id, name, song):
+        await self._ensure_user(user_id)
         if user_id in self.playlists and name in self.playlists[user_id]:
             self.playlists[user_id][name].append(song)
+            self.dirty_playlists.add((user_id, name))
     async def get_playlist(self, user_id, name):
+        await self._ensure_user(user_id)
         if user_id in self.playlists and name in self.playlists[user_id]:
             return self.playlists[user_id][name]
         return None
     async def get_all_playlists(self, user_id):
+        await self._ensure_user(user_id)
         if user_id in self.playlists:
             return list(self.playlists[user_id].keys())
         return []
     async def delete_playlist(self, user_id, name):
+        await self._ensure_user(user_id)
         if user_id in self.playlists and name in self.playlists[user_id]:
             del self.playlists[user_id][name]
+            self.dirty_playlists.add((user_id, name))
+    async def get_matches(self, keys):
+        # One storage round trip for every key not seen yet, e.g. a whole Spotify playlist
+        missing = [key for key in dict.fromkeys(keys) if key not in self.matches]
+        if missing and self.storage:
+            rows = await self.storage.load_matches(missing)
+            for key in missing:
+                self.matches.setdefault(key, rows.get(key))
+        return {key: self.matches.get(key) for key in keys}
+    async def set_matches(self, keys, video_id):
+        for key in keys:
+            self.matches[key] = video_id
+            self.dirty_matches.add(key)
+    async def get_loudness(self, webpage_url):
+        if webpage_url not in self.loudness and self.storage:
+            rows = await self.storage.load_loudness([webpage_url])
+            self.loudness.setdefault(webpage_url, rows.get(webpage_url))
+        return self.loudness.get(webpage_url)
+    async def set_loudness(self, webpage_url, measurement):
+        self.loudness[webpage_url] = measurement
+        self.dirty_loudness.add(webpage_url)
 
-db = Database()
+db = Database(storage.create_storage(config.DB_BACKEND))
 
 # ==================== MULTI‑LANGUAGE ====================
 translations = {
@@ -68,6 +207,7 @@ translations = {
         "joined": "✅ Joined **{channel}**",
         "moved": "✅ Moved to **{channel}**",
         "searching": "🔍 **Finding:** `{query}`",
+        "search_results": "🔎 **Results for** `{query}` - pick one below",
         "not_found": "❌ **Could not find that song. Try a different search or a direct YouTube link.**",
         "added": "✅ **Added:** `{title}` ({duration})",
         "now_playing": "🎵 **Now Playing:** `{title}`",
@@ -88,15 +228,19 @@ translations = {
         "invalid_position": "❌ Invalid position",
         "removed": "❌ Removed: `{title}`",
         "shuffled": "🔀 **Queue shuffled**",
+        "moved_track": "↕️ Moved `{title}` to position **{position}**",
         "not_enough": "❌ Not enough songs to shuffle",
         "playlist_created": "✅ Playlist **{name}** created!",
         "playlist_deleted": "✅ Playlist **{name}** deleted!",
         "playlist_added": "✅ Added to playlist **{name}**",
         "playlist_loaded": "✅ Loaded playlist **{name}** into queue",
+        "playlist_expanding": "📜 **Reading playlist...**",
+        "playlist_queued": "✅ Queued **{count}** tracks from **{name}**",
         "no_playlists": "📭 You have no playlists",
         "playlists_list": "📋 Your playlists: {list}",
         "prefix_changed": "✅ Prefix changed to `{prefix}`",
         "language_changed": "✅ Language set to **{lang}**",
+        "spotify_disabled": "❌ Spotify links are not configured on this bot",
         "247_enabled": "✅ 24/7 mode enabled for this server",
         "247_disabled": "✅ 24/7 mode disabled",
         "setup_complete": "✅ Premium setup complete!",
@@ -106,6 +250,7 @@ translations = {
         "joined": "✅ Unido a **{channel}**",
         "moved": "✅ Movido a **{channel}**",
         "searching": "🔍 **Buscando:** `{query}`",
+        "search_results": "🔎 **Resultados para** `{query}` - elige uno abajo",
         "not_found": "❌ **No se pudo encontrar esa canción.**",
         "added": "✅ **Añadido:** `{title}` ({duration})",
         "now_playing": "🎵 **Reproduciendo:** `{title}`",
@@ -126,15 +271,19 @@ translations = {
         "invalid_position": "❌ Posición inválida",
         "removed": "❌ Eliminado: `{title}`",
         "shuffled": "🔀 **Cola mezclada**",
+        "moved_track": "↕️ `{title}` movido a la posición **{position}**",
         "not_enough": "❌ No hay suficientes canciones para mezclar",
         "playlist_created": "✅ ¡Lista **{name}** creada!",
         "playlist_deleted": "✅ ¡Lista **{name}** eliminada!",
         "playlist_added": "✅ Añadido a la lista **{name}**",
         "playlist_loaded": "✅ Lista **{name}** cargada en la cola",
+        "playlist_expanding": "📜 **Leyendo la lista...**",
+        "playlist_queued": "✅ **{count}** canciones de **{name}** en la cola",
         "no_playlists": "📭 No tienes listas",
         "playlists_list": "📋 Tus listas: {list}",
         "prefix_changed": "✅ Prefijo cambiado a `{prefix}`",
         "language_changed": "✅ Idioma cambiado a **{lang}**",
+        "spotify_disabled": "❌ Los enlaces de Spotify no están configurados en este bot",
         "247_enabled": "✅ Modo 24/7 activado",
         "247_disabled": "✅ Modo 24/7 desactivado",
         "setup_complete": "✅ Configuración Premium completada",
@@ -148,112 +297,701 @@ def get_text(guild_id, key, **kwargs):
         text = text.format(**kwargs)
     return text
 
+# ==================== OUTBOUND MESSAGES ====================
+MESSAGE_LIMIT = 2000
+
+class ChannelOutbox:
+    def __init__(self, channel):
+        self.channel = channel
+        self.pending = []            # (text, transient); at most one transient entry
+        self.status_message = None   # last message sent as a transient status, replaced by the next flush
+        self.status_expires = 0.0    # monotonic time after which the status is left alone
+        self.tokens = config.OUTBOX_BURST
+        self.updated = time.monotonic()
+        self.task = None
+
+class Outbox:
+    # Replies to the same channel within OUTBOX_WINDOW are joined into one message.
+    # A transient status ("searching...") is edited into whatever comes next instead
+    # of leaving a message behind. Each channel gets a token bucket matching
+    # Discord's per-channel send limit, so bursts wait here instead of earning 429s.
+    def __init__(self):
+        self.channels = {}
+        self.sent = 0
+        self.edited = 0
+        self.merged = 0
+        self.replaced = 0
+        self.dropped = 0
+        self.throttled = 0
+
+    def send(self, channel, text, transient=False):
+        box = self.channels.get(channel.id)
+        if box is None:
+            box = self.channels[channel.id] = ChannelOutbox(channel)
+        box.channel = channel
+        if transient:
+            for index, (_, was_transient) in enumerate(box.pending):
+                if was_transient:
+                    del box.pending[index]
+                    self.replaced += 1
+                    break
+        box.pending.append((text, transient))
+        if len(box.pending) > config.OUTBOX_MAX_PENDING:
+            box.pending.pop(0)
+            self.dropped += 1
+        if box.task is None:
+            box.task = asyncio.ensure_future(self._drain(box))
+
+    def _take_token(self, box):
+        now = time.monotonic()
+        rate = config.OUTBOX_BURST / config.OUTBOX_PER
+        box.tokens = min(config.OUTBOX_BURST, box.tokens + (now - box.updated) * rate)
+        box.updated = now
+        if box.tokens >= 1:
+            box.tokens -= 1
+            return 0
+        return (1 - box.tokens) / rate
+
+    def budget(self, channel_id):
+        # Sends the channel's bucket allows right now, refilled but not spent
+        box = self.channels.get(channel_id)
+        if box is None:
+            return config.OUTBOX_BURST
+        rate = config.OUTBOX_BURST / config.OUTBOX_PER
+        return int(min(config.OUTBOX_BURST, box.tokens + (time.monotonic() - box.updated) * rate))
+
+    async def _drain(self, box):
+        try:
+            await asyncio.sleep(config.OUTBOX_WINDOW)
+            while box.pending:
+                wait = self._take_token(box)
+                if wait:
+                    self.throttled += 1
+                    await asyncio.sleep(wait)
+                    continue
+                batch = [box.pending.pop(0)]
+                length = len(batch[0][0])
+                while box.pending and length + 1 + len(box.pending[0][0]) <= MESSAGE_LIMIT:
+                    length += 1 + len(box.pending[0][0])
+                    batch.append(box.pending.pop(0))
+                self.merged += len(batch) - 1
+                content = "\n".join(text for text, _ in batch)[:MESSAGE_LIMIT]
+                transient = all(was_transient for _, was_transient in batch)
+                await self._deliver(box, content, transient)
+        finally:
+            box.task = None
+
+    async def acquire(self, channel):
+        # For callers that talk to the channel directly (the now-playing panel) so they share the bucket
+        box = self.channels.get(channel.id)
+        if box is None:
+            box = self.channels[channel.id] = ChannelOutbox(channel)
+        while True:
+            wait = self._take_token(box)
+            if not wait:
+                return
+            self.throttled += 1
+            await asyncio.sleep(wait)
+
+    async def _deliver(self, box, content, transient):
+        # A status left behind by a finished command is not edited into a later, unrelated reply
+        if box.status_message and time.monotonic() > box.status_expires:
+            box.status_message = None
+        try:
+            if box.status_message:
+                try:
+                    await box.status_message.edit(content=content)
+                    self.edited += 1
+                    message = box.status_message
+                except discord.NotFound:
+                    message = await box.channel.send(content)
+                    self.sent += 1
+            else:
+                message = await box.channel.send(content)
+                self.sent += 1
+        except discord.HTTPException as e:
+            print(f"Message to {box.channel.id} dropped: {e}")
+            self.dropped += 1
+            message = None
+        box.status_message = message if transient else None
+        box.status_expires = time.monotonic() + config.OUTBOX_STATUS_TTL
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'edited': self.edited,
+            'merged': self.merged,
+            'replaced': self.replaced,
+            'dropped': self.dropped,
+            'throttled': self.throttled,
+        }
+
+outbox = Outbox()
+
+async def reply(ctx, key, transient=False, **kwargs):
+    outbox.send(ctx.channel, get_text(ctx.guild.id, key, **kwargs), transient)
+
 # ==================== MUSIC PLAYER ====================
 class MusicPlayer:
     def __init__(self, guild_id):
         self.guild_id = guild_id
-        self.queue = deque()
+        self.queue = TrackQueue()
         self.current = None
         self.loop = False
         self.loop_queue = False
-        self.volume = 0.5
+        # Passthrough can only copy Opus packets at full volume
+        self.volume = 1.0 if config.OPUS_PASSTHROUGH else 0.5
         self.filter = None
         self.vc = None
         self.text_channel = None
         self._24_7 = False
+        self.lock = asyncio.Lock()
+        self.source = None
+        self.next_task = None
+        self.next_source = None
+        self.resume_at = 0.0
+        self.control_messages = deque()
+        self.panel = NowPlayingPanel(self)
 
-players = {}
+    @property
+    def position(self):
+        return self.source.position if self.source else 0.0
 
-# ==================== IMPROVED YT‑DLP ====================
-USER_AGENTS = [
-    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
-    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-]
-
-BASE_YTDL_OPTS = {
-    'format': 'bestaudio/best',
-    'quiet': True,
-    'no_warnings': True,
-    'ignoreerrors': True,
-    'nocheckcertificate': True,
-    'extract_flat': False,
-    'source_address': '0.0.0.0',
-    'extractor_args': {
-        'youtube': {
-            'skip': ['dash', 'hls', 'webpage'],
-        }
-    }
-}
+    def discard_next(self):
+        if self.next_source:
+            self.next_source[1].cleanup()
+            self.next_source = None
+
+    def take_next(self, song):
+        # Hand over the pre-spawned source only if it still belongs to the track about to play
+        prepared, self.next_source = self.next_source, None
+        if (prepared and prepared[0] is song and prepared[1].baked_volume in (None, self.volume)
+                and prepared[1].audio_filter == self.filter):
+            return prepared[1]
+        if prepared:
+            prepared[1].cleanup()
+        return None
+
+    def close(self):
+        if self.next_task:
+            self.next_task.cancel()
+            self.next_task = None
+        self.discard_next()
+        for message_id in self.control_messages:
+            control_messages.pop(message_id, None)
+        self.control_messages.clear()
+        self.panel.close()
+
+    def refresh_next(self):
+        # The head of the queue changed: drop the pre-buffered source and start preparing again
+        self.discard_next()
+        if self.next_task:
+            self.next_task.cancel()
+            self.next_task = None
+        if self.current and self.source:
+            self.next_task = asyncio.ensure_future(prepare_next(self))
+
+players = {}
 
+# ==================== FFMPEG ====================
 FFMPEG_OPTIONS = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn'
 }
+FRAME_SECONDS = 0.02
 
-def extract_audio(query):
-    strategies = [
-        lambda q: _extract_with_opts(q, {'user_agent': random.choice(USER_AGENTS)}),
-        lambda q: _extract_with_opts(q, {'extractor_args': {'youtube': {'player_client': ['android']}}}),
-        lambda q: _extract_with_opts(q, {'format': 'bestaudio[ext=m4a]'}),
-        lambda q: _extract_with_opts(q, {'force_generic_extractor': True}),
-    ]
-    for strat in strategies:
+class PlayerSource(discord.AudioSource):
+    # Counts frames for the playback position and can read ahead into memory so
+    # the next track's ffmpeg is connected and probed before it is needed.
+    live = set()  # sources whose ffmpeg has not been cleaned up yet
+
+    def __init__(self, original, start=0.0, baked_volume=None, audio_filter=None, speed=1.0, local=False, gain=1.0):
+        self.original = original
+        self.start = start
+        self.local = local  # reading a file from the audio cache
+        self.gain = gain  # loudness correction applied on top of the player volume
+        self.baked_volume = baked_volume
+        self.audio_filter = audio_filter
+        self.speed = speed
+        self.frames = 0
+        self.buffer = deque()
+        self.lock = Lock()
+        self.filling = False
+        self.first_frame = None  # callback(ok) for tracing time to first audio
+        PlayerSource.live.add(self)
+
+    @property
+    def position(self):
+        return self.start + self.frames * FRAME_SECONDS * self.speed
+
+    def prebuffer(self, seconds):
+        self.filling = True
+        Thread(target=self._fill, args=(int(seconds / FRAME_SECONDS),), daemon=True).start()
+
+    def _fill(self, target):
+        while self.filling and len(self.buffer) < target:
+            with self.lock:
+                frame = self.original.read()
+                if not frame:
+                    break
+                self.buffer.append(frame)
+        self.filling = False
+
+    def read(self):
+        self.filling = False
+        with self.lock:
+            frame = self.buffer.popleft() if self.buffer else self.original.read()
+        if frame:
+            if self.first_frame:
+                self.first_frame, callback = None, self.first_frame
+                callback(True)
+            self.frames += 1
+        return frame
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.filling = False
+        self.buffer.clear()
+        self.original.cleanup()
+        PlayerSource.live.discard(self)
+        if self.first_frame:
+            self.first_frame, callback = None, self.first_frame
+            callback(False)
+
+OPUS_ITAGS = {'249', '250', '251'}
+
+def is_opus_stream(url):
+    params = parse_qs(urlparse(url).query)
+    return params.get('itag', [''])[0] in OPUS_ITAGS or params.get('mime', [''])[0] == 'audio/webm'
+
+AUDIO_FILTERS = {
+    'bass': 'bass=g=10',
+    'treble': 'treble=g=10',
+    # Only until the track's loudness is measured; after that a fixed gain does the job
+    'normalizer': 'dynaudnorm',
+    'vaporwave': 'aresample=44100,asetrate=44100*0.8,aresample=44100,atempo=1.25',
+    'nightcore': 'aresample=44100,asetrate=44100*1.25,aresample=44100,atempo=1.0',
+    'slow': 'atempo=0.8',
+    'fast': 'atempo=1.5',
+    'echo': 'aecho=0.8:0.9:1000:0.3',
+    'reverb': 'aecho=0.8:0.88:60:0.4',
+}
+# How much track time passes per second of output, for filters that change tempo
+FILTER_SPEEDS = {'nightcore': 1.25, 'slow': 0.8, 'fast': 1.5}
+
+def build_source(song, player, start=0.0):
+    volume = player.volume
+    # A cached copy is a local Ogg Opus file: no reconnect options, nothing to throttle
+    local = audio_cache.path(song) if audio_cache else None
+    url = local or song['url']
+    before_options = "" if local else FFMPEG_OPTIONS['before_options']
+    if start:
+        # Input-side seek: ffmpeg jumps with a range request instead of decoding up to the offset
+        before_options = f"-ss {start:.2f} {before_options}".rstrip()
+    gain = 1.0
+    if player.filter == 'normalizer' and song.get('gain') is not None:
+        # Measured loudness: a fixed gain on the volume instead of a realtime filter
+        gain = song['gain']
+        graph = []
+    else:
+        graph = [AUDIO_FILTERS[player.filter]] if player.filter else []
+    speed = FILTER_SPEEDS.get(player.filter, 1.0)
+    if config.OPUS_PASSTHROUGH and volume * gain == 1.0 and not graph and (local or is_opus_stream(url)):
+        # Hand Opus packets to the voice client as-is. Only a packet copy pays off: at any
+        # other volume, or with a filter, an ffmpeg libopus re-encode costs more CPU than
+        # the PCM path below, so those play as PCM (players start at 100% in this mode).
+        original = discord.FFmpegOpusAudio(
+            url, codec='opus', before_options=before_options, options=FFMPEG_OPTIONS['options']
+        )
+        return PlayerSource(
+            original, start, baked_volume=volume, audio_filter=player.filter, speed=speed, local=bool(local), gain=gain
+        )
+    options = FFMPEG_OPTIONS['options']
+    if graph:
+        options = f"{options} -af {','.join(graph)}"
+    original = discord.FFmpegPCMAudio(url, before_options=before_options, options=options)
+    return PlayerSource(original, start, audio_filter=player.filter, speed=speed, local=bool(local), gain=gain)
+
+def wrap_volume(source, volume):
+    if source.is_opus():
+        return source
+    return discord.PCMVolumeTransformer(source, volume=volume * source.gain)
+
+def restart_source(player):
+    # Swap in a new ffmpeg at the current position without ending the track
+    if not player.current or not player.source or not player.vc:
+        return
+    if not (player.vc.is_playing() or player.vc.is_paused()):
+        return
+    old = player.source
+    # Swapping the source resumes discord.py's player, so a paused track is paused again right after
+    was_paused = player.vc.is_paused()
+    player.source = build_source(player.current, player, player.position)
+    player.vc.source = wrap_volume(player.source, player.volume)
+    if was_paused:
+        player.vc.pause()
+    # The voice thread may still be inside old.read(); give it a moment before killing ffmpeg
+    bot.loop.call_later(1, old.cleanup)
+
+def set_volume(player, volume):
+    player.volume = volume
+    if isinstance(player.vc.source, discord.PCMVolumeTransformer):
+        player.vc.source.volume = volume * (player.source.gain if player.source else 1.0)
+    elif player.source and player.source.baked_volume != volume:
+        restart_source(player)
+
+# ==================== RESOLUTION CACHE ====================
+YOUTUBE_ID_RE = re.compile(r'(?:youtu\.be/|youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/))([\w-]{11})')
+
+def normalize_query(query):
+    query = query.strip()
+    if not query.startswith(('http://', 'https://')):
+        return " ".join(query.lower().split())
+    match = YOUTUBE_ID_RE.search(query)
+    if match:
+        return f"https://www.youtube.com/watch?v={match.group(1)}"
+    return query
+
+def stream_expiry(url):
+    # googlevideo URLs carry their own deadline, either as ?expire= or /expire/<ts>/
+    parsed = urlparse(url)
+    expire = parse_qs(parsed.query).get('expire', [None])[0]
+    if expire is None:
+        parts = parsed.path.split('/')
+        if 'expire' in parts and parts.index('expire') + 1 < len(parts):
+            expire = parts[parts.index('expire') + 1]
+    try:
+        return float(expire)
+    except (TypeError, ValueError):
+        return time.time() + config.STREAM_DEFAULT_TTL
+
+class ResolutionCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.aliases = OrderedDict()   # normalized query -> webpage_url
+        self.tracks = OrderedDict()    # webpage_url -> title/duration/source metadata
+        self.streams = {}              # webpage_url -> (stream url, expires at)
+        self.inflight = {}
+        self.waiters = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.merged = 0
+
+    def _fresh_stream(self, webpage_url):
+        stream = self.streams.get(webpage_url)
+        if stream and stream[1] - config.STREAM_EXPIRY_MARGIN > time.time():
+            return stream
+        return None
+
+    def _remember(self, key, url, title, duration, source, webpage_url):
+        webpage_url = normalize_query(webpage_url) if webpage_url else key
+        self.aliases[key] = webpage_url
+        self.aliases.move_to_end(key)
+        self.aliases[webpage_url] = webpage_url
+        self.aliases.move_to_end(webpage_url)
+        self.tracks[webpage_url] = {'title': title, 'duration': duration, 'source': source, 'webpage_url': webpage_url}
+        self.tracks.move_to_end(webpage_url)
+        self.streams[webpage_url] = (url, stream_expiry(url))
+        while len(self.aliases) > self.max_entries:
+            self.aliases.popitem(last=False)
+        while len(self.tracks) > self.max_entries:
+            evicted, _ = self.tracks.popitem(last=False)
+            self.streams.pop(evicted, None)
+            self.evictions += 1
+        return webpage_url
+
+    def lookup(self, query):
+        key = normalize_query(query)
+        webpage_url = self.aliases.get(key)
+        if not webpage_url or webpage_url not in self.tracks:
+            return None
+        stream = self._fresh_stream(webpage_url)
+        if not stream:
+            return None
+        self.aliases.move_to_end(key)
+        self.tracks.move_to_end(webpage_url)
+        return dict(self.tracks[webpage_url], url=stream[0], expire=stream[1])
+
+    async def resolve(self, query):
+        track = self.lookup(query)
+        if track:
+            self.hits += 1
+            return track
+        key = normalize_query(query)
+        # Known track with an expired stream: re-extract the page URL directly and skip the search
+        target = self.aliases.get(key) or key
+        task = self.inflight.get(target)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(key, target))
+            self.inflight[target] = task
+            task.add_done_callback(lambda _: self.inflight.pop(target, None))
+        else:
+            self.merged += 1
+        self.waiters[target] = self.waiters.get(target, 0) + 1
         try:
-            result = strat(query)
-            if result and result[0]:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Only abandon the extraction once every merged requester has gone away
+            if self.waiters[target] == 1:
+                task.cancel()
+            raise
+        finally:
+            self.waiters[target] -= 1
+            if not self.waiters[target]:
+                del self.waiters[target]
+
+    async def _fetch(self, key, target):
+        start = time.monotonic()
+        if spotify.parse_url(target):
+            # A Spotify track queued before it was matched: play its YouTube match
+            target = await spotify_video(target)
+            if not target:
+                return None
+        if config.FLAT_SEARCH and not target.startswith(('http://', 'https://')):
+            url, title, duration, source, webpage_url = await self._search_and_extract(target)
+        else:
+            url, title, duration, source, webpage_url = await extract_audio(target)
+        extract_latency.observe(time.monotonic() - start)
+        if not url:
+            return None
+        webpage_url = self._remember(key, url, title, duration, source, webpage_url)
+        return dict(self.tracks[webpage_url], url=url, expire=self.streams[webpage_url][1])
+
+    async def _search_and_extract(self, query):
+        # Flat search for candidates, then fully extract only the one being played
+        for candidate in (await searches.search(query))[:3]:
+            result = await extract_audio(candidate['webpage_url'])
+            if result[0]:
                 return result
-        except Exception as e:
-            print(f"Strategy failed: {e}")
-            continue
-    return None, None, None, None
+        # No usable candidate (or the flat search failed): fall back to a full ytsearch
+        return await extract_audio(query)
+
+    def stats(self):
+        return {
+            'entries': len(self.tracks),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'merged': self.merged,
+        }
 
-def _extract_with_opts(query, extra_opts):
-    opts = BASE_YTDL_OPTS.copy()
-    opts.update(extra_opts)
-    ydl = yt_dlp.YoutubeDL(opts)
+SEARCH_WORD_RE = re.compile(r"\w+")
 
-    if not query.startswith(('http://', 'https://')):
-        search_query = f"ytsearch3:{query}"
-        info = ydl.extract_info(search_query, download=False)
-        if info and 'entries' in info:
-            for entry in info['entries']:
-                if entry:
-                    url, title, dur, src = _extract_from_info(entry)
-                    if url:
-                        return url, title, dur, src
-        return None, None, None, None
-    else:
-        info = ydl.extract_info(query, download=False)
-        return _extract_from_info(info)
-
-def _extract_from_info(info):
-    if not info:
-        return None, None, None, None
-    audio_url = info.get('url')
-    if not audio_url and 'formats' in info:
-        for f in info['formats']:
-            if f.get('vcodec') == 'none' and f.get('acodec') != 'none':
-                audio_url = f.get('url')
-                break
-    title = info.get('title', 'Unknown')
-    duration = info.get('duration', 0)
-    webpage_url = info.get('webpage_url', '')
-    source = "YouTube"
-    if 'spotify.com' in webpage_url:
-        source = "Spotify"
-    elif 'soundcloud.com' in webpage_url:
-        source = "SoundCloud"
-    elif 'deezer.com' in webpage_url:
-        source = "Deezer"
-    elif 'twitch.tv' in webpage_url:
-        source = "Twitch"
-    elif 'apple.com' in webpage_url:
-        source = "Apple Music"
-    elif 'bandcamp.com' in webpage_url:
-        source = "Bandcamp"
-    return audio_url, title, duration, source
+def search_key(query):
+    # Word order, case and punctuation do not change what YouTube returns much
+    return " ".join(sorted(set(SEARCH_WORD_RE.findall(query.lower()))))
+
+class SearchCache:
+    # LRU of flat search results: query -> candidates (page URL, title, duration, channel)
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.results = OrderedDict()  # key -> (candidates, expires at)
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query):
+        key = search_key(query)
+        entry = self.results.get(key)
+        if not entry or entry[1] < time.time():
+            return None
+        self.results.move_to_end(key)
+        return entry[0]
+
+    async def search(self, query):
+        candidates = self.lookup(query)
+        if candidates is not None:
+            self.hits += 1
+            return candidates
+        key = search_key(query)
+        task = self.inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self.inflight[key] = asyncio.ensure_future(self._fetch(key, query))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, query):
+        with tracer.span('search_flat'):
+            try:
+                candidates = await extraction.run(search_flat, query, config.SEARCH_RESULTS)
+            except (asyncio.TimeoutError, workers.ExtractionError) as e:
+                print(f"Flat search failed for {query!r}: {e!r}")
+                return []
+        if candidates:
+            self.results[key] = (candidates, time.time() + self.ttl)
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+        return candidates
+
+    def stats(self):
+        return {'entries': len(self.results), 'hits': self.hits, 'misses': self.misses}
+
+# ==================== METRICS ====================
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60)
+registry = metrics.Registry()
+extract_latency = registry.register(metrics.Histogram(
+    "musicbot_extract_seconds", "Time to resolve a query to a stream, all strategies included", LATENCY_BUCKETS
+))
+strategy_latency = registry.register(metrics.Histogram(
+    "musicbot_strategy_seconds", "Time spent in one extraction strategy", LATENCY_BUCKETS, ('strategy', 'result')
+))
+strategy_attempts = registry.register(metrics.Counter(
+    "musicbot_strategy_attempts_total", "Extraction strategy attempts", ('strategy', 'result')
+))
+loop_lag = registry.register(metrics.Histogram(
+    "musicbot_event_loop_lag_seconds", "How late the event loop wakes a periodic timer",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+))
+lag_monitor = metrics.LoopLagMonitor(loop_lag)
+tracer = tracing.Tracer(config.TRACING, config.TRACE_KEEP, config.TRACE_EXPORT)
+
+# ==================== ADAPTIVE EXTRACTION ====================
+async def _run_strategy(query, name):
+    start = time.monotonic()
+    # The extraction itself runs in a worker, so it is timed from here
+    with tracer.span('_extract_with_opts', strategy=name) as span:
+        try:
+            result = await extraction.run(extract_with_strategy, query, name)
+        except (asyncio.TimeoutError, workers.ExtractionError) as e:
+            print(f"Strategy {name} failed for {query!r}: {e!r}")
+            result = (None, None, None, None, None)
+        span.set(ok=bool(result[0]))
+    elapsed = time.monotonic() - start
+    strategy_tracker.record(name, bool(result[0]), elapsed)
+    outcome = 'ok' if result[0] else 'fail'
+    strategy_latency.observe(elapsed, name, outcome)
+    strategy_attempts.inc(name, outcome)
+    return result
+
+async def extract_audio(query):
+    # Strategies run best-first by observed success rate and latency. In hedged
+    # mode the next one starts when the current one overruns its usual latency.
+    with tracer.span('extract_audio', hedged=config.HEDGE_EXTRACTION):
+        return await _extract_audio(query)
+
+async def _extract_audio(query):
+    order = strategy_tracker.ranked()
+    running = {}
+    launched = 0
+    def launch():
+        nonlocal launched
+        task = asyncio.ensure_future(_run_strategy(query, order[launched]))
+        running[task] = order[launched]
+        launched += 1
+    launch()
+    try:
+        while running:
+            timeout = None
+            if config.HEDGE_EXTRACTION and len(running) == 1 and launched < len(order):
+                timeout = strategy_tracker.deadline(
+                    next(iter(running.values())), config.HEDGE_PERCENTILE, config.HEDGE_MIN_SAMPLES
+                )
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for task in done:
+                running.pop(task)
+                result = task.result()
+                if result[0]:
+                    return result
+            if not running and launched < len(order):
+                launch()
+        return None, None, None, None, None
+    finally:
+        for task in running:
+            task.cancel()
+
+strategy_tracker = StrategyTracker(STRATEGIES, config.STRATEGY_WINDOW)
+extraction = workers.create_backend(
+    config.EXTRACT_BACKEND, config.EXTRACT_WORKERS, config.EXTRACT_TIMEOUT, config.EXTRACT_MAX_JOBS,
+    initializer=warm_pools,
+)
+resolver = ResolutionCache(config.RESOLVE_CACHE_SIZE)
+searches = SearchCache(config.SEARCH_CACHE_SIZE, config.SEARCH_CACHE_TTL)
+spotify_client = spotify.create_client()
+audio_cache = audiocache.AudioCache(
+    config.AUDIO_CACHE_DIR if config.CLUSTER_ID is None else os.path.join(config.AUDIO_CACHE_DIR, f"cluster-{config.CLUSTER_ID}"),
+    config.AUDIO_CACHE_MAX_MB * 2**20, config.AUDIO_CACHE_THRESHOLD, config.AUDIO_CACHE_MAX_DURATION,
+    config.AUDIO_CACHE_WORKERS,
+) if config.AUDIO_CACHE else None
+loudness_analyzer = loudness.LoudnessAnalyzer(config.LOUDNESS_WORKERS)
+
+# ==================== SPOTIFY MATCHING ====================
+# Each Spotify track is matched to a YouTube video once per deployment: the match
+# is stored under its ISRC and artist + title keys, and every later play (in any
+# guild or cluster sharing the database) reads it back instead of searching.
+spotify_stats = {'cached': 0, 'searched': 0, 'failed': 0}
+
+def youtube_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def pick_match(track, candidates):
+    # Among results close to the Spotify length, prefer auto-generated "Artist - Topic"
+    # uploads (the label's own audio), then search rank; otherwise the closest length
+    def score(item):
+        rank, candidate = item
+        off = abs((candidate['duration'] or 0) - track['duration'])
+        if off > config.SPOTIFY_MATCH_TOLERANCE:
+            return (1, off)
+        return (0, not (candidate['channel'] or "").endswith(" - Topic"), rank)
+    playable = [(rank, candidate) for rank, candidate in enumerate(candidates)
+                if YOUTUBE_ID_RE.search(candidate['webpage_url'] or "")]
+    best = min(playable, key=score, default=None)
+    return best[1] if best else None
+
+async def match_track(track):
+    # -> YouTube video id, or None when nothing playable was found
+    keys = spotify.match_keys(track)
+    known = await db.get_matches(keys)
+    for key in keys:
+        if known[key]:
+            spotify_stats['cached'] += 1
+            return known[key]
+    with tracer.span('spotify_match', isrc=bool(track['isrc'])) as span:
+        best = pick_match(track, await searches.search(spotify.search_query(track)))
+        span.set(ok=best is not None)
+    if not best:
+        spotify_stats['failed'] += 1
+        return None
+    spotify_stats['searched'] += 1
+    video_id = YOUTUBE_ID_RE.search(best['webpage_url']).group(1)
+    await db.set_matches(keys, video_id)
+    return video_id
+
+async def spotify_video(url):
+    # Spotify track URL -> YouTube watch URL of its match
+    parsed = spotify.parse_url(url)
+    if spotify_client is None or not parsed or parsed[0] != 'track':
+        return None
+    try:
+        tracks = await spotify_client.tracks([parsed[1]])
+    except Exception as e:
+        print(f"Spotify lookup failed for {url!r}: {e!r}")
+        return None
+    video_id = await match_track(tracks[0]) if tracks else None
+    return youtube_url(video_id) if video_id else None
+
+def spotify_song(track, video_id, requester):
+    # Shown with Spotify's metadata; a track not matched yet keeps its Spotify URL
+    # and is matched by the resolver shortly before it plays
+    return {
+        'webpage_url': youtube_url(video_id) if video_id else spotify.track_url(track['id']),
+        'title': f"{', '.join(track['artists'][:2])} - {track['title']}",
+        'duration': track['duration'],
+        'source': "Spotify",
+        'requester': requester
+    }
+
+QUEUE_PAGE_SIZE = 10
+PROGRESS_WIDTH = 20
 
 def format_duration(seconds):
     if not seconds:
@@ -267,52 +1005,656 @@ def format_duration(seconds):
     else:
         return f"{minutes}:{seconds:02d}"
 
+def format_position(seconds):
+    # Like format_duration, but zero is a time, not a live stream
+    return format_duration(int(seconds)) if seconds >= 1 else "0:00"
+
+def make_song(track, requester):
+    # Queue entries keep the stable page URL; the signed stream URL is resolved just in time
+    return {
+        'webpage_url': track['webpage_url'],
+        'title': track['title'],
+        'duration': track['duration'],
+        'source': track['source'],
+        'requester': requester
+    }
+
+def stream_is_fresh(song):
+    return bool(song.get('url')) and song.get('expire', 0) - config.STREAM_EXPIRY_MARGIN > time.time()
+
+async def resolve_stream(song):
+    if stream_is_fresh(song):
+        return song['url']
+    track = await resolver.resolve(song['webpage_url'])
+    if not track:
+        return None
+    song['url'] = track['url']
+    song['expire'] = track['expire']
+    return song['url']
+
+async def remember_loudness(webpage_url, measurement):
+    await db.set_loudness(webpage_url, measurement)
+
+if audio_cache:
+    # Copies into the audio cache measure loudness on the side
+    audio_cache.on_loudness = remember_loudness
+
+async def load_gain(song, player):
+    # With the normalizer on, give the song its measured gain, or start measuring it
+    # so a later play has one; until then build_source falls back to dynaudnorm
+    if player.filter != 'normalizer' or song.get('gain') is not None:
+        return
+    measurement = await db.get_loudness(song['webpage_url'])
+    if measurement:
+        song['gain'] = loudness.gain(measurement, config.LOUDNESS_TARGET, config.LOUDNESS_MAX_BOOST)
+        return
+    local = audio_cache.path(song) if audio_cache and audio_cache.contains(song) else None
+    if local or stream_is_fresh(song):
+        loudness_analyzer.analyse(
+            song['webpage_url'], local or song['url'], not local, song.get('duration'), remember_loudness
+        )
+
+async def ensure_playable(song):
+    # A track in the audio cache plays from disk; anything else needs a fresh stream URL
+    if audio_cache and audio_cache.contains(song):
+        return True
+    return bool(await resolve_stream(song))
+
+UNAVAILABLE_TITLES = {'[Private video]', '[Deleted video]', '[Unavailable video]'}
+
+def is_playlist_url(query):
+    if not query.startswith(('http://', 'https://')):
+        return False
+    parsed = urlparse(query)
+    return 'list' in parse_qs(parsed.query) or parsed.path.rstrip('/').endswith('/playlist')
+
+async def enqueue_playlist(ctx, player, url):
+    # Queue a playlist or mix as unresolved page URLs. The first page goes in (and
+    # starts playing) as soon as it is listed; the rest follows in one flat listing.
+    # Streams are resolved by prepare_next/play_next shortly before each track plays.
+    guild_id = ctx.guild.id
+    progress = await ctx.send(get_text(guild_id, "playlist_expanding"))
+    title = None
+    added = 0
+    listed = 0
+    while listed < config.PLAYLIST_MAX_TRACKS:
+        want = config.PLAYLIST_PAGE_SIZE if listed == 0 else config.PLAYLIST_MAX_TRACKS - listed
+        with tracer.span('expand_playlist', start=listed) as span:
+            try:
+                name, entries, walked = await extraction.run(expand_playlist, url, listed, listed + want)
+            except (asyncio.TimeoutError, workers.ExtractionError) as e:
+                print(f"Playlist expansion failed for {url!r}: {e!r}")
+                name, entries, walked = None, [], 0
+            span.set(entries=len(entries))
+        if players.get(guild_id) is not player:
+            return
+        title = title or name
+        # Counted in raw playlist positions, so skipped entries neither end the listing
+        # early nor shift where the next one starts
+        listed += walked
+        songs = [make_song(entry, ctx.author.name) for entry in entries if entry['title'] not in UNAVAILABLE_TITLES]
+        for i in range(0, len(songs), config.PLAYLIST_PAGE_SIZE):
+            player.queue.extend(songs[i:i + config.PLAYLIST_PAGE_SIZE])
+            # Let other guilds run between pages of a long listing
+            await asyncio.sleep(0)
+        added += len(songs)
+        if player.vc and not player.vc.is_playing() and not player.vc.is_paused() and player.queue:
+            await play_next(ctx, guild_id)
+        if walked < want:
+            break
+    if not added:
+        content = get_text(guild_id, "not_found")
+    else:
+        capped = f" (first {config.PLAYLIST_MAX_TRACKS})" if listed >= config.PLAYLIST_MAX_TRACKS else ""
+        content = get_text(guild_id, "playlist_queued", count=added, name=title) + capped
+    try:
+        await progress.edit(content=content)
+    except discord.HTTPException:
+        await ctx.send(content)
+
+async def enqueue_spotify(ctx, player, url):
+    # Metadata for the whole link arrives in bulk and known matches in one storage
+    # read, so a large playlist is queued without a single YouTube search up front
+    guild_id = ctx.guild.id
+    kind, item_id = spotify.parse_url(url)
+    if spotify_client is None:
+        await reply(ctx, "spotify_disabled")
+        return
+    progress = await ctx.send(get_text(guild_id, "playlist_expanding")) if kind != 'track' else None
+    with tracer.span('spotify_metadata', kind=kind) as span:
+        try:
+            name, tracks = await spotify_client.resolve(kind, item_id, config.PLAYLIST_MAX_TRACKS)
+        except Exception as e:
+            print(f"Spotify lookup failed for {url!r}: {e!r}")
+            name, tracks = None, []
+        span.set(tracks=len(tracks))
+    if players.get(guild_id) is not player:
+        return
+    keys = [spotify.match_keys(track) for track in tracks]
+    known = await db.get_matches([key for track_keys in keys for key in track_keys])
+    songs = [
+        spotify_song(track, next(filter(None, map(known.get, track_keys)), None), ctx.author.name)
+        for track, track_keys in zip(tracks, keys)
+    ]
+    for i in range(0, len(songs), config.PLAYLIST_PAGE_SIZE):
+        player.queue.extend(songs[i:i + config.PLAYLIST_PAGE_SIZE])
+        await asyncio.sleep(0)
+    if not songs:
+        content = get_text(guild_id, "not_found")
+    elif kind == 'track':
+        content = get_text(guild_id, "added", title=songs[0]['title'], duration=format_duration(songs[0]['duration']))
+    else:
+        content = get_text(guild_id, "playlist_queued", count=len(songs), name=name)
+    if progress is None:
+        outbox.send(ctx.channel, content)
+    else:
+        try:
+            await progress.edit(content=content)
+        except discord.HTTPException:
+            await ctx.send(content)
+    if songs and player.vc and not player.vc.is_playing() and not player.vc.is_paused():
+        await play_next(ctx, guild_id)
+
+async def wait_until_remaining(player, lead):
+    while True:
+        remaining = (player.current['duration'] or 0) - player.position
+        if remaining <= lead:
+            return
+        await asyncio.sleep(min(remaining - lead, 5))
+
+async def prepare_next(player):
+    # Runs alongside the current track: resolve the next stream ahead of time and,
+    # in gapless mode, spawn and pre-buffer its ffmpeg before the current one ends
+    if not player.current['duration']:
+        return
+    await wait_until_remaining(player, config.PREFETCH_LEAD)
+    while not player.queue:
+        await asyncio.sleep(1)
+    song = player.queue[0]
+    if not await ensure_playable(song):
+        return
+    # Measured here, ahead of time, the gain is usually known by the time the track starts
+    await load_gain(song, player)
+    if not config.GAPLESS:
+        return
+    await wait_until_remaining(player, config.GAPLESS_LEAD)
+    # Checked again: the cached copy may have been evicted while waiting
+    if not player.queue or player.queue[0] is not song or not await ensure_playable(song):
+        return
+    player.discard_next()
+    source = build_source(song, player)
+    source.prebuffer(config.GAPLESS_BUFFER)
+    player.next_source = (song, source)
+
 async def play_next(ctx, guild_id):
+    with tracer.trace('play_next', guild=guild_id):
+        await _play_next(ctx, guild_id)
+
+def trace_first_audio(source):
+    # Hold the current trace open until the voice thread reads the first frame
+    trace = tracer.current()
+    if trace is None:
+        return
+    trace.hold()
+    waiting = time.perf_counter()
+    def first_frame(ok):
+        bot.loop.call_soon_threadsafe(lambda: trace.release('first_audio', waiting, ok=ok))
+    source.first_frame = first_frame
+
+async def _play_next(ctx, guild_id):
     player = players.get(guild_id)
     if not player or not player.vc:
         return
-    if player.loop and player.current:
-        player.queue.appendleft(player.current)
-    elif player.loop_queue and player.current:
-        player.queue.append(player.current)
-    if not player.queue:
-        player.current = None
+    async with player.lock:
+        if player.vc.is_playing() or player.vc.is_paused():
+            return
+        if player.next_task:
+            player.next_task.cancel()
+            player.next_task = None
+        if player.loop and player.current:
+            player.queue.appendleft(player.current)
+        elif player.loop_queue and player.current:
+            player.queue.append(player.current)
+        # A restored player picks up where the snapshot left off, but only on the track it saved
+        start, player.resume_at = player.resume_at, 0.0
+        next_song = None
+        while player.queue:
+            candidate = player.queue.popleft()
+            with tracer.span('resolve_stream', fresh=stream_is_fresh(candidate)) as span:
+                resolved = await ensure_playable(candidate)
+                span.set(ok=bool(resolved))
+            if resolved:
+                await load_gain(candidate, player)
+                # Checked again: load_gain may wait on storage, and a cached copy evicted
+                # meanwhile means the track needs its stream URL after all
+                resolved = await ensure_playable(candidate)
+            if resolved:
+                next_song = candidate
+                break
+            start = 0.0
+            if player.text_channel:
+                outbox.send(player.text_channel, get_text(guild_id, "not_found") + f" (`{candidate['title'][:50]}`)")
+        if not next_song:
+            player.current = None
+            player.source = None
+            player.discard_next()
+            player.panel.refresh()
+            if not player._24_7:
+                await player.vc.disconnect()
+                remove_player(guild_id)
+            if player.text_channel:
+                outbox.send(player.text_channel, get_text(guild_id, "queue_finished"))
+            return
+        player.current = next_song
+        with tracer.span('ffmpeg_spawn') as span:
+            prepared = player.take_next(next_song)
+            player.source = prepared or build_source(next_song, player, start)
+            span.set(prebuffered=prepared is not None, local=player.source.local)
+        if audio_cache:
+            audio_cache.played(next_song, player.source.local, player.source.local or is_opus_stream(next_song['url']))
+        trace_first_audio(player.source)
+        source = wrap_volume(player.source, player.volume)
+        def after_playing(error):
+            if error:
+                print(f"Playback error: {error}")
+            asyncio.run_coroutine_threadsafe(play_next(ctx, guild_id), bot.loop)
+        player.vc.play(source, after=after_playing)
+        player.next_task = asyncio.ensure_future(prepare_next(player))
+    player.panel.refresh()
+
+# ==================== CONTROLS ====================
+CONTROL_EMOJIS = {"⏯️": "pause", "⏭️": "skip", "⏹️": "stop", "🔊": "volume_up", "🔉": "volume_down"}
+MAX_CONTROL_MESSAGES = 10
+
+control_messages = {}  # message id -> guild id
+
+def register_control_message(player, message_id):
+    control_messages[message_id] = player.guild_id
+    player.control_messages.append(message_id)
+    while len(player.control_messages) > MAX_CONTROL_MESSAGES:
+        control_messages.pop(player.control_messages.popleft(), None)
+
+def remove_player(guild_id):
+    player = players.pop(guild_id, None)
+    if player:
+        player.close()
+    return player
+
+def control_action(player, action):
+    if not player.vc:
+        return None
+    if action == "pause":
+        if player.vc.is_playing():
+            player.vc.pause()
+            return "⏸️ Paused"
+        if player.vc.is_paused():
+            player.vc.resume()
+            return "▶️ Resumed"
+    elif action == "skip":
+        if player.vc.is_playing():
+            player.vc.stop()
+            return "⏭️ Skipped"
+    elif action == "stop":
+        player.queue.clear()
+        player.discard_next()
+        player.vc.stop()
+        return "⏹️ Stopped"
+    elif action == "volume_up":
+        if player.vc.source:
+            set_volume(player, round(min(1.0, player.volume + 0.1), 2))
+            return f"🔊 Volume: {int(player.volume*100)}%"
+    elif action == "volume_down":
+        if player.vc.source:
+            set_volume(player, round(max(0.1, player.volume - 0.1), 2))
+            return f"🔉 Volume: {int(player.volume*100)}%"
+    return None
+
+# ==================== NOW PLAYING PANEL ====================
+class ControlView(discord.ui.View):
+    def __init__(self, player):
+        super().__init__(timeout=None)
+        self.player = player
+
+    async def _run(self, interaction, action):
+        if players.get(interaction.guild_id) is not self.player:
+            await interaction.response.send_message(get_text(interaction.guild_id, "nothing_playing"), ephemeral=True)
+            return
+        reply = control_action(self.player, action)
+        await interaction.response.send_message(reply or get_text(interaction.guild_id, "nothing_playing"), ephemeral=True)
+        self.player.panel.refresh()
+
+    @discord.ui.button(emoji="⏯️", style=discord.ButtonStyle.secondary)
+    async def pause_button(self, interaction, button):
+        await self._run(interaction, "pause")
+
+    @discord.ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary)
+    async def skip_button(self, interaction, button):
+        await self._run(interaction, "skip")
+
+    @discord.ui.button(emoji="⏹️", style=discord.ButtonStyle.danger)
+    async def stop_button(self, interaction, button):
+        await self._run(interaction, "stop")
+
+    @discord.ui.button(emoji="🔉", style=discord.ButtonStyle.secondary)
+    async def volume_down_button(self, interaction, button):
+        await self._run(interaction, "volume_down")
+
+    @discord.ui.button(emoji="🔊", style=discord.ButtonStyle.secondary)
+    async def volume_up_button(self, interaction, button):
+        await self._run(interaction, "volume_up")
+
+class NowPlayingPanel:
+    # One message per player, edited in place. refresh() only marks it dirty; the
+    # embed is rebuilt from current state after PANEL_DEBOUNCE, so a burst of
+    # track changes or button presses becomes a single API call.
+    def __init__(self, player):
+        self.player = player
+        self.message = None
+        self.view = None
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+
+    def refresh(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(config.PANEL_DEBOUNCE)
+        self.flush_task = None
+        async with self.lock:
+            try:
+                await self._flush()
+            except discord.HTTPException as e:
+                print(f"Panel update failed: {e}")
+
+    def build_embed(self):
+        player = self.player
+        song = player.current
+        if not song:
+            return discord.Embed(description=get_text(player.guild_id, "queue_finished"), color=0x00ff00)
+        embed = discord.Embed(
+            title="🎵 Now Playing",
+            description=f"`{song['title']}`",
+            color=0x00ff00
+        )
+        embed.add_field(name="Duration", value=format_duration(song['duration']))
+        embed.add_field(name="Source", value=song['source'])
+        embed.add_field(name="Requested by", value=song['requester'])
+        status = "⏸️ Paused" if player.vc and player.vc.is_paused() else "▶️ Playing"
+        loop = "🔂 Track" if player.loop else "🔁 Queue" if player.loop_queue else "Off"
+        embed.add_field(name="Status", value=status)
+        embed.add_field(name="Volume", value=f"{int(player.volume*100)}%")
+        embed.add_field(name="Loop", value=loop)
+        embed.set_footer(text=f"{len(player.queue)} in queue")
+        return embed
+
+    async def _flush(self):
+        channel = self.player.text_channel
+        if not channel:
+            return
+        await outbox.acquire(channel)
+        embed = self.build_embed()
+        if self.message and self.message.channel.id != channel.id:
+            self.message = None
+        if self.message:
+            try:
+                await self.message.edit(embed=embed, view=self.view)
+                return
+            except discord.NotFound:
+                self.message = None
+        if self.view is None:
+            self.view = ControlView(self.player)
+        self.message = await channel.send(embed=embed, view=self.view)
+        register_control_message(self.player, self.message.id)
+
+    def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.view:
+            self.view.stop()
+        if self.message:
+            # The pending refresh is gone with the player, so show the final state now,
+            # without buttons that look live
+            asyncio.ensure_future(self._retire(self.message, self.build_embed()))
+            self.message = None
+
+    async def _retire(self, message, embed):
+        async with self.lock:
+            try:
+                await message.edit(embed=embed, view=None)
+            except discord.HTTPException as e:
+                print(f"Panel update failed: {e}")
+
+# ==================== HEALTH AND METRICS ====================
+def health():
+    gateway = bot.is_ready() and not bot.is_closed()
+    voice = [player for player in players.values() if player.vc]
+    connected = sum(1 for player in voice if player.vc.is_connected())
+    details = {
+        'gateway': gateway,
+        'latency': round(bot.latency, 3) if bot.latency == bot.latency else None,
+        'voice_ready': connected == len(voice),
+        'voice_connected': connected,
+        'voice_total': len(voice),
+        'loop_lag': round(lag_monitor.last, 4),
+    }
+    return gateway, details
+
+def player_states():
+    states = {('playing',): 0, ('paused',): 0, ('idle',): 0}
+    for player in players.values():
+        if player.vc and player.vc.is_playing():
+            states[('playing',)] += 1
+        elif player.vc and player.vc.is_paused():
+            states[('paused',)] += 1
+        else:
+            states[('idle',)] += 1
+    return states
+
+registry.register(metrics.Gauge("musicbot_players", "Players by state", player_states, ('state',)))
+registry.register(metrics.Gauge(
+    "musicbot_queue_depth", "Tracks waiting in all queues", lambda: sum(len(player.queue) for player in players.values())
+))
+registry.register(metrics.Gauge(
+    "musicbot_ffmpeg_processes", "Live ffmpeg processes, including pre-buffered next tracks", lambda: len(PlayerSource.live)
+))
+registry.register(metrics.Gauge(
+    "musicbot_strategy_success_ratio", "Recent success rate per extraction strategy",
+    lambda: {(name,): stat['success_rate'] for name, stat in strategy_tracker.snapshot().items()
+             if stat['success_rate'] is not None},
+    ('strategy',),
+))
+registry.register(metrics.Gauge("musicbot_guilds", "Guilds this process serves", lambda: len(bot.guilds)))
+registry.register(metrics.Gauge(
+    "musicbot_gateway_latency_seconds", "Gateway heartbeat latency",
+    lambda: bot.latency if bot.latency == bot.latency else 0,
+))
+if audio_cache:
+    registry.register(metrics.Gauge("musicbot_audio_cache_bytes", "Disk used by cached audio", lambda: audio_cache.bytes))
+    registry.register(metrics.Gauge("musicbot_audio_cache_files", "Tracks in the audio cache", lambda: len(audio_cache.files)))
+    registry.register(metrics.Gauge(
+        "musicbot_audio_cache_plays", "Track starts by whether they played from the audio cache",
+        lambda: {('hit',): audio_cache.hits, ('miss',): audio_cache.misses}, ('result',),
+    ))
+web_server = WebServer(health, registry.render)
+
+# ==================== SNAPSHOTS ====================
+STARTED_AT = time.time()
+snapshot_store = snapshots.SnapshotStore(
+    config.SNAPSHOT_PATH if config.CLUSTER_ID is None else f"{config.SNAPSHOT_PATH}.{config.CLUSTER_ID}"
+)
+restore_stats = {'guilds': 0, 'playing': 0, 'seconds': None, 'since_start': None}
+
+def snapshot_players():
+    states = {}
+    for guild_id, player in players.items():
+        if not (player.current or player.queue or player._24_7):
+            continue
+        states[guild_id] = {
+            'v': player.vc.channel.id if player.vc and player.vc.channel else None,
+            't': player.text_channel.id if player.text_channel else None,
+            'c': snapshots.pack_track(player.current) if player.current else None,
+            'p': round(player.position, 1),
+            'q': [snapshots.pack_track(song) for song in player.queue],
+            'l': player.loop,
+            'a': player.loop_queue,
+            'o': player.volume,
+            'f': player.filter,
+            'k': player._24_7,
+            'z': bool(player.vc and player.vc.is_paused()),
+        }
+    return states
+
+async def restore_player(guild_id, state):
+    guild = bot.get_guild(guild_id)
+    if guild is None or guild_id in players:
+        return False
+    player = MusicPlayer(guild_id)
+    player.loop = state['l']
+    player.loop_queue = state['a']
+    player.volume = state['o']
+    player.filter = state['f'] if state['f'] in AUDIO_FILTERS else None
+    player._24_7 = state['k']
+    player.text_channel = guild.get_channel(state['t']) if state['t'] else None
+    # Queued tracks stay unresolved; prepare_next resolves each one shortly before it plays
+    player.queue.extend(snapshots.unpack_track(row) for row in state['q'])
+    if state['c']:
+        player.queue.appendleft(snapshots.unpack_track(state['c']))
+        player.resume_at = state['p']
+    players[guild_id] = player
+    channel = guild.get_channel(state['v']) if state['v'] else None
+    if channel is None:
         if not player._24_7:
-            await player.vc.disconnect()
-            players.pop(guild_id, None)
-        await player.text_channel.send(get_text(guild_id, "queue_finished"))
-        return
-    next_song = player.queue.popleft()
-    player.current = next_song
-    source = discord.FFmpegPCMAudio(next_song['url'], **FFMPEG_OPTIONS)
-    source = discord.PCMVolumeTransformer(source, volume=player.volume)
-    def after_playing(error):
-        if error:
-            print(f"Playback error: {error}")
-        asyncio.run_coroutine_threadsafe(play_next(ctx, guild_id), bot.loop)
-    player.vc.play(source, after=after_playing)
-    duration_str = format_duration(next_song['duration'])
-    await player.text_channel.send(
-        f"🎵 **Now Playing:** `{next_song['title']}` ({duration_str}) | Source: {next_song['source']}"
-    )
-    # Reaction controls
+            remove_player(guild_id)
+        return False
     try:
-        msg = await player.text_channel.send("_ _")
-        for emoji in ["⏯️", "⏭️", "⏹️", "🔊", "🔉"]:
-            await msg.add_reaction(emoji)
-    except:
-        pass
+        player.vc = guild.voice_client or await channel.connect()
+    except Exception as e:
+        print(f"Restore failed to join voice in {guild_id}: {e}")
+        remove_player(guild_id)
+        return False
+    if not state['c']:
+        return False
+    await play_next(None, guild_id)
+    if state['z'] and player.vc.is_playing():
+        player.vc.pause()
+        player.panel.refresh()
+    return player.vc.is_playing() or player.vc.is_paused()
+
+async def restore_players():
+    started = time.perf_counter()
+    saved = {guild_id: state for guild_id, state in (await snapshot_store.load()).items() if bot.get_guild(guild_id)}
+    semaphore = asyncio.Semaphore(config.RESTORE_CONCURRENCY)
+    async def restore(guild_id, state):
+        async with semaphore:
+            try:
+                return await restore_player(guild_id, state)
+            except Exception as e:
+                print(f"Restore failed for {guild_id}: {e}")
+                return False
+    results = await asyncio.gather(*(restore(guild_id, state) for guild_id, state in saved.items()))
+    restore_stats.update(
+        guilds=len(saved),
+        playing=sum(results),
+        seconds=time.perf_counter() - started,
+        since_start=time.time() - STARTED_AT,
+    )
+    if saved:
+        print(f"♻️ Restored {restore_stats['playing']}/{len(saved)} players in {restore_stats['seconds']:.1f}s "
+              f"({restore_stats['since_start']:.1f}s after start)")
 
 # ==================== BOT SETUP ====================
-class MusicBot(commands.Bot):
+# A cluster started by launcher.py owns CLUSTER_SHARDS of SHARD_COUNT; AUTO_SHARD
+# lets one process run every shard Discord recommends
+SHARDED = bool(config.CLUSTER_SHARDS) or config.AUTO_SHARD
+BotBase = commands.AutoShardedBot if SHARDED else commands.Bot
+
+class MusicBot(BotBase):
     def __init__(self):
-        super().__init__(command_prefix=self.get_prefix, intents=intents, help_command=None)
+        shard_options = {}
+        if config.CLUSTER_SHARDS:
+            shard_options = {'shard_ids': config.CLUSTER_SHARDS, 'shard_count': config.SHARD_COUNT}
+        elif config.AUTO_SHARD and config.SHARD_COUNT:
+            shard_options = {'shard_count': config.SHARD_COUNT}
+        super().__init__(command_prefix=self.get_prefix, intents=intents, help_command=None, **shard_options)
+        self.mention_prefixes = ()
+        self.ipc_task = None
+        self.snapshot_task = None
+        self.restoring = None
+        self.ingest = {'seen': 0, 'rejected': 0, 'dispatched': 0, 'filter_ns': 0}
     async def get_prefix(self, message):
         if not message.guild:
-            return "!"
-        return await db.get_prefix(message.guild.id)
+            return ["!", *self.mention_prefixes]
+        return [await db.get_prefix(message.guild.id), *self.mention_prefixes]
+    def might_be_command(self, message):
+        # Cheap pre-filter against the cached prefix index: no awaits and no Context build
+        content = message.content
+        if not content:
+            return False
+        if message.guild is None:
+            return True
+        prefix = db.cached_prefix(message.guild.id)
+        if prefix is None:
+            # Config not loaded yet; let get_context read it through
+            return True
+        return content.startswith(prefix) or content.startswith(self.mention_prefixes)
     async def setup_hook(self):
+        await db.connect()
+        extraction.start()
+        if audio_cache:
+            await audio_cache.load()
+            print(f"✅ Audio cache: {len(audio_cache.files)} tracks, {audio_cache.bytes / 2**20:.0f} MB")
+        lag_monitor.start()
+        # Clusters share a host, so each one listens on its own port
+        port = config.WEB_PORT + (config.CLUSTER_ID or 0)
+        try:
+            await web_server.start(config.WEB_HOST, port)
+            print(f"✅ Health and metrics on port {port}")
+        except OSError as e:
+            print(f"❌ Web server failed to start: {e}")
+        try:
+            # Containers and the launcher stop us with SIGTERM; close cleanly so the snapshot is written
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.close()))
+        except NotImplementedError:
+            pass
+        if config.CLUSTER_ID is not None:
+            self.ipc_task = asyncio.create_task(cluster.run(config.IPC_HOST, config.IPC_PORT))
+            print(f"✅ Cluster {config.CLUSTER_ID}: shards {config.CLUSTER_SHARDS}")
+        print(f"✅ Extraction backend: {config.EXTRACT_BACKEND} x{config.EXTRACT_WORKERS}")
         print(f"✅ Bot is ready!")
+    async def restore(self):
+        await restore_players()
+        self.snapshot_task = asyncio.ensure_future(self._snapshot_loop())
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(config.SNAPSHOT_INTERVAL)
+            try:
+                await snapshot_store.save(snapshot_players())
+            except Exception as e:
+                print(f"Snapshot failed: {e}")
+    async def close(self):
+        if self.ipc_task:
+            self.ipc_task.cancel()
+        # Only overwrite the snapshot once it has been restored from
+        if self.snapshot_task:
+            self.snapshot_task.cancel()
+            self.snapshot_task = None
+            try:
+                await snapshot_store.save(snapshot_players())
+            except Exception as e:
+                print(f"Snapshot failed: {e}")
+        extraction.close()
+        if spotify_client:
+            spotify_client.close()
+        if audio_cache:
+            audio_cache.close()
+        loudness_analyzer.close()
+        lag_monitor.close()
+        tracer.close()
+        await web_server.close()
+        await db.close()
+        await super().close()
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -320,55 +1662,72 @@ intents.voice_states = True
 intents.reactions = True
 bot = MusicBot()
 
+# ==================== CLUSTER ====================
+cluster = ipc.IPCClient(config.CLUSTER_ID, config.IPC_TOKEN, config.IPC_TIMEOUT)
+
+@cluster.handler('stats')
+async def cluster_stats():
+    return {
+        'cluster': config.CLUSTER_ID or 0,
+        'shards': sorted(bot.shards) if SHARDED else [0],
+        'guilds': len(bot.guilds),
+        'players': len(players),
+        'active': sum(1 for player in players.values() if player.vc and player.vc.is_playing()),
+        'latency': bot.latency if bot.latency == bot.latency else None,
+    }
+
+@cluster.handler('premium')
+async def cluster_premium(guild_id, status):
+    # Only the cluster whose shards hold the guild applies it, so its cache stays authoritative
+    if bot.get_guild(guild_id) is None:
+        return False
+    await db.set_premium(guild_id, status)
+    return True
+
 # ==================== EVENTS ====================
 @bot.event
 async def on_ready():
     print(f"✅ {bot.user} is ONLINE!")
+    bot.mention_prefixes = (f"<@{bot.user.id}> ", f"<@!{bot.user.id}> ")
     print(f"✅ Connected to {len(bot.guilds)} servers")
+    await db.load_guilds(guild.id for guild in bot.guilds)
+    # on_ready fires again after reconnects; restore only once
+    if bot.restoring is None:
+        bot.restoring = asyncio.ensure_future(bot.restore())
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name="!help"))
 
 @bot.event
 async def on_message(message):
     if message.author.bot:
         return
+    bot.ingest['seen'] += 1
+    start = time.perf_counter_ns()
+    candidate = bot.might_be_command(message)
+    bot.ingest['filter_ns'] += time.perf_counter_ns() - start
+    if not candidate:
+        bot.ingest['rejected'] += 1
+        return
     ctx = await bot.get_context(message)
     if ctx.valid:
+        bot.ingest['dispatched'] += 1
         await bot.invoke(ctx)
 
 @bot.event
-async def on_reaction_add(reaction, user):
-    if user.bot:
+async def on_raw_reaction_add(payload):
+    # Indexed by message ID, so dispatch is O(1) and works after the message leaves the cache
+    guild_id = control_messages.get(payload.message_id)
+    if guild_id is None or payload.user_id == bot.user.id:
         return
-    # Find which guild this reaction belongs to
-    for guild_id, player in players.items():
-        if player.text_channel and player.text_channel.id == reaction.message.channel.id:
-            if reaction.emoji == "⏯️":
-                if player.vc and player.vc.is_playing():
-                    player.vc.pause()
-                    await reaction.message.channel.send("⏸️ Paused")
-                elif player.vc and player.vc.is_paused():
-                    player.vc.resume()
-                    await reaction.message.channel.send("▶️ Resumed")
-            elif reaction.emoji == "⏭️":
-                if player.vc and player.vc.is_playing():
-                    player.vc.stop()
-                    await reaction.message.channel.send("⏭️ Skipped")
-            elif reaction.emoji == "⏹️":
-                if player.vc:
-                    player.queue.clear()
-                    player.vc.stop()
-                    await reaction.message.channel.send("⏹️ Stopped")
-            elif reaction.emoji == "🔊":
-                if player.vc and player.vc.source:
-                    player.volume = min(1.0, player.volume + 0.1)
-                    player.vc.source.volume = player.volume
-                    await reaction.message.channel.send(f"🔊 Volume: {int(player.volume*100)}%")
-            elif reaction.emoji == "🔉":
-                if player.vc and player.vc.source:
-                    player.volume = max(0.1, player.volume - 0.1)
-                    player.vc.source.volume = player.volume
-                    await reaction.message.channel.send(f"🔉 Volume: {int(player.volume*100)}%")
-            break
+    if payload.member and payload.member.bot:
+        return
+    player = players.get(guild_id)
+    action = CONTROL_EMOJIS.get(str(payload.emoji))
+    if not player or not action:
+        return
+    reply = control_action(player, action)
+    player.panel.refresh()
+    if reply and player.text_channel:
+        outbox.send(player.text_channel, reply)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
@@ -385,7 +1744,7 @@ async def on_voice_state_update(member, before, after):
                     except:
                         pass
             else:
-                players.pop(member.guild.id, None)
+                remove_player(member.guild.id)
 
 # ==================== COMMANDS ====================
 
@@ -398,7 +1757,7 @@ async def help_command(ctx):
         color=0x00ff00
     )
     embed.add_field(name="**🎵 Music**", 
-                   value=f"`{prefix}play [song/url]` - Play music\n`{prefix}np` - Now playing\n`{prefix}queue` - Show queue\n`{prefix}pause` - Pause\n`{prefix}resume` - Resume\n`{prefix}skip` - Skip\n`{prefix}skipto [pos]` - Skip to position\n`{prefix}stop` - Stop & clear\n`{prefix}volume [0-100]` - Volume", 
+                   value=f"`{prefix}play [song/url]` - Play music\n`{prefix}search [query]` - Pick from results\n`{prefix}np` - Now playing\n`{prefix}queue` - Show queue\n`{prefix}pause` - Pause\n`{prefix}resume` - Resume\n`{prefix}skip` - Skip\n`{prefix}skipto [pos]` - Skip to position\n`{prefix}stop` - Stop & clear\n`{prefix}volume [0-100]` - Volume", 
                    inline=False)
     embed.add_field(name="**🔄 Loop**", 
                    value=f"`{prefix}loop` - Toggle loop current\n`{prefix}loopall` - Toggle loop queue\n`{prefix}repeat` - Alias for loop\n`{prefix}repeatall` - Alias for loopall", 
@@ -413,9 +1772,9 @@ async def help_command(ctx):
                    value=f"`{prefix}filter [name]` - Apply audio filter (Premium)\n`{prefix}filters` - List available filters", 
                    inline=False)
     embed.add_field(name="**🔄 Other**", 
-                   value=f"`{prefix}shuffle` - Shuffle queue\n`{prefix}clear` - Clear queue\n`{prefix}remove [pos]` - Remove song\n`{prefix}leave` - Disconnect\n`{prefix}ping` - Latency\n`{prefix}help` - This menu", 
+                   value=f"`{prefix}shuffle` - Shuffle queue\n`{prefix}clear` - Clear queue\n`{prefix}remove [pos]` - Remove song\n`{prefix}move [from] [to]` - Move song\n`{prefix}leave` - Disconnect\n`{prefix}ping` - Latency\n`{prefix}help` - This menu", 
                    inline=False)
-    embed.set_footer(text="React to now playing messages for controls! ⏯️⏭️⏹️🔊🔉")
+    embed.set_footer(text="Use the buttons on the now playing panel for controls! ⏯️⏭️⏹️🔉🔊")
     await ctx.send(embed=embed)
 
 @bot.command()
@@ -424,18 +1783,24 @@ async def ping(ctx):
 
 @bot.command(name='play', aliases=['p', 'pplay'])
 async def play(ctx, *, query):
+    with tracer.trace('play', guild=ctx.guild.id, query=query[:100]):
+        await play_query(ctx, query)
+
+async def play_query(ctx, query):
     if not ctx.author.voice:
-        await ctx.send(get_text(ctx.guild.id, "no_voice"))
+        await reply(ctx, "no_voice")
         return
     try:
         if ctx.voice_client is None:
-            vc = await ctx.author.voice.channel.connect()
-            await ctx.send(get_text(ctx.guild.id, "joined", channel=ctx.author.voice.channel.name))
+            with tracer.span('voice_connect'):
+                vc = await ctx.author.voice.channel.connect()
+            await reply(ctx, "joined", channel=ctx.author.voice.channel.name, transient=True)
         else:
             vc = ctx.voice_client
             if vc.channel != ctx.author.voice.channel:
-                await vc.move_to(ctx.author.voice.channel)
-                await ctx.send(get_text(ctx.guild.id, "moved", channel=ctx.author.voice.channel.name))
+                with tracer.span('voice_move'):
+                    await vc.move_to(ctx.author.voice.channel)
+                await reply(ctx, "moved", channel=ctx.author.voice.channel.name, transient=True)
     except Exception as e:
         await ctx.send(f"❌ Error: {str(e)[:50]}")
         return
@@ -444,70 +1809,114 @@ async def play(ctx, *, query):
     player = players[ctx.guild.id]
     player.vc = ctx.voice_client
     player.text_channel = ctx.channel
-    await ctx.send(get_text(ctx.guild.id, "searching", query=query))
-    audio_url, title, duration, source = None, None, None, None
-    for attempt in range(3):
-        audio_url, title, duration, source = await asyncio.get_event_loop().run_in_executor(
-            None, extract_audio, query
-        )
-        if audio_url:
-            break
-        await asyncio.sleep(1)
-    if not audio_url:
-        await ctx.send(get_text(ctx.guild.id, "not_found"))
-        return
-    duration_str = format_duration(duration)
-    song = {
-        'url': audio_url,
-        'title': title,
-        'duration': duration,
-        'source': source,
-        'requester': ctx.author.name
-    }
-    player.queue.append(song)
-    await ctx.send(get_text(ctx.guild.id, "added", title=title, duration=duration_str))
+    if spotify.parse_url(query):
+        await enqueue_spotify(ctx, player, query)
+        return
+    if is_playlist_url(query):
+        await enqueue_playlist(ctx, player, query)
+        return
+    await reply(ctx, "searching", query=query, transient=True)
+    track = None
+    with tracer.span('resolve') as span:
+        for attempt in range(3):
+            track = await resolver.resolve(query)
+            if track:
+                break
+            await asyncio.sleep(1)
+        span.set(attempts=attempt + 1, ok=track is not None)
+    if not track:
+        await reply(ctx, "not_found")
+        return
+    duration_str = format_duration(track['duration'])
+    player.queue.append(make_song(track, ctx.author.name))
+    await reply(ctx, "added", title=track['title'], duration=duration_str)
     if not ctx.voice_client.is_playing():
         await play_next(ctx, ctx.guild.id)
 
+class SearchView(discord.ui.View):
+    # Dropdown of flat search results; only the user who searched can pick
+    def __init__(self, ctx, candidates):
+        super().__init__(timeout=60)
+        self.ctx = ctx
+        self.candidates = candidates
+        self.message = None
+        select = discord.ui.Select(placeholder="Pick a track", options=[
+            discord.SelectOption(
+                label=candidate['title'][:100],
+                description=f"{format_duration(candidate['duration'])} · {candidate['channel']}"[:100],
+                value=str(i),
+            )
+            for i, candidate in enumerate(candidates)
+        ])
+        select.callback = self.pick
+        self.add_item(select)
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.ctx.author.id
+
+    async def pick(self, interaction):
+        candidate = self.candidates[int(interaction.data['values'][0])]
+        self.stop()
+        await interaction.response.edit_message(content=f"🎵 `{candidate['title'][:100]}`", view=None)
+        with tracer.trace('play', guild=self.ctx.guild.id, query=candidate['webpage_url']):
+            await play_query(self.ctx, candidate['webpage_url'])
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+@bot.command(name='search', aliases=['find'])
+async def search(ctx, *, query):
+    candidates = await searches.search(query)
+    if not candidates:
+        await reply(ctx, "not_found")
+        return
+    view = SearchView(ctx, candidates)
+    view.message = await ctx.send(get_text(ctx.guild.id, "search_results", query=query[:100]), view=view)
+
 @bot.command(name='pause', aliases=['pa'])
 async def pause(ctx):
     player = players.get(ctx.guild.id)
     if player and player.vc and player.vc.is_playing():
         player.vc.pause()
-        await ctx.send(get_text(ctx.guild.id, "paused"))
+        player.panel.refresh()
+        await reply(ctx, "paused")
     else:
-        await ctx.send(get_text(ctx.guild.id, "nothing_playing"))
+        await reply(ctx, "nothing_playing")
 
 @bot.command(name='resume', aliases=['r'])
 async def resume(ctx):
     player = players.get(ctx.guild.id)
     if player and player.vc and player.vc.is_paused():
         player.vc.resume()
-        await ctx.send(get_text(ctx.guild.id, "resumed"))
+        player.panel.refresh()
+        await reply(ctx, "resumed")
     else:
-        await ctx.send(get_text(ctx.guild.id, "nothing_paused"))
+        await reply(ctx, "nothing_paused")
 
 @bot.command(name='skip', aliases=['s'])
 async def skip(ctx):
     player = players.get(ctx.guild.id)
     if player and player.vc and player.vc.is_playing():
         player.vc.stop()
-        await ctx.send(get_text(ctx.guild.id, "skipped"))
+        await reply(ctx, "skipped")
     else:
-        await ctx.send(get_text(ctx.guild.id, "nothing_to_skip"))
+        await reply(ctx, "nothing_to_skip")
 
 @bot.command(name='skipto', aliases=['st'])
 async def skipto(ctx, position: int):
     player = players.get(ctx.guild.id)
     if not player or not player.queue:
-        await ctx.send(get_text(ctx.guild.id, "queue_empty"))
+        await reply(ctx, "queue_empty")
         return
     if position < 1 or position > len(player.queue):
-        await ctx.send(get_text(ctx.guild.id, "invalid_position"))
+        await reply(ctx, "invalid_position")
         return
-    for _ in range(position - 1):
-        if player.queue:
-            player.queue.popleft()
+    player.queue.drop(position - 1)
+    player.refresh_next()
     if player.vc and player.vc.is_playing():
         player.vc.stop()
     await ctx.send(f"⏭️ Skipped to position **{position}**")
@@ -517,10 +1926,11 @@ async def stop(ctx):
     player = players.get(ctx.guild.id)
     if player and player.vc:
         player.queue.clear()
+        player.discard_next()
         player.vc.stop()
-        await ctx.send(get_text(ctx.guild.id, "stopped"))
+        await reply(ctx, "stopped")
     else:
-        await ctx.send(get_text(ctx.guild.id, "not_in_voice"))
+        await reply(ctx, "not_in_voice")
 
 @bot.command(name='loop', aliases=['repeat'])
 async def loop(ctx, mode=None):
@@ -530,10 +1940,12 @@ async def loop(ctx, mode=None):
     if mode == "current" or mode is None:
         player.loop = not player.loop
         player.loop_queue = False
+        player.panel.refresh()
         await ctx.send(f"🔄 Loop current: **{'ON' if player.loop else 'OFF'}**")
     elif mode == "all":
         player.loop_queue = not player.loop_queue
         player.loop = False
+        player.panel.refresh()
         await ctx.send(f"🔄 Loop queue: **{'ON' if player.loop_queue else 'OFF'}**")
 
 @bot.command(name='loopall', aliases=['la', 'loopqueue', 'repeatall'])
@@ -543,54 +1955,123 @@ async def loopall(ctx):
         return
     player.loop_queue = not player.loop_queue
     player.loop = False
+    player.panel.refresh()
     await ctx.send(f"🔄 Loop queue: **{'ON' if player.loop_queue else 'OFF'}**")
 
 @bot.command(name='shuffle', aliases=['mix'])
 async def shuffle(ctx):
     player = players.get(ctx.guild.id)
     if player and len(player.queue) > 1:
-        queue_list = list(player.queue)
-        random.shuffle(queue_list)
-        player.queue = deque(queue_list)
-        await ctx.send(get_text(ctx.guild.id, "shuffled"))
+        player.queue.shuffle()
+        player.refresh_next()
+        await reply(ctx, "shuffled")
     else:
-        await ctx.send(get_text(ctx.guild.id, "not_enough"))
+        await reply(ctx, "not_enough")
 
 @bot.command(name='volume', aliases=['vol', 'v'])
 async def volume(ctx, vol: int):
     if vol < 0 or vol > 100:
-        await ctx.send(get_text(ctx.guild.id, "invalid_volume"))
+        await reply(ctx, "invalid_volume")
         return
     player = players.get(ctx.guild.id)
     if player and player.vc and player.vc.source:
-        player.volume = vol / 100
-        player.vc.source.volume = player.volume
-        await ctx.send(get_text(ctx.guild.id, "volume_set", vol=vol))
+        set_volume(player, vol / 100)
+        player.panel.refresh()
+        await reply(ctx, "volume_set", vol=vol)
     else:
-        await ctx.send(get_text(ctx.guild.id, "nothing_playing"))
+        await reply(ctx, "nothing_playing")
 
 @bot.command(name='clear')
 async def clear(ctx):
     player = players.get(ctx.guild.id)
     if player:
         player.queue.clear()
+        player.refresh_next()
         await ctx.send("🗑️ **Queue cleared**")
     else:
-        await ctx.send(get_text(ctx.guild.id, "queue_empty"))
+        await reply(ctx, "queue_empty")
 
 @bot.command(name='remove')
 async def remove(ctx, position: int):
     player = players.get(ctx.guild.id)
     if not player or not player.queue:
-        await ctx.send(get_text(ctx.guild.id, "queue_empty"))
+        await reply(ctx, "queue_empty")
         return
     if position < 1 or position > len(player.queue):
-        await ctx.send(get_text(ctx.guild.id, "invalid_position"))
+        await reply(ctx, "invalid_position")
+        return
+    removed = player.queue.pop(position - 1)
+    if position == 1:
+        player.refresh_next()
+    await reply(ctx, "removed", title=removed['title'][:50])
+
+@bot.command(name='move', aliases=['mv'])
+async def move(ctx, source: int, target: int):
+    player = players.get(ctx.guild.id)
+    if not player or not player.queue:
+        await reply(ctx, "queue_empty")
+        return
+    if not (1 <= source <= len(player.queue) and 1 <= target <= len(player.queue)):
+        await reply(ctx, "invalid_position")
+        return
+    moved = player.queue.move(source - 1, target - 1)
+    if 1 in (source, target):
+        player.refresh_next()
+    player.panel.refresh()
+    await reply(ctx, "moved_track", title=moved['title'][:50], position=target)
+
+@bot.command(name='queue', aliases=['q'])
+async def queue_cmd(ctx, page: int = 1):
+    player = players.get(ctx.guild.id)
+    if not player or not (player.current or player.queue):
+        await reply(ctx, "queue_empty")
+        return
+    pages = max(1, -(-len(player.queue) // QUEUE_PAGE_SIZE))
+    page = max(1, min(page, pages))
+    start = (page - 1) * QUEUE_PAGE_SIZE
+    embed = discord.Embed(title="📋 Queue", color=0x00ff00)
+    if player.current:
+        embed.add_field(
+            name="Now Playing",
+            value=f"`{player.current['title'][:60]}` ({format_duration(player.current['duration'])})",
+            inline=False,
+        )
+    lines = [
+        f"**{start + i}.** `{song['title'][:60]}` ({format_duration(song['duration'])}) - {song['requester']}"
+        for i, song in enumerate(player.queue.page(start, QUEUE_PAGE_SIZE), start=1)
+    ]
+    if lines:
+        embed.add_field(name="Up Next", value="\n".join(lines), inline=False)
+    embed.set_footer(
+        text=f"Page {page}/{pages} | {len(player.queue)} tracks | {format_position(player.queue.total_duration)} total"
+    )
+    await ctx.send(embed=embed)
+
+@bot.command(name='np', aliases=['nowplaying'])
+async def now_playing(ctx):
+    player = players.get(ctx.guild.id)
+    if not player or not player.current:
+        await reply(ctx, "nothing_playing")
         return
-    queue_list = list(player.queue)
-    removed = queue_list.pop(position - 1)
-    player.queue = deque(queue_list)
-    await ctx.send(get_text(ctx.guild.id, "removed", title=removed['title'][:50]))
+    song = player.current
+    elapsed = int(player.position)
+    embed = discord.Embed(title="🎵 Now Playing", description=f"`{song['title']}`", color=0x00ff00)
+    if song['duration']:
+        filled = min(PROGRESS_WIDTH, elapsed * PROGRESS_WIDTH // song['duration'])
+        bar = "▬" * filled + "🔘" + "▬" * (PROGRESS_WIDTH - filled)
+        remaining = max(0, song['duration'] - elapsed)
+        embed.add_field(
+            name="Progress",
+            value=f"{bar}\n{format_position(elapsed)} / {format_duration(song['duration'])} "
+                  f"({format_position(remaining)} left)",
+            inline=False,
+        )
+    else:
+        embed.add_field(name="Progress", value=f"🔴 Live for {format_position(elapsed)}", inline=False)
+    embed.add_field(name="Requested by", value=song['requester'])
+    embed.add_field(name="Up Next", value=f"`{player.queue[0]['title'][:50]}`" if player.queue else "-")
+    embed.set_footer(text=f"{len(player.queue)} in queue | {format_position(player.queue.total_duration)} queued")
+    await ctx.send(embed=embed)
 
 @bot.command(name='leave', aliases=['dc', 'disconnect'])
 async def leave(ctx):
@@ -598,10 +2079,10 @@ async def leave(ctx):
     if player and player.vc:
         player.queue.clear()
         await player.vc.disconnect()
-        players.pop(ctx.guild.id, None)
-        await ctx.send(get_text(ctx.guild.id, "disconnected"))
+        remove_player(ctx.guild.id)
+        await reply(ctx, "disconnected")
     else:
-        await ctx.send(get_text(ctx.guild.id, "not_in_voice"))
+        await reply(ctx, "not_in_voice")
 
 # ==================== PLAYLIST COMMANDS ====================
 @bot.group(name='playlist', invoke_without_command=True)
@@ -616,29 +2097,29 @@ async def playlist(ctx):
 @playlist.command(name='create')
 async def pl_create(ctx, *, name):
     await db.create_playlist(ctx.author.id, name)
-    await ctx.send(get_text(ctx.guild.id, "playlist_created", name=name))
+    await reply(ctx, "playlist_created", name=name)
 
 @playlist.command(name='add')
 async def pl_add(ctx, name, *, url):
     await db.add_to_playlist(ctx.author.id, name, url)
-    await ctx.send(get_text(ctx.guild.id, "playlist_added", name=name))
+    await reply(ctx, "playlist_added", name=name)
 
 @playlist.command(name='list')
 async def pl_list(ctx):
     playlists = await db.get_all_playlists(ctx.author.id)
     if playlists:
-        await ctx.send(get_text(ctx.guild.id, "playlists_list", list=", ".join(playlists)))
+        await reply(ctx, "playlists_list", list=", ".join(playlists))
     else:
-        await ctx.send(get_text(ctx.guild.id, "no_playlists"))
+        await reply(ctx, "no_playlists")
 
 @playlist.command(name='load')
 async def pl_load(ctx, *, name):
     playlist = await db.get_playlist(ctx.author.id, name)
     if not playlist:
-        await ctx.send(get_text(ctx.guild.id, "not_found"))
+        await reply(ctx, "not_found")
         return
     if not ctx.author.voice:
-        await ctx.send(get_text(ctx.guild.id, "no_voice"))
+        await reply(ctx, "no_voice")
         return
     if ctx.voice_client is None:
         await ctx.author.voice.channel.connect()
@@ -647,105 +2128,205 @@ async def pl_load(ctx, *, name):
     player = players[ctx.guild.id]
     player.vc = ctx.voice_client
     player.text_channel = ctx.channel
-    await ctx.send(f"🔄 Loading playlist **{name}**...")
+    progress = await ctx.send(f"🔄 Loading playlist **{name}**... (0/{len(playlist)})")
+    semaphore = asyncio.Semaphore(config.PLAYLIST_CONCURRENCY)
+    async def resolve_one(url):
+        async with semaphore:
+            return await resolver.resolve(url)
+    # Resolve concurrently, but enqueue strictly in playlist order as each prefix completes
+    tasks = [asyncio.ensure_future(resolve_one(url)) for url in playlist]
     added = 0
-    for url in playlist:
-        audio_url, title, duration, source = await asyncio.get_event_loop().run_in_executor(
-            None, extract_audio, url
-        )
-        if audio_url and title:
-            song = {
-                'url': audio_url,
-                'title': title,
-                'duration': duration,
-                'source': source,
-                'requester': ctx.author.name
-            }
-            player.queue.append(song)
-            added += 1
-    await ctx.send(get_text(ctx.guild.id, "playlist_loaded", name=name) + f" ({added} songs)")
-    if not ctx.voice_client.is_playing():
-        await play_next(ctx, ctx.guild.id)
+    last_edit = time.monotonic()
+    try:
+        for done, task in enumerate(tasks, start=1):
+            track = await task
+            if players.get(ctx.guild.id) is not player:
+                return
+            if track:
+                player.queue.append(make_song(track, ctx.author.name))
+                added += 1
+                if player.vc and not player.vc.is_playing() and not player.vc.is_paused():
+                    await play_next(ctx, ctx.guild.id)
+            if time.monotonic() - last_edit >= config.PLAYLIST_PROGRESS_INTERVAL:
+                last_edit = time.monotonic()
+                try:
+                    await progress.edit(content=f"🔄 Loading playlist **{name}**... ({done}/{len(playlist)})")
+                except discord.HTTPException:
+                    pass
+    finally:
+        for task in tasks:
+            task.cancel()
+    try:
+        await progress.edit(content=get_text(ctx.guild.id, "playlist_loaded", name=name) + f" ({added} songs)")
+    except discord.HTTPException:
+        await ctx.send(get_text(ctx.guild.id, "playlist_loaded", name=name) + f" ({added} songs)")
 
 @playlist.command(name='delete')
 async def pl_delete(ctx, *, name):
     await db.delete_playlist(ctx.author.id, name)
-    await ctx.send(get_text(ctx.guild.id, "playlist_deleted", name=name))
+    await reply(ctx, "playlist_deleted", name=name)
 
 # ==================== SETTINGS & PREMIUM ====================
 @bot.command(name='setprefix')
 @commands.has_permissions(administrator=True)
 async def setprefix(ctx, new_prefix):
     await db.set_prefix(ctx.guild.id, new_prefix)
-    await ctx.send(get_text(ctx.guild.id, "prefix_changed", prefix=new_prefix))
+    await reply(ctx, "prefix_changed", prefix=new_prefix)
 
 @bot.command(name='setlang')
 @commands.has_permissions(administrator=True)
 async def setlang(ctx, lang):
     if lang in ['en', 'es']:
         await db.set_lang(ctx.guild.id, lang)
-        await ctx.send(get_text(ctx.guild.id, "language_changed", lang=lang))
+        await reply(ctx, "language_changed", lang=lang)
     else:
         await ctx.send("❌ Supported languages: `en`, `es`")
 
 @bot.command(name='247')
 async def stay_247(ctx):
     if not await db.is_premium(ctx.guild.id):
-        await ctx.send(get_text(ctx.guild.id, "premium_only"))
+        await reply(ctx, "premium_only")
         return
     player = players.get(ctx.guild.id)
     if player:
         player._24_7 = not player._24_7
         status = "enabled" if player._24_7 else "disabled"
-        await ctx.send(get_text(ctx.guild.id, f"247_{status}"))
+        await reply(ctx, f"247_{status}")
     else:
         players[ctx.guild.id] = MusicPlayer(ctx.guild.id)
         players[ctx.guild.id]._24_7 = True
         players[ctx.guild.id].text_channel = ctx.channel
-        await ctx.send(get_text(ctx.guild.id, "247_enabled"))
+        await reply(ctx, "247_enabled")
 
 @bot.command(name='setup')
 async def setup(ctx):
     if not await db.is_premium(ctx.guild.id):
-        await ctx.send(get_text(ctx.guild.id, "premium_only"))
+        await reply(ctx, "premium_only")
         return
-    await ctx.send(get_text(ctx.guild.id, "setup_complete"))
+    await reply(ctx, "setup_complete")
 
 @bot.command(name='premium')
 @commands.is_owner()
 async def premium(ctx, guild_id: int, status: bool):
-    await db.set_premium(guild_id, status)
+    applied = await cluster.broadcast('premium', guild_id=guild_id, status=status)
+    if not any(applied):
+        # Guild not on any live cluster; store it so it is picked up on join
+        await db.set_premium(guild_id, status)
     await ctx.send(f"✅ Premium set to **{status}** for guild `{guild_id}`")
 
+@bot.command(name='cluster')
+@commands.is_owner()
+async def cluster_cmd(ctx):
+    results = [stat for stat in await cluster.broadcast('stats') if stat]
+    lines = []
+    for stat in sorted(results, key=lambda stat: stat['cluster']):
+        latency = f"{stat['latency']*1000:.0f}ms" if stat['latency'] is not None else "-"
+        lines.append(
+            f"🧩 **Cluster {stat['cluster']}** (shards {stat['shards'][0]}-{stat['shards'][-1]}): "
+            f"{stat['guilds']} servers | {stat['active']}/{stat['players']} playing | {latency}"
+        )
+    latencies = [stat['latency'] for stat in results if stat['latency'] is not None]
+    average = f"{sum(latencies)/len(latencies)*1000:.0f}ms" if latencies else "-"
+    lines.append(
+        f"🌐 **Total:** {sum(stat['guilds'] for stat in results)} servers | "
+        f"{sum(stat['active'] for stat in results)} playing | {average} avg latency"
+    )
+    await ctx.send("\n".join(lines))
+
+@bot.command(name='stats')
+@commands.is_owner()
+async def stats(ctx):
+    cache = resolver.stats()
+    lines = [
+        f"📊 **Players:** {len(players)}",
+        f"🗃️ **Cache:** {cache['entries']} tracks | {cache['hits']} hits | {cache['misses']} misses | "
+        f"{cache['evictions']} evictions | {cache['merged']} merged",
+    ]
+    sent = outbox.stats()
+    lines.append(
+        f"✉️ **Outbox:** {sent['sent']} sent | {sent['edited']} edited | {sent['merged']} merged | "
+        f"{sent['replaced']} statuses replaced | {sent['dropped']} dropped | {sent['throttled']} throttled | "
+        f"{outbox.budget(ctx.channel.id)}/{config.OUTBOX_BURST} sends left here"
+    )
+    if restore_stats['seconds'] is not None:
+        lines.append(
+            f"♻️ **Restore:** {restore_stats['playing']}/{restore_stats['guilds']} playing in "
+            f"{restore_stats['seconds']:.1f}s ({restore_stats['since_start']:.1f}s after start) | "
+            f"snapshot {snapshot_store.size} bytes"
+        )
+    found = searches.stats()
+    lines.append(f"🔎 **Search cache:** {found['entries']} queries | {found['hits']} hits | {found['misses']} misses")
+    if audio_cache:
+        cached = audio_cache.stats()
+        ratio = f"{cached['hit_ratio']*100:.0f}%" if cached['hit_ratio'] is not None else "-"
+        lines.append(
+            f"💾 **Audio cache:** {cached['files']} tracks | {cached['bytes'] / 2**20:.0f}/"
+            f"{cached['max_bytes'] / 2**20:.0f} MB | {ratio} hits | {cached['transcodes']} cached | "
+            f"{cached['pending']} pending | {cached['failures']} failed | {cached['evictions']} evicted"
+        )
+    lines.append(
+        f"🎚️ **Loudness:** {loudness_analyzer.measured} measured | {len(loudness_analyzer.pending)} pending | "
+        f"{loudness_analyzer.failures} failed"
+    )
+    if spotify_client:
+        lines.append(
+            f"🟢 **Spotify:** {spotify_client.calls} API calls | {spotify_stats['cached']} matches reused | "
+            f"{spotify_stats['searched']} searched | {spotify_stats['failed']} unmatched"
+        )
+    ingest = bot.ingest
+    per_message = ingest['filter_ns'] / ingest['seen'] if ingest['seen'] else 0
+    lines.append(
+        f"💬 **Messages:** {ingest['seen']} seen | {ingest['rejected']} rejected early | "
+        f"{ingest['dispatched']} dispatched | {per_message:.0f} ns/msg filter"
+    )
+    for name, stat in strategy_tracker.snapshot().items():
+        rate = f"{stat['success_rate']*100:.0f}%" if stat['success_rate'] is not None else "-"
+        p50 = f"{stat['p50']:.2f}s" if stat['p50'] is not None else "-"
+        p90 = f"{stat['p90']:.2f}s" if stat['p90'] is not None else "-"
+        lines.append(f"🔧 `{name}`: {stat['attempts']} tries | {rate} ok | p50 {p50} | p90 {p90}")
+    await ctx.send("\n".join(lines))
+
+@bot.command(name='traces')
+@commands.is_owner()
+async def traces(ctx, count: int = 5):
+    if not tracer.enabled:
+        await ctx.send("❌ Tracing is disabled. Set `TRACING=true` to record traces.")
+        return
+    slowest = tracer.top(max(1, min(count, tracer.keep)))
+    if not slowest:
+        await ctx.send("No traces recorded yet.")
+        return
+    lines = [f"🐢 **Slowest {len(slowest)} of {tracer.recorded} traces**"]
+    for trace in slowest:
+        lines.append(f"**{trace['name']}** {trace['duration']*1000:.0f}ms `{trace['attrs'].get('query', '')}`")
+        for span in trace['spans']:
+            attrs = " ".join(f"{key}={value}" for key, value in span['attrs'].items())
+            lines.append(f"└ `{span['name']}` +{span['offset']*1000:.0f}ms {span['duration']*1000:.0f}ms {attrs}")
+    text = "\n".join(lines)
+    await ctx.send(text if len(text) <= 2000 else text[:1997] + "...")
+
 @bot.command(name='filter')
 async def filter_cmd(ctx, filter_name=None):
     if not await db.is_premium(ctx.guild.id):
-        await ctx.send(get_text(ctx.guild.id, "premium_only"))
+        await reply(ctx, "premium_only")
         return
     player = players.get(ctx.guild.id)
     if not player or not player.vc:
-        await ctx.send(get_text(ctx.guild.id, "nothing_playing"))
-        return
-    filters = {
-        'bass': 'bass=g=10',
-        'treble': 'treble=g=10',
-        'normalizer': 'dynaudnorm',
-        'vaporwave': 'asetrate=44100*0.8,aresample=44100,atempo=1.25',
-        'nightcore': 'asetrate=44100*1.25,aresample=44100,atempo=1.0',
-        'slow': 'atempo=0.8',
-        'fast': 'atempo=1.5',
-        'echo': 'aecho=0.8:0.9:1000:0.3',
-        'reverb': 'aecho=0.8:0.88:60:0.4',
-        'off': None
-    }
+        await reply(ctx, "nothing_playing")
+        return
     if filter_name == 'off':
         player.filter = None
+        restart_source(player)
         await ctx.send("✅ Filters disabled")
-    elif filter_name in filters:
-        player.filter = filters[filter_name]
+    elif filter_name in AUDIO_FILTERS:
+        player.filter = filter_name
+        if player.current:
+            await load_gain(player.current, player)
+        # Re-open the already-resolved stream at the current position; no new extraction
+        restart_source(player)
         await ctx.send(f"✅ Filter **{filter_name}** applied")
     else:
-        await ctx.send(f"Available filters: {', '.join(filters.keys())}")
+        await ctx.send(f"Available filters: {', '.join(list(AUDIO_FILTERS) + ['off'])}")
 
 @bot.command(name='filters')
 async def filters_list(ctx):
@@ -762,8 +2343,7 @@ async def filters_list(ctx):
                    "`off` - Disable filters")
 
 # ==================== START ====================
-keep_alive()
-
+# Extraction workers are spawned and re-import this module, so keep side effects under the guard
 if __name__ == "__main__":
     print("🔄 Starting Ultimate Music Bot...")
     try:
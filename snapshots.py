@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+import zlib
+
+# ==================== PLAYER SNAPSHOTS ====================
+# Player state is written as zlib-compressed JSON with short keys and each track
+# as a [webpage_url, title, duration, source, requester] row. Signed stream URLs
+# expire, so they are never stored; tracks are re-resolved after a restart.
+#
+# snapshot: {guild_id: {'v': voice channel, 't': text channel, 'c': track | None,
+#            'p': position, 'q': [track, ...], 'l': loop, 'a': loop_queue,
+#            'o': volume, 'f': filter, 'k': 24/7, 'z': paused}}
+
+VERSION = 1
+TRACK_KEYS = ('webpage_url', 'title', 'duration', 'source', 'requester')
+
+def pack_track(song):
+    return [song.get(key) for key in TRACK_KEYS]
+
+def unpack_track(row):
+    return dict(zip(TRACK_KEYS, row))
+
+def encode(players):
+    return zlib.compress(json.dumps({'version': VERSION, 'players': players}, separators=(',', ':')).encode(), 6)
+
+def decode(data):
+    snapshot = json.loads(zlib.decompress(data))
+    if snapshot.get('version') != VERSION:
+        return {}
+    return {int(guild_id): state for guild_id, state in snapshot['players'].items()}
+
+class SnapshotStore:
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+
+    async def save(self, players):
+        data = encode(players)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        self.size = len(data)
+
+    def _write(self, data):
+        # Write beside the target and rename so a crash never leaves half a snapshot
+        temp = f"{self.path}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+    async def load(self):
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read)
+        except FileNotFoundError:
+            return {}
+        try:
+            return decode(data)
+        except (ValueError, zlib.error, KeyError) as e:
+            print(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return {}
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+# ==================== SPOTIFY ====================
+# Spotify cannot be streamed, so a Spotify link is read for metadata through the
+# Web API and each track is played from a matching YouTube video. Metadata comes
+# in bulk: 50 tracks per /tracks call and 100 per playlist page, with the pages
+# of a long playlist fetched in parallel. Albums only list simplified tracks, so
+# their ISRCs come from the same batched /tracks calls.
+#
+# track: {'id': str, 'title': str, 'artists': [str], 'isrc': str | None, 'duration': seconds}
+
+SPOTIFY_URL_RE = re.compile(r'(?:open\.spotify\.com/(?:intl-[\w-]+/)?|spotify:)(track|album|playlist)[/:]([A-Za-z0-9]{22})')
+TRACKS_PER_CALL = 50
+ITEMS_PER_PAGE = 100
+PLAYLIST_FIELDS = "total,items(track(id,name,duration_ms,is_local,artists(name),external_ids(isrc)))"
+
+def parse_url(query):
+    # -> ('track' | 'album' | 'playlist', id), or None for anything else
+    match = SPOTIFY_URL_RE.search(query)
+    return (match.group(1), match.group(2)) if match else None
+
+def track_url(track_id):
+    return f"https://open.spotify.com/track/{track_id}"
+
+def _track(item):
+    # Local files and tracks removed from the catalog have no id and cannot be matched
+    if not item or not item.get('id') or item.get('is_local'):
+        return None
+    return {
+        'id': item['id'],
+        'title': item['name'],
+        'artists': [artist['name'] for artist in item.get('artists') or ()],
+        'isrc': (item.get('external_ids') or {}).get('isrc'),
+        'duration': (item.get('duration_ms') or 0) // 1000,
+    }
+
+def match_keys(track):
+    # Persistent match cache keys, most specific first. An ISRC names one recording;
+    # artist + title also catches the same song released on another album.
+    keys = []
+    if track['isrc']:
+        keys.append(f"isrc:{track['isrc'].upper()}")
+    artist = track['artists'][0] if track['artists'] else ""
+    keys.append("meta:" + " ".join(f"{artist} {track['title']}".lower().split()))
+    return keys
+
+def search_query(track):
+    return f"{', '.join(track['artists'][:2])} - {track['title']}"
+
+class SpotifyClient:
+    def __init__(self, client_id, client_secret, api_url=None, cache_size=4096):
+        # Imported here so the bot runs without spotipy when Spotify is not configured
+        import spotipy
+        from spotipy.cache_handler import MemoryCacheHandler
+        auth = spotipy.SpotifyClientCredentials(client_id, client_secret, cache_handler=MemoryCacheHandler())
+        if api_url:
+            # Point both the API and the token endpoint somewhere else, e.g. bench/fake_spotify.py
+            auth.OAUTH_TOKEN_URL = api_url.rstrip('/') + "/api/token"
+        # Parallel calls on a cold client would each fetch a token; the first one fetches
+        # it under the lock and the rest find it in the cache handler
+        token_lock = threading.Lock()
+        fetch_token = auth.get_access_token
+        def get_access_token(*args, **kwargs):
+            with token_lock:
+                return fetch_token(*args, **kwargs)
+        auth.get_access_token = get_access_token
+        self.sp = spotipy.Spotify(auth_manager=auth)
+        if api_url:
+            self.sp.prefix = api_url.rstrip('/') + "/v1/"
+        self.cache = OrderedDict()  # track id -> track
+        self.cache_size = cache_size
+        self.calls = 0
+        # spotipy is blocking; a few threads let playlist pages overlap
+        self.executor = ThreadPoolExecutor(4, thread_name_prefix="spotify")
+
+    async def _call(self, func, *args, **kwargs):
+        self.calls += 1
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def _remember(self, track):
+        self.cache[track['id']] = track
+        self.cache.move_to_end(track['id'])
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def resolve(self, kind, item_id, limit):
+        # -> (name, [track, ...]) for a track, album or playlist id
+        if kind == 'track':
+            tracks = await self.tracks([item_id])
+            return (tracks[0]['title'] if tracks else None), tracks
+        if kind == 'album':
+            return await self._album(item_id, limit)
+        return await self._playlist(item_id, limit)
+
+    async def tracks(self, track_ids):
+        found = {}
+        missing = []
+        for track_id in dict.fromkeys(track_ids):
+            if track_id in self.cache:
+                self.cache.move_to_end(track_id)
+                found[track_id] = self.cache[track_id]
+            else:
+                missing.append(track_id)
+        batches = [missing[i:i + TRACKS_PER_CALL] for i in range(0, len(missing), TRACKS_PER_CALL)]
+        for result in await asyncio.gather(*(self._call(self.sp.tracks, batch) for batch in batches)):
+            for track in map(_track, result['tracks']):
+                if track:
+                    self._remember(track)
+                    found[track['id']] = track
+        return [found[track_id] for track_id in track_ids if track_id in found]
+
+    async def _album(self, album_id, limit):
+        album = await self._call(self.sp.album, album_id)
+        page = album['tracks']
+        track_ids = []
+        while True:
+            track_ids.extend(item['id'] for item in page['items'] if item.get('id'))
+            if not page.get('next') or len(track_ids) >= limit:
+                break
+            page = await self._call(self.sp.next, page)
+        return album['name'], await self.tracks(track_ids[:limit])
+
+    async def _playlist(self, playlist_id, limit):
+        def page(offset):
+            return self._call(
+                self.sp.playlist_items, playlist_id, fields=PLAYLIST_FIELDS,
+                limit=ITEMS_PER_PAGE, offset=offset, additional_types=('track',),
+            )
+        info, first = await asyncio.gather(self._call(self.sp.playlist, playlist_id, fields="name"), page(0))
+        # The first page says how many there are; the rest are fetched side by side
+        total = min(first['total'], limit)
+        rest = await asyncio.gather(*(page(offset) for offset in range(ITEMS_PER_PAGE, total, ITEMS_PER_PAGE)))
+        tracks = []
+        for result in (first, *rest):
+            for item in result['items']:
+                track = _track(item.get('track'))
+                if track:
+                    self._remember(track)
+                    tracks.append(track)
+        return info['name'], tracks[:limit]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+def create_client():
+    if not (config.SPOTIFY_CLIENT_ID and config.SPOTIFY_CLIENT_SECRET):
+        return None
+    return SpotifyClient(config.SPOTIFY_CLIENT_ID, config.SPOTIFY_CLIENT_SECRET, config.SPOTIFY_API_URL)
@@ -1,2 +1,7 @@
 #!/bin/bash
-python main.py
+# CLUSTER_COUNT=N splits the shards across N bot processes
+if [ -n "$CLUSTER_COUNT" ]; then
+    python launcher.py
+else
+    python main.py
+fi
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+# ==================== STORAGE BACKENDS ====================
+# Durable homes for Database. Reads are served from Database's in-memory dicts;
+# backends only see bulk loads and batched write-behind flushes.
+#
+# guild rows:    {'prefix': str | None, 'lang': str | None, 'premium': bool}
+# playlist rows: (user_id, name) -> list of urls, or None when deleted
+# match rows:    Spotify match key ('isrc:...' or 'meta:artist title') -> YouTube video id
+# loudness rows: webpage_url -> (integrated LUFS, true peak dBTP or None)
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        # sqlite3 connections belong to one thread; every call goes through this one
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="sqlite")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def connect(self):
+        await self._run(self._connect)
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS guilds (guild_id INTEGER PRIMARY KEY, prefix TEXT, lang TEXT, premium INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS playlists (user_id INTEGER, name TEXT, songs TEXT, PRIMARY KEY (user_id, name))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS spotify_matches (key TEXT PRIMARY KEY, video_id TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS track_loudness (webpage_url TEXT PRIMARY KEY, lufs REAL, peak REAL)")
+        self.conn.commit()
+
+    async def load_guilds(self, guild_ids):
+        return await self._run(self._load_guilds, list(guild_ids))
+
+    def _load_guilds(self, guild_ids):
+        rows = {}
+        for i in range(0, len(guild_ids), 500):
+            chunk = guild_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for guild_id, prefix, lang, premium in self.conn.execute(
+                f"SELECT guild_id, prefix, lang, premium FROM guilds WHERE guild_id IN ({placeholders})", chunk
+            ):
+                rows[guild_id] = {'prefix': prefix, 'lang': lang, 'premium': bool(premium)}
+        return rows
+
+    async def load_playlists(self, user_id):
+        return await self._run(self._load_playlists, user_id)
+
+    def _load_playlists(self, user_id):
+        return {
+            name: json.loads(songs)
+            for name, songs in self.conn.execute("SELECT name, songs FROM playlists WHERE user_id = ?", (user_id,))
+        }
+
+    async def load_matches(self, keys):
+        return await self._run(self._load_matches, list(keys))
+
+    def _load_matches(self, keys):
+        rows = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(self.conn.execute(
+                f"SELECT key, video_id FROM spotify_matches WHERE key IN ({placeholders})", chunk
+            ))
+        return rows
+
+    async def load_loudness(self, urls):
+        return await self._run(self._load_loudness, list(urls))
+
+    def _load_loudness(self, urls):
+        rows = {}
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for url, lufs, peak in self.conn.execute(
+                f"SELECT webpage_url, lufs, peak FROM track_loudness WHERE webpage_url IN ({placeholders})", chunk
+            ):
+                rows[url] = (lufs, peak)
+        return rows
+
+    async def write(self, guilds, playlists, matches, loudness):
+        await self._run(self._write, guilds, playlists, matches, loudness)
+
+    def _write(self, guilds, playlists, matches, loudness):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO guilds (guild_id, prefix, lang, premium) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET prefix = excluded.prefix, lang = excluded.lang, "
+                "premium = excluded.premium",
+                [(guild_id, row['prefix'], row['lang'], int(row['premium'])) for guild_id, row in guilds.items()],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO playlists (user_id, name, songs) VALUES (?, ?, ?)",
+                [(user_id, name, json.dumps(songs)) for (user_id, name), songs in playlists.items() if songs is not None],
+            )
+            self.conn.executemany(
+                "DELETE FROM playlists WHERE user_id = ? AND name = ?",
+                [(user_id, name) for (user_id, name), songs in playlists.items() if songs is None],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO spotify_matches (key, video_id) VALUES (?, ?)", list(matches.items())
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO track_loudness (webpage_url, lufs, peak) VALUES (?, ?, ?)",
+                [(url, lufs, peak) for url, (lufs, peak) in loudness.items()],
+            )
+
+    async def close(self):
+        if self.conn:
+            await self._run(self.conn.close)
+            self.conn = None
+        self.executor.shutdown(wait=False)
+
+class MongoBackend:
+    def __init__(self, uri, database):
+        # Imported here so the memory and SQLite backends work without motor installed
+        from motor.motor_asyncio import AsyncIOMotorClient
+        self.client = AsyncIOMotorClient(uri)
+        self.db = self.client[database]
+
+    async def connect(self):
+        await self.db.playlists.create_index([("user_id", 1)])
+
+    async def load_guilds(self, guild_ids):
+        rows = {}
+        guild_ids = list(guild_ids)
+        for i in range(0, len(guild_ids), 1000):
+            async for doc in self.db.guilds.find({'_id': {'$in': guild_ids[i:i + 1000]}}):
+                rows[doc['_id']] = {
+                    'prefix': doc.get('prefix'),
+                    'lang': doc.get('lang'),
+                    'premium': doc.get('premium', False),
+                }
+        return rows
+
+    async def load_playlists(self, user_id):
+        return {doc['name']: doc['songs'] async for doc in self.db.playlists.find({'user_id': user_id})}
+
+    async def load_matches(self, keys):
+        rows = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 1000):
+            async for doc in self.db.spotify_matches.find({'_id': {'$in': keys[i:i + 1000]}}):
+                rows[doc['_id']] = doc['video_id']
+        return rows
+
+    async def load_loudness(self, urls):
+        rows = {}
+        urls = list(urls)
+        for i in range(0, len(urls), 1000):
+            async for doc in self.db.track_loudness.find({'_id': {'$in': urls[i:i + 1000]}}):
+                rows[doc['_id']] = (doc['lufs'], doc.get('peak'))
+        return rows
+
+    async def write(self, guilds, playlists, matches, loudness):
+        from pymongo import DeleteOne, UpdateOne
+        if guilds:
+            await self.db.guilds.bulk_write(
+                [UpdateOne({'_id': guild_id}, {'$set': row}, upsert=True) for guild_id, row in guilds.items()],
+                ordered=False,
+            )
+        if playlists:
+            ops = []
+            for (user_id, name), songs in playlists.items():
+                key = {'_id': f"{user_id}:{name}"}
+                if songs is None:
+                    ops.append(DeleteOne(key))
+                else:
+                    ops.append(UpdateOne(key, {'$set': {'user_id': user_id, 'name': name, 'songs': songs}}, upsert=True))
+            await self.db.playlists.bulk_write(ops, ordered=False)
+        if matches:
+            await self.db.spotify_matches.bulk_write(
+                [UpdateOne({'_id': key}, {'$set': {'video_id': video_id}}, upsert=True) for key, video_id in matches.items()],
+                ordered=False,
+            )
+        if loudness:
+            await self.db.track_loudness.bulk_write(
+                [UpdateOne({'_id': url}, {'$set': {'lufs': lufs, 'peak': peak}}, upsert=True)
+                 for url, (lufs, peak) in loudness.items()],
+                ordered=False,
+            )
+
+    async def close(self):
+        self.client.close()
+
+def create_storage(kind):
+    if kind == "sqlite":
+        return SQLiteBackend(config.DB_PATH)
+    if kind == "mongo":
+        return MongoBackend(config.MONGO_URI, config.MONGO_DB)
+    return None
@@ -0,0 +1,29 @@
+import asyncio
+import main
+
+class StalledStorage:
+    # The first write hangs until cancelled; later writes are recorded
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.writes = []
+
+    async def write(self, guilds, playlists, matches, loudness):
+        if not self.started.is_set():
+            self.started.set()
+            await asyncio.Event().wait()
+        self.writes.append(matches)
+
+    async def close(self):
+        pass
+
+def test_cancelled_flush_keeps_its_batch_for_close():
+    async def run():
+        storage = StalledStorage()
+        db = main.Database(storage)
+        await db.set_matches(["isrc:QZFAK0000001"], "aaaaaaaaaaa")
+        db.flush_task = asyncio.ensure_future(db.flush())
+        await storage.started.wait()
+        await db.close()
+        assert storage.writes == [{"isrc:QZFAK0000001": "aaaaaaaaaaa"}]
+        assert not db.dirty_matches
+    asyncio.run(run())
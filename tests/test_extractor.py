@@ -0,0 +1,105 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import yt_dlp
+import extractor
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    seen = []
+
+    def do_GET(self):
+        RecordingHandler.seen.append(self.headers['User-Agent'])
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    RecordingHandler.seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), RecordingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+def send_with_user_agent(pool, url, user_agent):
+    with pool.acquire() as ydl:
+        headers = ydl.params['http_headers'].copy()
+        headers['User-Agent'] = user_agent
+        extractor.set_headers(ydl, headers)
+        ydl.urlopen(url).read()
+        return ydl
+
+def test_pooled_instance_sends_the_current_user_agent(server):
+    pool = extractor.YDLPool(extractor._strategy_opts('random_ua'), 1)
+    first = send_with_user_agent(pool, server, 'UA-ONE')
+    second = send_with_user_agent(pool, server, 'UA-TWO')
+    assert first is second
+    assert RecordingHandler.seen == ['UA-ONE', 'UA-TWO']
+
+def test_release_restores_the_default_user_agent(server):
+    pool = extractor.YDLPool(extractor._strategy_opts('random_ua'), 1)
+    send_with_user_agent(pool, server, 'UA-ONE')
+    with pool.acquire() as ydl:
+        ydl.urlopen(server).read()
+    assert RecordingHandler.seen[-1] == pool.headers['User-Agent'] != 'UA-ONE'
+
+def test_random_ua_strategy_rotates_the_sent_header(server, monkeypatch):
+    pool = extractor.YDLPool(extractor._strategy_opts('random_ua'), 1)
+    monkeypatch.setitem(extractor.pools, 'random_ua', pool)
+    agents = iter(extractor.USER_AGENTS[:2])
+    monkeypatch.setattr(extractor.random, 'choice', lambda options: next(agents))
+    def extract_info(ydl, query, download=False):
+        ydl.urlopen(server).read()
+        return None
+    monkeypatch.setattr(extractor.yt_dlp.YoutubeDL, 'extract_info', extract_info)
+    extractor._extract_with_opts(server, 'random_ua')
+    extractor._extract_with_opts(server, 'random_ua')
+    assert RecordingHandler.seen == extractor.USER_AGENTS[:2]
+
+def test_ranking_counts_the_time_spent_failing():
+    tracker = extractor.StrategyTracker(['slow_fails', 'steady'], 20)
+    for _ in range(5):
+        # Fast when it works, but its failures wait out a 10s timeout
+        tracker.record('slow_fails', True, 0.5)
+        tracker.record('slow_fails', False, 10.0)
+        tracker.record('steady', True, 2.0)
+    assert tracker.ranked() == ['steady', 'slow_fails']
+
+def test_untried_strategies_rank_after_proven_ones():
+    tracker = extractor.StrategyTracker(['untried', 'failing', 'slow'], 20)
+    tracker.record('slow', True, 8.0)
+    tracker.record('failing', False, 0.1)
+    ranked = tracker.ranked()
+    assert ranked[0] == 'slow'
+    assert set(ranked[1:]) == {'untried', 'failing'}
+
+def stub_playlist(monkeypatch, length, broken_after=None, gaps=()):
+    # A lazy playlist like YouTube's; a continuation page may fail partway through
+    def entries():
+        for i in range(length):
+            if i == broken_after:
+                raise yt_dlp.utils.ExtractorError("Unable to download API page")
+            yield None if i in gaps else {'id': f"{i:011d}", 'title': f"track {i}", 'duration': 100}
+    def extract_info(self, url, download=True, process=True, ie_key=None):
+        return {'_type': 'playlist', 'title': "Stub", 'entries': entries()}
+    monkeypatch.setattr(yt_dlp.YoutubeDL, 'extract_info', extract_info)
+
+def test_expand_playlist_counts_the_entries_it_skips(monkeypatch):
+    stub_playlist(monkeypatch, 100, gaps={3})
+    title, entries, walked = extractor.expand_playlist("https://www.youtube.com/playlist?list=PL1", 0, 50)
+    assert title == "Stub"
+    assert len(entries) == 49
+    assert walked == 50
+
+def test_expand_playlist_keeps_the_pages_before_a_failed_one(monkeypatch):
+    stub_playlist(monkeypatch, 300, broken_after=120)
+    _, entries, walked = extractor.expand_playlist("https://www.youtube.com/playlist?list=PL1", 50, 1000)
+    assert walked == 70
+    assert entries[0]['title'] == "track 50"
+    assert entries[-1]['title'] == "track 119"
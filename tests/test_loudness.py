@@ -0,0 +1,47 @@
+import asyncio
+import os
+import stat
+import pytest
+import loudness
+
+def stalled_ffmpeg(tmp_path, monkeypatch):
+    # An ffmpeg that never finishes, like a download stuck on a dead connection
+    script = tmp_path / "ffmpeg"
+    script.write_text(f"#!/bin/sh\necho $$ > {tmp_path / 'pid'}\nexec sleep 60\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return tmp_path / "pid"
+
+def assert_killed(pid_file):
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+async def nothing(webpage_url, measurement):
+    raise AssertionError("a failed analysis has no measurement")
+
+def test_stalled_analysis_times_out_and_kills_ffmpeg(tmp_path, monkeypatch):
+    pid_file = stalled_ffmpeg(tmp_path, monkeypatch)
+    wait_for = asyncio.wait_for
+    monkeypatch.setattr(loudness.asyncio, 'wait_for', lambda awaitable, timeout: wait_for(awaitable, 0.5))
+    async def run():
+        analyzer = loudness.LoudnessAnalyzer()
+        analyzer.analyse("https://www.youtube.com/watch?v=aaaaaaaaaaa", "stream", True, 30, nothing)
+        await asyncio.gather(*analyzer.pending.values())
+        assert analyzer.failures == 1
+        assert not analyzer.pending
+    asyncio.run(run())
+    assert_killed(pid_file)
+
+def test_cancelled_analysis_kills_ffmpeg(tmp_path, monkeypatch):
+    pid_file = stalled_ffmpeg(tmp_path, monkeypatch)
+    async def run():
+        analyzer = loudness.LoudnessAnalyzer()
+        analyzer.analyse("https://www.youtube.com/watch?v=aaaaaaaaaaa", "stream", True, None, nothing)
+        task = analyzer.pending["https://www.youtube.com/watch?v=aaaaaaaaaaa"]
+        while not pid_file.exists():
+            await asyncio.sleep(0.05)
+        analyzer.close()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(run())
+    assert_killed(pid_file)
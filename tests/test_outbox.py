@@ -0,0 +1,62 @@
+import asyncio
+import main
+
+class Channel:
+    id = 1
+
+    def __init__(self):
+        self.log = []
+
+    async def send(self, content):
+        self.log.append(("send", content))
+        return Message(self, content)
+
+class Message:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        self.channel.log.append(("edit", self.content, content))
+        self.content = content
+
+def quick_outbox(monkeypatch):
+    monkeypatch.setattr(main.config, 'OUTBOX_WINDOW', 0.01)
+    monkeypatch.setattr(main.config, 'OUTBOX_STATUS_TTL', 0.2)
+    return main.Outbox()
+
+async def drained(outbox):
+    while any(box.task for box in outbox.channels.values()):
+        await asyncio.sleep(0.01)
+
+def test_status_is_edited_into_the_next_reply_while_fresh(monkeypatch):
+    async def run():
+        outbox, channel = quick_outbox(monkeypatch), Channel()
+        outbox.send(channel, "🔍 Searching...", transient=True)
+        await drained(outbox)
+        outbox.send(channel, "✅ Added")
+        await drained(outbox)
+        assert channel.log == [("send", "🔍 Searching..."), ("edit", "🔍 Searching...", "✅ Added")]
+    asyncio.run(run())
+
+def test_stale_status_is_not_edited_by_an_unrelated_reply(monkeypatch):
+    async def run():
+        outbox, channel = quick_outbox(monkeypatch), Channel()
+        outbox.send(channel, "🔊 Joined", transient=True)
+        await drained(outbox)
+        await asyncio.sleep(0.3)
+        outbox.send(channel, "⏸️ Paused")
+        await drained(outbox)
+        assert channel.log == [("send", "🔊 Joined"), ("send", "⏸️ Paused")]
+    asyncio.run(run())
+
+def test_replaced_statuses_are_counted_apart_from_drops(monkeypatch):
+    async def run():
+        outbox, channel = quick_outbox(monkeypatch), Channel()
+        outbox.send(channel, "🔍 Searching...", transient=True)
+        outbox.send(channel, "🔍 Still searching...", transient=True)
+        await drained(outbox)
+        stats = outbox.stats()
+        assert (stats['replaced'], stats['dropped']) == (1, 0)
+        assert outbox.budget(channel.id) == main.config.OUTBOX_BURST - 1
+    asyncio.run(run())
@@ -0,0 +1,255 @@
+import asyncio
+from types import SimpleNamespace
+import discord
+from discord.player import AudioPlayer
+import main
+
+class SilentAudio(discord.AudioSource):
+    def read(self):
+        return b"\x00" * 3840
+
+    def cleanup(self):
+        pass
+
+class PlayerVoiceClient:
+    # Just enough of VoiceClient around discord.py's real AudioPlayer (thread not started)
+    def __init__(self, source):
+        self._player = AudioPlayer(source, self)
+
+    def is_playing(self):
+        return self._player.is_playing()
+
+    def is_paused(self):
+        return self._player.is_paused()
+
+    def pause(self):
+        self._player.pause(update_speaking=False)
+
+    @property
+    def source(self):
+        return self._player.source
+
+    @source.setter
+    def source(self, value):
+        self._player.set_source(value)
+
+def paused_player(monkeypatch):
+    monkeypatch.setattr(main, 'build_source', lambda song, player, start=0.0: main.PlayerSource(SilentAudio(), start))
+    player = main.MusicPlayer(1)
+    player.current = {'webpage_url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa', 'url': 'x', 'duration': 60}
+    player.source = main.PlayerSource(SilentAudio())
+    player.vc = PlayerVoiceClient(main.wrap_volume(player.source, player.volume))
+    player.vc.pause()
+    return player
+
+def test_restart_source_keeps_a_paused_track_paused(monkeypatch):
+    async def run():
+        monkeypatch.setattr(main.bot, 'loop', asyncio.get_running_loop(), raising=False)
+        player = paused_player(monkeypatch)
+        old = player.source
+        main.restart_source(player)
+        assert player.source is not old
+        assert player.vc.is_paused()
+    asyncio.run(run())
+
+class FakeFFmpeg(SilentAudio):
+    # Records how a source would have been spawned instead of starting ffmpeg
+    def __init__(self, url, codec=None, **kwargs):
+        self.url = url
+        self.codec = codec
+        self.kwargs = kwargs
+
+class FakeOpus(FakeFFmpeg):
+    def is_opus(self):
+        return True
+
+def passthrough(monkeypatch):
+    monkeypatch.setattr(main.config, 'OPUS_PASSTHROUGH', True)
+    monkeypatch.setattr(main, 'audio_cache', None)
+    monkeypatch.setattr(main.discord, 'FFmpegOpusAudio', FakeOpus)
+    monkeypatch.setattr(main.discord, 'FFmpegPCMAudio', FakeFFmpeg)
+    player = main.MusicPlayer(1)
+    player.current = {'webpage_url': 'https://www.youtube.com/watch?v=aaaaaaaaaaa',
+                      'url': 'https://rr1.googlevideo.com/videoplayback?itag=251', 'duration': 60}
+    return player
+
+def test_passthrough_copies_opus_at_the_default_volume(monkeypatch):
+    player = passthrough(monkeypatch)
+    source = main.build_source(player.current, player)
+    assert source.is_opus()
+    assert source.original.codec == 'opus'
+
+def test_passthrough_plays_other_volumes_as_pcm(monkeypatch):
+    player = passthrough(monkeypatch)
+    player.volume = 0.5
+    source = main.build_source(player.current, player)
+    assert not source.is_opus()
+    assert isinstance(main.wrap_volume(source, player.volume), discord.PCMVolumeTransformer)
+
+def test_set_volume_on_a_paused_passthrough_track_stays_paused(monkeypatch):
+    async def run():
+        monkeypatch.setattr(main.bot, 'loop', asyncio.get_running_loop(), raising=False)
+        player = passthrough(monkeypatch)
+        player.source = main.build_source(player.current, player)
+        player.vc = PlayerVoiceClient(main.wrap_volume(player.source, player.volume))
+        player.vc.pause()
+        main.set_volume(player, 0.5)
+        assert isinstance(player.vc.source, discord.PCMVolumeTransformer)
+        assert player.vc.source.volume == 0.5
+        assert player.vc.is_paused()
+    asyncio.run(run())
+
+class IdleVoiceClient:
+    def __init__(self):
+        self.played = []
+
+    def is_playing(self):
+        return False
+
+    def is_paused(self):
+        return False
+
+    def play(self, source, after=None):
+        self.played.append(source)
+
+def test_restored_position_is_not_applied_to_a_later_track(monkeypatch):
+    async def run():
+        starts = []
+        async def ensure_playable(song):
+            return song['url'] != 'gone'
+        async def nothing(*args):
+            pass
+        def build_source(song, player, start=0.0):
+            starts.append((song['title'], start))
+            return main.PlayerSource(SilentAudio(), start)
+        monkeypatch.setattr(main, 'ensure_playable', ensure_playable)
+        monkeypatch.setattr(main, 'load_gain', nothing)
+        monkeypatch.setattr(main, 'prepare_next', nothing)
+        monkeypatch.setattr(main, 'build_source', build_source)
+        monkeypatch.setattr(main, 'audio_cache', None)
+        player = main.MusicPlayer(1)
+        player.panel.refresh = lambda: None
+        player.vc = IdleVoiceClient()
+        # Restored with no text channel, and the saved track has since been removed
+        player.queue.extend([
+            {'title': 'saved', 'url': 'gone', 'webpage_url': 'a', 'duration': 60},
+            {'title': 'next', 'url': 'ok', 'webpage_url': 'b', 'duration': 60},
+        ])
+        player.resume_at = 42.0
+        monkeypatch.setitem(main.players, 1, player)
+        await main._play_next(None, 1)
+        player.close()
+        assert starts == [('next', 0.0)]
+        assert player.resume_at == 0.0
+        assert len(player.vc.played) == 1
+    asyncio.run(run())
+
+class Message:
+    def __init__(self, content):
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+
+class PlaylistContext:
+    def __init__(self):
+        self.guild = SimpleNamespace(id=1)
+        self.author = SimpleNamespace(name="tester")
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(Message(content))
+        return self.sent[-1]
+
+def test_playlist_listing_continues_past_skipped_entries(monkeypatch):
+    async def run():
+        pages = []
+        def expand_playlist(url, start, stop):
+            # 120 raw entries; the 4th is a deleted video that yt-dlp lists without an id
+            pages.append((start, stop))
+            raw = range(start, min(stop, 120))
+            entries = [{'webpage_url': f"https://www.youtube.com/watch?v={i:011d}", 'title': f"track {i}",
+                        'duration': 100, 'channel': '', 'source': 'youtube'} for i in raw if i != 3]
+            return "Stub", entries, len(raw)
+        class Inline:
+            async def run(self, func, *args):
+                return func(*args)
+        monkeypatch.setattr(main, 'expand_playlist', expand_playlist)
+        monkeypatch.setattr(main, 'extraction', Inline())
+        player = main.MusicPlayer(1)
+        monkeypatch.setitem(main.players, 1, player)
+        ctx = PlaylistContext()
+        await main.enqueue_playlist(ctx, player, "https://www.youtube.com/playlist?list=PL1")
+        player.close()
+        titles = [song['title'] for song in player.queue]
+        assert len(titles) == 119
+        assert len(set(titles)) == 119
+        assert pages == [(0, 50), (50, main.config.PLAYLIST_MAX_TRACKS)]
+    asyncio.run(run())
+
+class PanelMessage:
+    def __init__(self):
+        self.edits = []
+
+    async def edit(self, **kwargs):
+        self.edits.append(kwargs)
+
+def test_finished_queue_leaves_a_final_panel_without_controls(monkeypatch):
+    async def run():
+        async def nothing(*args):
+            pass
+        monkeypatch.setattr(main, 'prepare_next', nothing)
+        player = main.MusicPlayer(1)
+        player.vc = IdleVoiceClient()
+        player.vc.disconnect = nothing
+        player.current = {'title': 'last', 'url': 'ok', 'webpage_url': 'a', 'duration': 60,
+                          'source': 'youtube', 'requester': 'tester'}
+        message = player.panel.message = PanelMessage()
+        monkeypatch.setitem(main.players, 1, player)
+        await main._play_next(None, 1)
+        await asyncio.sleep(0)
+        assert 1 not in main.players
+        assert len(message.edits) == 1
+        assert message.edits[0]['view'] is None
+        assert message.edits[0]['embed'].description == main.get_text(1, "queue_finished")
+    asyncio.run(run())
+
+class EvictingCache:
+    # A cached track whose file is evicted while the gain is being looked up
+    def __init__(self):
+        self.cached = True
+
+    def contains(self, song):
+        return self.cached
+
+    def path(self, song):
+        return "/cache/track.opus" if self.cached else None
+
+    def played(self, song, local, opus=False):
+        pass
+
+def test_track_evicted_during_gain_lookup_plays_from_its_stream(monkeypatch):
+    async def run():
+        cache = EvictingCache()
+        async def load_gain(song, player):
+            cache.cached = False
+        async def resolve_stream(song):
+            song['url'] = "https://rr1.googlevideo.com/videoplayback?itag=140"
+            return song['url']
+        async def nothing(*args):
+            pass
+        monkeypatch.setattr(main, 'audio_cache', cache)
+        monkeypatch.setattr(main, 'load_gain', load_gain)
+        monkeypatch.setattr(main, 'resolve_stream', resolve_stream)
+        monkeypatch.setattr(main, 'prepare_next', nothing)
+        monkeypatch.setattr(main.discord, 'FFmpegPCMAudio', FakeFFmpeg)
+        player = main.MusicPlayer(1)
+        player.panel.refresh = lambda: None
+        player.vc = IdleVoiceClient()
+        player.queue.append({'title': 'cached', 'webpage_url': 'a', 'duration': 60})
+        monkeypatch.setitem(main.players, 1, player)
+        await main._play_next(None, 1)
+        player.close()
+        assert player.source.original.url.startswith("https://rr1.googlevideo.com/")
+        assert len(player.vc.played) == 1
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+import asyncio
+import main
+import spotify
+import storage
+from bench import fake_spotify
+
+def candidate(video_id, duration, channel="Someone"):
+    return {'webpage_url': main.youtube_url(video_id), 'duration': duration, 'channel': channel}
+
+TRACK = {'id': 'x', 'title': 'Song', 'artists': ['Artist'], 'isrc': None, 'duration': 200}
+
+def test_pick_match_prefers_a_topic_upload_within_tolerance():
+    candidates = [
+        candidate('aaaaaaaaaaa', 200),
+        candidate('bbbbbbbbbbb', 200 + main.config.SPOTIFY_MATCH_TOLERANCE, "Artist - Topic"),
+    ]
+    assert main.pick_match(TRACK, candidates)['webpage_url'] == main.youtube_url('bbbbbbbbbbb')
+
+def test_pick_match_ignores_topic_uploads_outside_tolerance():
+    candidates = [
+        candidate('aaaaaaaaaaa', 200 + main.config.SPOTIFY_MATCH_TOLERANCE + 1, "Artist - Topic"),
+        candidate('bbbbbbbbbbb', 230),
+        candidate('ccccccccccc', 190),
+    ]
+    assert main.pick_match(TRACK, candidates)['webpage_url'] == main.youtube_url('ccccccccccc')
+
+def test_pick_match_skips_results_that_are_not_videos():
+    candidates = [{'webpage_url': "https://www.youtube.com/channel/UC123", 'duration': 200, 'channel': None}]
+    assert main.pick_match(TRACK, candidates) is None
+
+async def fake_api(playlist_length=250):
+    api = fake_spotify.FakeSpotify()
+    api.latency = 0.01
+    api.playlist_length = playlist_length
+    return api, await api.start()
+
+def test_playlist_pages_are_fetched_in_bulk_with_one_token():
+    async def run():
+        api, base = await fake_api(250)
+        client = spotify.SpotifyClient("id", "secret", base)
+        try:
+            name, tracks = await client.resolve('playlist', fake_spotify.spotify_id("p"), 1000)
+        finally:
+            client.close()
+            await api.close()
+        # Items 96 and 193 are local files
+        assert len(tracks) == 248
+        assert name.startswith("Fake playlist")
+        # Three pages side by side on a cold client still share a single token
+        assert api.requests == {'token': 1, 'playlist': 1, 'playlist_items': 3}
+    asyncio.run(run())
+
+def test_album_isrcs_come_from_batched_track_calls():
+    async def run():
+        api, base = await fake_api()
+        client = spotify.SpotifyClient("id", "secret", base)
+        try:
+            _, tracks = await client.resolve('album', fake_spotify.spotify_id("a"), 1000)
+            # Every track is in the client's cache now
+            await client.tracks([track['id'] for track in tracks[:10]])
+        finally:
+            client.close()
+            await api.close()
+        assert len(tracks) == api.album_length
+        assert all(track['isrc'] for track in tracks)
+        # 120 ids in batches of 50
+        assert api.requests == {'token': 1, 'album': 1, 'album_tracks': 2, 'tracks': 3}
+    asyncio.run(run())
+
+class CountingSearch:
+    # Stands in for SearchCache: one result per query, the length of the Spotify track
+    def __init__(self, durations):
+        self.durations = durations
+        self.queries = []
+
+    async def search(self, query):
+        self.queries.append(query)
+        video_id = f"{len(self.queries):011d}"
+        return [candidate(video_id, self.durations[query])]
+
+def test_warm_run_reuses_stored_matches_without_searching(tmp_path, monkeypatch):
+    async def run():
+        api, base = await fake_api(120)
+        client = spotify.SpotifyClient("id", "secret", base)
+        try:
+            _, tracks = await client.resolve('playlist', fake_spotify.spotify_id("p"), 1000)
+        finally:
+            client.close()
+            await api.close()
+        searches = CountingSearch({spotify.search_query(track): track['duration'] for track in tracks})
+        monkeypatch.setattr(main, 'searches', searches)
+        path = str(tmp_path / "matches.db")
+        matched = {}
+        for label in ("cold", "warm"):
+            # Only the database carries over, as after a restart
+            monkeypatch.setattr(main, 'db', main.Database(storage.SQLiteBackend(path)))
+            await main.db.connect()
+            matched[label] = [await main.match_track(track) for track in tracks]
+            await main.db.close()
+            if label == "cold":
+                searched = len(searches.queries)
+        assert searched == len(set(map(spotify.search_query, tracks)))
+        assert len(searches.queries) == searched
+        assert matched["warm"] == matched["cold"]
+        assert all(matched["warm"])
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+import random
+from collections import Counter
+from trackqueue import TrackQueue
+
+def tracks(count):
+    return [{'title': f"track {i}", 'duration': i} for i in range(count)]
+
+def test_positional_operations_match_a_list():
+    rng = random.Random(7)
+    model = tracks(200)
+    queue = TrackQueue(model)
+    for step in range(500):
+        operation = rng.choice(("pop", "insert", "move", "drop", "append"))
+        if operation == "pop" and model:
+            index = rng.randrange(len(model))
+            assert queue.pop(index) is model.pop(index)
+        elif operation == "insert":
+            index = rng.randrange(len(model) + 1)
+            value = {'title': f"new {step}", 'duration': step}
+            model.insert(index, value)
+            queue.insert(index, value)
+        elif operation == "move" and model:
+            source, target = rng.randrange(len(model)), rng.randrange(len(model))
+            model.insert(target, model.pop(source))
+            queue.move(source, target)
+        elif operation == "drop":
+            count = rng.randrange(3)
+            del model[:count]
+            queue.drop(count)
+        elif operation == "append":
+            value = {'title': f"new {step}", 'duration': step}
+            model.append(value)
+            queue.append(value)
+        assert queue.total_duration == sum(track['duration'] for track in model)
+    assert list(queue) == model
+    assert queue.page(5, 10) == model[5:15]
+
+def test_shuffle_keeps_every_track_and_the_total():
+    queue = TrackQueue(tracks(1000))
+    queue.shuffle()
+    queue.move(999, 0)
+    queue.pop(500)
+    queue.drop(10)
+    remaining = list(queue)
+    assert len(remaining) == 989
+    assert len({track['title'] for track in remaining}) == 989
+    assert queue.total_duration == sum(track['duration'] for track in remaining)
+
+def test_popping_the_tail_of_a_shuffled_queue_settles_nothing():
+    queue = TrackQueue(tracks(1000))
+    queue.shuffle()
+    queue.pop()
+    assert queue.shuffled == 0
+    assert queue.shuffle_end == 999
+
+def test_tail_pop_after_shuffle_is_uniform():
+    seen = Counter()
+    for _ in range(4000):
+        queue = TrackQueue(tracks(4))
+        queue.shuffle()
+        seen[queue.pop()['title']] += 1
+    assert all(800 < seen[f"track {i}"] < 1200 for i in range(4))
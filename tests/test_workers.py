@@ -0,0 +1,84 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import pytest
+import yt_dlp
+import extractor
+import workers
+
+def test_crashed_worker_raises_extraction_error_and_is_replaced():
+    async def run():
+        backend = workers.ProcessBackend(1, timeout=30, max_jobs=10)
+        try:
+            with pytest.raises(workers.ExtractionError):
+                await backend.run(os._exit, 1)
+            assert backend.killed == 1
+            # The replacement worker takes the next job
+            assert await backend.run(abs, -3) == 3
+            # A dead worker's pipe fails on send instead of on read
+            worker = backend.idle.get_nowait()
+            worker.process.kill()
+            worker.process.join()
+            backend.idle.put_nowait(worker)
+            with pytest.raises(workers.ExtractionError):
+                await backend.run(abs, -3)
+            assert backend.killed == 2
+            assert await backend.run(abs, -4) == 4
+        finally:
+            backend.close()
+    asyncio.run(run())
+
+def test_thread_backend_reports_extractor_failures_as_extraction_error(monkeypatch):
+    def extract_info(self, url, *args, **kwargs):
+        raise yt_dlp.utils.DownloadError("ERROR: unable to download webpage")
+    monkeypatch.setattr(yt_dlp.YoutubeDL, 'extract_info', extract_info)
+    async def run():
+        backend = workers.ThreadBackend(1, timeout=30)
+        try:
+            with pytest.raises(workers.ExtractionError, match="^DownloadError: ERROR: unable"):
+                await backend.run(extractor.search_flat, "some song", 5)
+            with pytest.raises(workers.ExtractionError, match="^DownloadError: ERROR: unable"):
+                await backend.run(extractor.expand_playlist, "https://www.youtube.com/playlist?list=PL1", 0, 50)
+        finally:
+            backend.close()
+    asyncio.run(run())
+
+def test_slow_job_times_out_instead_of_counting_as_a_crash():
+    async def run():
+        backend = workers.ProcessBackend(1, timeout=0.5, max_jobs=10)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await backend.run(time.sleep, 5)
+            assert backend.killed == 1
+            assert await backend.run(abs, -3) == 3
+        finally:
+            backend.close()
+    asyncio.run(run())
+
+SCRIPT = """
+import asyncio, os, sys
+sys.path.insert(0, {root!r})
+import workers
+if __name__ == "__mp_main__":
+    open({marker!r}, "a").write("imported")
+async def run():
+    backend = workers.ProcessBackend(1, timeout=30, max_jobs=10)
+    try:
+        print(await backend.run(abs, -3))
+    finally:
+        backend.close()
+if __name__ == "__main__":
+    asyncio.run(run())
+"""
+
+def test_workers_do_not_import_the_parent_script(tmp_path):
+    # Run as a script the way main.py is, so __main__ has a file a spawned child could import
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    marker = tmp_path / "imported"
+    script = tmp_path / "bot.py"
+    script.write_text(SCRIPT.format(root=root, marker=str(marker)))
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip() == "3", result.stderr
+    assert not marker.exists()
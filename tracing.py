@@ -0,0 +1,172 @@
+import contextvars
+import heapq
+import itertools
+import json
+import time
+
+# ==================== TRACING ====================
+# A trace is one user-visible request (a !play, a track change) broken into
+# timed spans. The current trace follows the task through a ContextVar, so
+# nested calls add spans without passing it around. With tracing disabled every
+# entry point returns a shared no-op object.
+
+_current = contextvars.ContextVar('trace', default=None)
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NO_SPAN = _NoSpan()
+
+class Span:
+    __slots__ = ('trace', 'name', 'attrs', 'start')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.trace.add(self.name, self.start, time.perf_counter(), self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+class Trace:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.wall = time.time()
+        self.end = None
+        self.spans = []
+        self.pending = 0
+        self.closed = False
+        self.token = None
+
+    def add(self, name, start, end, attrs):
+        if not self.closed:
+            self.spans.append((name, start - self.start, end - start, attrs))
+
+    def span(self, name, **attrs):
+        return Span(self, name, attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def hold(self):
+        # Keep the trace open past its block, e.g. until the first audio frame
+        self.pending += 1
+        return self.start
+
+    def release(self, name=None, start=None, **attrs):
+        if name is not None:
+            self.add(name, start, time.perf_counter(), attrs)
+        self.pending -= 1
+        if self.pending == 0 and self.end is not None:
+            self._finish()
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.end = time.perf_counter()
+        if self.pending == 0:
+            self._finish()
+        return False
+
+    def _finish(self):
+        if self.closed:
+            return
+        self.end = max(self.end, self.start + max((s[1] + s[2] for s in self.spans), default=0.0))
+        self.closed = True
+        self.tracer.record(self)
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'time': self.wall,
+            'duration': round(self.duration, 4),
+            'attrs': self.attrs,
+            'spans': [
+                {'name': name, 'offset': round(offset, 4), 'duration': round(duration, 4), 'attrs': attrs}
+                for name, offset, duration, attrs in self.spans
+            ],
+        }
+
+class Tracer:
+    def __init__(self, enabled, keep, export_path=None):
+        self.enabled = enabled
+        self.keep = keep
+        self.export_path = export_path
+        self.slowest = []  # min-heap of (duration, seq, trace dict)
+        self.seq = itertools.count()
+        self.recorded = 0
+        self.exporter = None
+
+    def trace(self, name, **attrs):
+        # A new trace, or a span of the current one when called inside a trace
+        if not self.enabled:
+            return NO_SPAN
+        parent = _current.get()
+        if parent is not None and not parent.closed:
+            return parent.span(name, **attrs)
+        return Trace(self, name, attrs)
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NO_SPAN
+        trace = _current.get()
+        if trace is None or trace.closed:
+            return NO_SPAN
+        return trace.span(name, **attrs)
+
+    def current(self):
+        if not self.enabled:
+            return None
+        trace = _current.get()
+        return trace if trace is not None and not trace.closed else None
+
+    def record(self, trace):
+        self.recorded += 1
+        data = trace.to_dict()
+        entry = (trace.duration, next(self.seq), data)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+        if self.export_path:
+            if self.exporter is None:
+                self.exporter = open(self.export_path, 'a', buffering=1)
+            self.exporter.write(json.dumps(data, separators=(',', ':'), default=str) + "\n")
+
+    def top(self, count):
+        return [data for _, _, data in sorted(self.slowest, reverse=True)[:count]]
+
+    def close(self):
+        if self.exporter:
+            self.exporter.close()
+            self.exporter = None
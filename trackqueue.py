@@ -0,0 +1,150 @@
+import itertools
+import random
+from collections import deque
+
+# ==================== TRACK QUEUE ====================
+# A deque of tracks with a cached total duration. Positional get, insert,
+# remove and move use the deque's own indexing, which walks at most half the
+# queue in C; for the few thousand tracks of a 24/7 queue that beats a balanced
+# tree walked in Python (bench/bench_queue.py).
+#
+# shuffle() is a lazy Fisher-Yates. It only records that the tracks from
+# `shuffled` up to `shuffle_end` are in random order; a position is settled by
+# one swap the first time something looks at it. Playback and the first pages
+# of !queue settle a handful of positions instead of the whole queue, and
+# removing an unsettled track draws it at random instead of settling the ones
+# in front of it.
+
+def _duration(track):
+    return track.get('duration') or 0
+
+class TrackQueue:
+    def __init__(self, tracks=()):
+        self.tracks = deque()
+        self._total = 0  # None after a drop, until the next read sums it again
+        self.shuffled = 0
+        self.shuffle_end = 0
+        self.extend(tracks)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def __iter__(self):
+        self._settle(len(self) - 1)
+        return iter(self.tracks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return self.page(start, stop - start)
+        index = self._index(index)
+        self._settle(index)
+        return self.tracks[index]
+
+    @property
+    def total_duration(self):
+        if self._total is None:
+            self._total = sum(map(_duration, self.tracks))
+        return self._total
+
+    def _count(self, value, sign):
+        if self._total is not None:
+            self._total += sign * _duration(value)
+
+    def _index(self, index):
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("queue index out of range")
+        return index
+
+    def _settle(self, index):
+        # Fisher-Yates, one position at a time: swap a random unsettled track into place
+        tracks = self.tracks
+        while self.shuffled <= index and self.shuffled < self.shuffle_end:
+            pick = random.randrange(self.shuffled, self.shuffle_end)
+            if pick != self.shuffled:
+                tracks[self.shuffled], tracks[pick] = tracks[pick], tracks[self.shuffled]
+            self.shuffled += 1
+
+    def page(self, start, count):
+        if count <= 0 or start >= len(self):
+            return []
+        self._settle(min(start + count, len(self)) - 1)
+        return list(itertools.islice(self.tracks, start, start + count))
+
+    def insert(self, index, value):
+        size = len(self)
+        index = max(0, min(size + index if index < 0 else index, size))
+        pending = self.shuffled < self.shuffle_end
+        if pending and self.shuffled <= index <= self.shuffle_end:
+            # Settle everything in front so the random region stays contiguous behind the new track
+            self._settle(index - 1)
+        self.tracks.insert(index, value)
+        self._count(value, 1)
+        if pending and index <= self.shuffle_end:
+            self.shuffled = max(self.shuffled, index) + 1
+            self.shuffle_end += 1
+
+    def append(self, value):
+        self.tracks.append(value)
+        self._count(value, 1)
+
+    def appendleft(self, value):
+        self.insert(0, value)
+
+    def extend(self, tracks):
+        for value in tracks:
+            self.append(value)
+
+    def pop(self, index=-1):
+        index = self._index(index)
+        tracks = self.tracks
+        if self.shuffled <= index < self.shuffle_end:
+            # Every unsettled track is equally likely to be here, so draw one
+            pick = random.randrange(self.shuffled, self.shuffle_end)
+            tracks[index], tracks[pick] = tracks[pick], tracks[index]
+        value = tracks[index]
+        del tracks[index]
+        self._count(value, -1)
+        if index < self.shuffled:
+            self.shuffled -= 1
+        if index < self.shuffle_end:
+            self.shuffle_end -= 1
+        return value
+
+    def popleft(self):
+        return self.pop(0)
+
+    def drop(self, count):
+        # Remove the first `count` tracks with one copy of the rest, done in C
+        count = max(0, min(count, len(self)))
+        self._settle(count - 1)
+        self.tracks = deque(itertools.islice(self.tracks, count, None))
+        self._total = None
+        self.shuffled = max(0, self.shuffled - count)
+        self.shuffle_end = max(0, self.shuffle_end - count)
+
+    def move(self, source, target):
+        # Take the track at `source` out and put it back so it ends up at `target`
+        source = self._index(source)
+        target = self._index(target)
+        value = self.pop(source)
+        self.insert(target, value)
+        return value
+
+    def shuffle(self):
+        self.shuffled = 0
+        self.shuffle_end = len(self)
+
+    def clear(self):
+        self.tracks.clear()
+        self._total = 0
+        self.shuffled = 0
+        self.shuffle_end = 0
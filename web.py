@@ -1,15 +1,39 @@
-from flask import Flask
-from threading import Thread
+import json
+from aiohttp import web
 
-app = Flask('')
+# ==================== WEB SERVER ====================
+# Runs on the bot's own event loop (aiohttp ships with discord.py), so there is
+# no extra thread. health() returns (ok, details); metrics() returns the
+# Prometheus text exposition.
 
-@app.route('/')
-def home():
-    return "Bot is alive!"
+class WebServer:
+    def __init__(self, health, metrics):
+        self.health = health
+        self.metrics = metrics
+        self.runner = None
+        self.app = web.Application()
+        self.app.router.add_get('/', self.home)
+        self.app.router.add_get('/healthz', self.healthz)
+        self.app.router.add_get('/metrics', self.metrics_page)
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+    async def start(self, host, port):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+    async def home(self, request):
+        return web.Response(text="Bot is alive!")
+
+    async def healthz(self, request):
+        ok, details = self.health()
+        return web.Response(
+            text=json.dumps(details), content_type='application/json', status=200 if ok else 503
+        )
+
+    async def metrics_page(self, request):
+        return web.Response(text=self.metrics(), content_type='text/plain')
+
+    async def close(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,194 @@
+import asyncio
+import multiprocessing
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# ==================== EXTRACTION BACKENDS ====================
+# yt-dlp parsing is CPU heavy. In "process" mode it runs in spawned worker
+# processes so it never competes with the voice/gateway threads for the GIL.
+
+class ExtractionError(Exception):
+    pass
+
+def _describe(error):
+    return f"{type(error).__name__}: {error}"
+
+def _worker_main(conn, initializer):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer:
+        initializer()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        func, args = job
+        try:
+            conn.send((True, func(*args)))
+        except Exception as e:
+            conn.send((False, _describe(e)))
+    conn.close()
+
+@contextmanager
+def _light_main():
+    # A spawned child imports the parent's __main__ before running its target, and for
+    # the bot that is main.py: database, storage client, Discord client and all. Point
+    # it at this module while the child starts, so a worker loads only what its jobs
+    # and initializer import (the extractor and yt-dlp).
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+class _Worker:
+    def __init__(self, mp_context, initializer):
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(target=_worker_main, args=(child_conn, initializer), daemon=True)
+        with _light_main():
+            self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def retire(self):
+        # Graceful exit once the current job is done
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.conn.close()
+
+    def kill(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join(1)
+
+def _thread_job(func, args):
+    # Same contract as a process worker: a failed job surfaces as ExtractionError
+    try:
+        return func(*args)
+    except Exception as e:
+        raise ExtractionError(_describe(e)) from e
+
+class ThreadBackend:
+    def __init__(self, size, timeout, initializer=None):
+        self.size = size
+        self.timeout = timeout
+        self.initializer = initializer
+        self.executor = None
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.size, thread_name_prefix="extract", initializer=self.initializer)
+
+    async def run(self, func, *args):
+        self.start()
+        loop = asyncio.get_running_loop()
+        # A timed-out thread cannot be interrupted; it finishes in the background
+        return await asyncio.wait_for(loop.run_in_executor(self.executor, _thread_job, func, args), self.timeout)
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+class ProcessBackend:
+    def __init__(self, size, timeout, max_jobs, initializer=None):
+        self.size = size
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.initializer = initializer
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.idle = None
+        self.workers = []
+        self.recycled = 0
+        self.killed = 0
+
+    def start(self):
+        if self.idle is not None:
+            return
+        self.idle = asyncio.Queue()
+        for _ in range(self.size):
+            self.idle.put_nowait(self._spawn())
+
+    def _spawn(self):
+        worker = _Worker(self.mp_context, self.initializer)
+        self.workers.append(worker)
+        return worker
+
+    def _discard(self, worker, graceful):
+        if worker in self.workers:
+            self.workers.remove(worker)
+        if graceful:
+            worker.retire()
+            self.recycled += 1
+        else:
+            worker.kill()
+            self.killed += 1
+        return self._spawn()
+
+    async def run(self, func, *args):
+        self.start()
+        worker = await self.idle.get()
+        try:
+            return await asyncio.wait_for(self._call(worker, func, args), self.timeout)
+        except ExtractionError:
+            raise
+        except (EOFError, ConnectionError) as e:
+            # The worker died mid-job (EOFError on read, BrokenPipeError on send): replace it
+            # and report the job as a failed extraction like any other. Not OSError: since
+            # Python 3.11 that also covers the TimeoutError of a job that ran too long.
+            worker = self._discard(worker, graceful=False)
+            raise ExtractionError(f"extraction worker crashed: {type(e).__name__}: {e}") from e
+        except BaseException:
+            # Timed out, cancelled or crashed: the worker may still be busy, so replace it
+            worker = self._discard(worker, graceful=False)
+            raise
+        finally:
+            if self.idle is None:
+                worker.kill()
+            else:
+                if worker.jobs >= self.max_jobs:
+                    worker = self._discard(worker, graceful=True)
+                self.idle.put_nowait(worker)
+
+    async def _call(self, worker, func, args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        fd = worker.conn.fileno()
+
+        def on_readable():
+            loop.remove_reader(fd)
+            if future.done():
+                return
+            try:
+                future.set_result(worker.conn.recv())
+            except Exception as e:
+                future.set_exception(e)
+
+        worker.conn.send((func, args))
+        loop.add_reader(fd, on_readable)
+        try:
+            ok, value = await future
+        finally:
+            loop.remove_reader(fd)
+        worker.jobs += 1
+        if not ok:
+            raise ExtractionError(value)
+        return value
+
+    def close(self):
+        for worker in self.workers:
+            worker.kill()
+        self.workers = []
+        self.idle = None
+
+def create_backend(mode, size, timeout, max_jobs, initializer=None):
+    if mode == "process":
+        return ProcessBackend(size, timeout, max_jobs, initializer)
+    return ThreadBackend(size, timeout, initializer)